@@ -3,6 +3,8 @@
 Example:
     import jldap.LDAP
     ldap_conn = jldap.LDAP(fqdn, user=user, password=password)
+    with jldap.LDAP.LDAP(fqdn, user=user, password=password) as ldap_conn:
+        ldap_conn.user_search(uid) # binds once, unbinds on exit
 
 
 Attributes:
@@ -10,14 +12,24 @@ Attributes:
 	USERS (str): Users dn
 	PURGATORY (str): Purgatory (not-yet-enabled) users dn
 	DISABLED (str): Disabled users dn
+	IDLE_CHECK (int): Seconds a connection may sit unused before it is
+            health-checked (and rebound if need be) on next use
+	PAGE_SIZE (int): Default number of entries per page for paged searches
+	WRITES (tuple): Connection methods which change the directory, and so
+            invalidate cached searches
 
 Todo:
     * Re-evaluate/test enforce_attribute
 """
 import functools
+from collections import OrderedDict
+import time
 import ldap
+import ldap.controls
+import ldap.filter
 import ldap.modlist
 import jldap.config
+import jldap.groups
 import jldap.attdict
 import jldap.userdict
 import jldap.profile
@@ -27,26 +39,91 @@ USERS = 'ou=users,%s' % BASE
 PURGATORY = 'ou=user-purgatory,%s' % BASE
 DISABLED = 'ou=user-disabled,%s' % BASE
 
+IDLE_CHECK = 300
+PAGE_SIZE = 500
+WRITES = ('add_s', 'modify_s', 'rename_s', 'modrdn_s', 'delete_s')
+
 LDAP_MAP = {'samba-group-sid': 'sambaPrimaryGroupSID',
             'primary-gid-number': 'gidNumber',
             'employeeType': 'employeeType'}
 
 def connect(func):
     ''' Decorator for connecting to ldap "automatically"
+        The connection is opened and bound on first use and then reused by
+        every decorated method; it is only re-checked after sitting idle.
     '''
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         ''' The wrapper for the decorator
         '''
-        prot = 'ldap://' if not self.secure else 'ldaps://'
-        self.conn = ldap.initialize(prot+self.host)
-        # pylint: disable=no-member
-        # ldap.OPT_REFERRALS is totally a thing
-        self.conn.set_option(ldap.OPT_REFERRALS, 0)
-        self.conn.simple_bind_s(self.user or '', self.password or '')
+        if self.conn is None:
+            self.open()
+        elif (time.time() - self._last_used > IDLE_CHECK
+              and not self.healthy()):
+            self.open()
         return func(self, *args, **kwargs)
     return wrapper
 
+def profile_modlists(user, memberships, profile, jira=None):
+    ''' Work out what it takes to bring a user, and every group it is or
+        should be in, in line with a profile, without touching the directory.
+        user is the user's entry (an Attdict), memberships its current
+        direct groups as returned by LDAP.memberships.
+        Returns an ordered list of (dn, modlist): the user entry first, with
+        a MOD_REPLACE per attribute which differs, then one entry per group
+        to change, adding or deleting only the user's own memberUid and/or
+        uniqueMember values.
+    '''
+    # pylint: disable=no-member
+    changes = []
+    samba_sid_base = '-'.join([i for i in user
+                               .sambaPrimaryGroupSID[0]
+                               .split('-')][:-1])
+    wanted = [('remoteAccess', 'TRUE'),
+              ('sambaPrimaryGroupSID',
+               '%s-%s' % (samba_sid_base, profile.samba_group_sid)),
+              ('gidNumber', profile.primary_gid_number),
+              ('employeeType', 'LDAP Profile: %s' % profile.name)]
+    if jira: # required for enablement
+        wanted.append(('description', ' '.join([user.description[0], jira])))
+    modlist = [(ldap.MOD_REPLACE, attr, [val]) for attr, val in wanted
+               if user.get(attr) != [val]]
+    if modlist:
+        changes.append((user.dn, modlist))
+    targets = OrderedDict()
+    for attrs, group_dns in [(('uniqueMember', 'memberUid'), profile.posix_group),
+                             (('uniqueMember',), profile.group_of_unique_names),
+                             (('memberUid',), profile.samba_group_mapping)]:
+        for group in group_dns:
+            key = jldap.groups.normalize(group)
+            targets.setdefault(key, (group, set()))[1].update(attrs)
+    for key in sorted(memberships):
+        targets.setdefault(key, (memberships[key][0], set()))
+    values = {'uniqueMember': user.dn, 'memberUid': user.uid[0]}
+    for key, (group, want) in targets.items():
+        have = memberships.get(key, (group, set()))[1]
+        modlist = ([(ldap.MOD_ADD, attr, [values[attr]])
+                    for attr in sorted(want - have)] +
+                   [(ldap.MOD_DELETE, attr, [values[attr]])
+                    for attr in sorted(have - want)])
+        if modlist:
+            changes.append((group, modlist))
+    return changes
+
+def written(method, dn, *args, **kwargs):
+    ''' The dns a write through the named connection method touches: the
+        target, and for renames the entry's new dn as well
+    '''
+    if method not in ('rename_s', 'modrdn_s'):
+        return [dn]
+    newrdn = kwargs.get('newrdn', args[0] if args else None)
+    newsuperior = kwargs.get('newsuperior')
+    if method == 'rename_s' and len(args) > 1:
+        newsuperior = args[1]
+    if newsuperior is None:
+        newsuperior = dn.split(',', 1)[1] if ',' in dn else ''
+    return [dn, '%s,%s' % (newrdn, newsuperior) if newsuperior else newrdn]
+
 class LDAP(object):
     ''' Class for connecting to LDAP and making queries '''
     @classmethod
@@ -64,7 +141,8 @@ class LDAP(object):
                              password=config.password)
             yield ldap_conn
 
-    def __init__(self, host, secure=False, basedn=BASE, user=None, password=None):
+    def __init__(self, host, secure=False, basedn=BASE, user=None, password=None,
+                 cache=None):
         # pylint: disable=too-many-arguments
         # I need these shits
         self._host = host
@@ -72,7 +150,13 @@ class LDAP(object):
         self._basedn = basedn
         self._user = user
         self._password = password
+        self._cache = cache
         self._conn = None
+        self._last_used = 0
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
     @property
     def host(self):
         ''' The host to connect to
@@ -114,6 +198,16 @@ class LDAP(object):
         '''
         self._password = pwrd
     @property
+    def cache(self):
+        ''' The jldap.cache.SearchCache searches are read through, if any
+        '''
+        return self._cache
+    @cache.setter
+    def cache(self, cache):
+        ''' Change/drop the search cache
+        '''
+        self._cache = cache
+    @property
     def conn(self):
         ''' The ldap connection
         '''
@@ -123,10 +217,78 @@ class LDAP(object):
         ''' Change/update the ldap connection
         '''
         self._conn = cnxn
+    def open(self):
+        ''' Open and bind a connection to the host, replacing (and unbinding)
+            any connection already held
+        '''
+        self.close()
+        prot = 'ldap://' if not self.secure else 'ldaps://'
+        conn = ldap.initialize(prot+self.host)
+        # pylint: disable=no-member
+        # ldap.OPT_REFERRALS is totally a thing
+        conn.set_option(ldap.OPT_REFERRALS, 0)
+        conn.simple_bind_s(self.user or '', self.password or '')
+        self._conn = conn
+        self._last_used = time.time()
+        return conn
+    def close(self):
+        ''' Unbind and drop the connection, if there is one
+        '''
+        if self._conn is None:
+            return
+        try:
+            self._conn.unbind_s()
+        # pylint: disable=no-member
+        except ldap.LDAPError:
+            pass # going away regardless
+        self._conn = None
+    def healthy(self):
+        ''' Whether the held connection is still bound and answering
+        '''
+        if self._conn is None:
+            return False
+        try:
+            self._conn.whoami_s()
+        # pylint: disable=no-member
+        except ldap.LDAPError:
+            return False
+        self._last_used = time.time()
+        return True
+    def _do(self, method, *args, **kwargs):
+        ''' Call method on the held connection, rebinding and retrying once
+            if the server dropped us in the meantime
+        '''
+        if self._conn is None:
+            self.open()
+        try:
+            try:
+                result = getattr(self._conn, method)(*args, **kwargs)
+            # pylint: disable=no-member
+            except ldap.SERVER_DOWN:
+                self.open()
+                result = getattr(self._conn, method)(*args, **kwargs)
+        finally:
+            # even a failed write may have gone through
+            if self._cache is not None and method in WRITES:
+                self._cache.invalidate(*written(method, *args, **kwargs))
+        self._last_used = time.time()
+        return result
     @connect
-    def search(self, basedn=None, filterstr=None, attrlist=None):
+    def search(self, basedn=None, filterstr=None, attrlist=None,
+               page_size=None, limit=None):
         ''' Perform an LDAP search, generating results
+            Given page_size or limit, the search is paged (see paged_search)
+            rather than fetched whole
         '''
+        # pylint: disable=too-many-arguments
+        if page_size or limit:
+            for res in self.paged_search(basedn=basedn,
+                                         filterstr=filterstr,
+                                         attrlist=attrlist,
+                                         page_size=page_size or PAGE_SIZE,
+                                         limit=limit):
+                yield res
+            return
         base = basedn if basedn else self._basedn
         # pylint: disable=no-member
         # ldap.SCOPE_SUBTREE is totally a thing
@@ -135,11 +297,85 @@ class LDAP(object):
         kwargs = {'attrlist': (attrlist if attrlist else [])}
         if filterstr:
             kwargs.update({'filterstr': filterstr})
-        result = self._conn.search_s(*args, **kwargs)
+        key = (base, scope, filterstr, tuple(kwargs['attrlist']))
+        result = self._cache.get(key) if self._cache is not None else None
+        if result is None:
+            result = self._do('search_s', *args, **kwargs)
+            if self._cache is not None:
+                self._cache.put(base, key, result)
         for res in result:
             res[1].update({'dn': res[0]})
             yield jldap.attdict.Attdict(res[1])
     @connect
+    def paged_search(self, basedn=None, filterstr=None, attrlist=None,
+                     page_size=PAGE_SIZE, limit=None):
+        ''' Perform an LDAP search using the Simple Paged Results control,
+            generating results as each page of page_size entries arrives, so
+            that arbitrarily large subtrees fit in bounded memory and under
+            server size limits. Stops after limit results, if given.
+            Stopping early (or closing the generator) ends the search on the
+            server. The search stays on the connection it started on; if the
+            connection is replaced while it runs, RuntimeError is raised.
+        '''
+        # pylint: disable=too-many-arguments
+        base = basedn if basedn else self._basedn
+        control = ldap.controls.SimplePagedResultsControl(True,
+                                                          size=page_size,
+                                                          cookie='')
+        # pylint: disable=no-member
+        args = [base,
+                ldap.SCOPE_SUBTREE,
+                filterstr if filterstr else '(objectClass=*)',
+                attrlist if attrlist else []]
+        # only the first page may be retried on a fresh connection; the
+        # paging cookie belongs to the connection that issued it
+        msgid = self._do('search_ext', *args, serverctrls=[control])
+        conn = self._conn
+        cookie = None # set while the server holds more pages for us
+        count = 0
+        try:
+            while True:
+                _, data, _, serverctrls = conn.result3(msgid)
+                msgid = None
+                self._last_used = time.time()
+                cookies = [i.cookie for i in serverctrls
+                           if i.controlType == control.controlType]
+                cookie = cookies[0] if cookies and cookies[0] else None
+                for dn, attrs in data:
+                    if dn is None: # search continuation (referral)
+                        continue
+                    attrs.update({'dn': dn})
+                    yield jldap.attdict.Attdict(attrs)
+                    count += 1
+                    if limit and count >= limit:
+                        return
+                if not cookie:
+                    return
+                if self._conn is not conn:
+                    raise RuntimeError('Paged search on %s was cut off: the '
+                                       'connection was replaced mid-search'
+                                       % self.host)
+                control.cookie = cookie
+                msgid = conn.search_ext(*args, serverctrls=[control])
+        finally:
+            self._end_paged_search(conn, args, msgid, cookie)
+    def _end_paged_search(self, conn, args, msgid, cookie):
+        ''' Release what the server holds for a paged search stopped early:
+            abandon an unanswered request, or send the last cookie back
+            asking for no more entries
+        '''
+        try:
+            if msgid is not None:
+                conn.abandon(msgid)
+            elif cookie:
+                done = ldap.controls.SimplePagedResultsControl(True,
+                                                               size=0,
+                                                               cookie=cookie)
+                conn.result3(conn.search_ext(*args, serverctrls=[done]))
+        # pylint: disable=no-member
+        except ldap.LDAPError:
+            pass # the server gives up on it with the connection regardless
+    @connect
     def get_user(self, user, basedn=None, filterfield='uid'):
         ''' Searches for a user and returns the LDAP """object"""
             which is just a dict in our case
@@ -152,9 +388,18 @@ class LDAP(object):
         ''' Searches for a user and returns the LDAP """object"""
             which is just a dict in our case
         '''
+        return [i for i in self.iter_uids()]
+    @connect
+    def iter_uids(self, page_size=PAGE_SIZE):
+        ''' Generate the uid of every user, a page at a time
+        '''
         basedn = USERS
         filterstr = '(&(objectClass=person)(uid=*))'
-        return [i.uid[0] for i in self.search(basedn=basedn, filterstr=filterstr)]
+        for i in self.paged_search(basedn=basedn,
+                                   filterstr=filterstr,
+                                   attrlist=['uid'],
+                                   page_size=page_size):
+            yield i.uid[0]
     @connect
     def move_user(self, uid, dest_ou, src_ou=None):
         ''' Convenience method, finds a uid in a source ou (like
@@ -163,15 +408,17 @@ class LDAP(object):
         obj = self.get_user(uid, basedn=src_ou)
         if obj is None:
             return None
-        self._conn.rename_s(obj.dn,
-                            'uid=%s' % obj.uid[0],
-                            newsuperior=dest_ou)
+        self._do('rename_s',
+                 obj.dn,
+                 'uid=%s' % obj.uid[0],
+                 newsuperior=dest_ou)
         return self.get_user(uid, basedn=dest_ou)
     @connect
     def user_search(self, user):
         ''' Convenience method, searches for a user's groups, unique-member
             groups, and checks to see if the user is in user-purgatory (not yet
-            activated)
+            activated). Inherited groups are resolved a hierarchy level at a
+            time for all direct groups together (see jldap.groups).
         '''
         attrs = ['dn']
         searches = {'memberUid':
@@ -187,18 +434,16 @@ class LDAP(object):
                          'filterstr': '(uniqueMember=uid=%s,%s)' % (user, USERS),
                          'attrlist': attrs},
                    }
-        results = jldap.userdict.Userdict(name=user)
+        direct = {}
         for key, search in searches.items():
-            result = self.search(**search)
-            tmplist = []
-            for i in result:
-                tmplist.append(i.dn)
-                recursive_memberships = self._recurse_groups(i.dn)
-                if recursive_memberships:
-                    tmplist.append(recursive_memberships)
-            results[key] = tmplist # must use assignment to trigger
-                                   # userdict.__setitem__ -> set userdict.found
-                                   # to True
+            direct[key] = [i.dn for i in self.search(**search)]
+        resolver = jldap.groups.GroupResolver(self)
+        parents = resolver.parents([i for dns in direct.values() for i in dns])
+        results = jldap.userdict.Userdict(name=user)
+        for key, dns in direct.items():
+            # must use assignment to trigger userdict.__setitem__ -> set
+            # userdict.found to True
+            results[key] = jldap.groups.nest(dns, parents)
         return results
     @connect
     def cn_search(self, common_name):
@@ -214,19 +459,6 @@ class LDAP(object):
         except StopIteration:
             return jldap.userdict.Userdict()
     @connect
-    def _recurse_groups(self, group_dn):
-        ''' Method for recursively assembling group memberships
-            Intended only for use in self.user_search
-            Argument: group_dn should be an LDAP distinguished name (string)
-        '''
-        retlist = []
-        for result in self.search(filterstr='(uniqueMember=%s)' % group_dn):
-            retlist.append(result.dn)
-            recurse_list = self._recurse_groups(result.dn)
-            if recurse_list:
-                retlist.append(recurse_list)
-        return retlist
-    @connect
     def add_object(self, obj, ignore_attrs=None):
         ''' Insert an LDAP-formatted object into a tree
             Likely from another LDAP tree
@@ -234,9 +466,24 @@ class LDAP(object):
         ignore_attrs = ignore_attrs if ignore_attrs else []
         attrs = {i:j for i, j in obj.items() if i not in ignore_attrs}
         ldif = ldap.modlist.addModlist(attrs)
-        self._conn.add_s(obj.dn, ldif)
+        self._do('add_s', obj.dn, ldif)
         return [i for i in self.search(basedn=obj.dn)]
     @connect
+    def add_entry(self, dn, attrs):
+        ''' Write-only add of an entry from attribute:values, no read back
+        '''
+        self._do('add_s', dn, ldap.modlist.addModlist(attrs))
+    @connect
+    def rename(self, dn, newrdn, newsuperior=None):
+        ''' Write-only rename/move of an entry, no read back
+        '''
+        self._do('rename_s', dn, newrdn, newsuperior=newsuperior)
+    @connect
+    def modify(self, dn, modlist):
+        ''' Write-only modify of an entry, no read back
+        '''
+        self._do('modify_s', dn, modlist)
+    @connect
     def enforce_attribute(self, attr, obj, val, replace=False):
         ''' Make sure an attribute for an object has a value. Optionally make
             the value the ONLY value for that attribute.
@@ -258,7 +505,7 @@ class LDAP(object):
             print 'No changes to attribute %s' % attr
             return []
         try:
-            self._conn.modify_s(obj.dn, ldif)
+            self._do('modify_s', obj.dn, ldif)
         # pylint: disable=no-member
         except ldap.OBJECT_CLASS_VIOLATION as err:
             print 'Just fyi: %s' % str(err)
@@ -271,22 +518,46 @@ class LDAP(object):
         '''
         return self.enforce_attribute(attr, obj, val, replace=True)
     @connect
+    def add_values(self, obj, values):
+        ''' Add values to an object's attributes in a single modify, leaving
+            the values already there alone. obj is an entry or a dn, values
+            is attribute:list of values. Returns the modlist sent, if any.
+        '''
+        # pylint: disable=no-member
+        return self._modify_values(obj, values, ldap.MOD_ADD)
+    @connect
+    def remove_values(self, obj, values):
+        ''' Delete just the given values from an object's attributes in a
+            single modify; matching is done by the server, using each
+            attribute's own rules (e.g. case-insensitive for dns).
+            obj is an entry or a dn, values is attribute:list of values.
+            Returns the modlist sent, if any.
+        '''
+        # pylint: disable=no-member
+        return self._modify_values(obj, values, ldap.MOD_DELETE)
+    def _modify_values(self, obj, values, operation):
+        ''' Shared body of add_values and remove_values
+        '''
+        dn = obj if isinstance(obj, basestring) else obj.dn
+        modlist = [(operation, attr, list(vals))
+                   for attr, vals in sorted(values.items()) if vals]
+        if modlist:
+            self._do('modify_s', dn, modlist)
+        return modlist
+    @connect
     def degroup_user(self, username):
         ''' Convenience method. Remove username from all groups by both
-            memberUid and uniqueMember
+            memberUid and uniqueMember, with one modify per group deleting
+            only the user's own values; member lists are never read or
+            written back whole.
         '''
         user = self.search(basedn=USERS, filterstr='(uid=%s)' % username)
         user = user.next()
-        searches = {'memberUid': user.uid[0],
-                    'uniqueMember': user.dn}
-        for attr, user_attr in searches.items():
-            group_objs = self.search(basedn=BASE,
-                                     filterstr='(%s=%s)' % (attr, user_attr),
-                                     attrlist=['dn', 'cn', attr])
-            for group_obj in group_objs:
-                members = ([i for i in group_obj[attr]
-                            if i.lower() != user_attr.lower()])
-                self.replace_attribute(attr, group_obj, members)
+        values = {'memberUid': user.uid[0],
+                  'uniqueMember': user.dn}
+        for group, attrs in self.memberships(user).values():
+            self.remove_values(group, dict((attr, [values[attr]])
+                                           for attr in attrs))
     @connect
     def disable_user(self, username):
         ''' Convenience method, degroups user and moves it to purgatory
@@ -299,10 +570,29 @@ class LDAP(object):
             print ("User %s not found in LDAP tree on host %s"
                    % (username, self.host))
     @connect
-    def enforce_profile(self, username, profile, jira=None):
+    def memberships(self, user):
+        ''' Groups holding a user entry directly, as normalised dn:(dn, set of
+            attributes -- memberUid and/or uniqueMember -- holding it).
+            Only dns are fetched, never the groups' member lists.
+        '''
+        searches = {'memberUid': user.uid[0],
+                    'uniqueMember': user.dn}
+        found = {}
+        for attr, value in searches.items():
+            filterstr = '(%s=%s)' % (attr, ldap.filter.escape_filter_chars(value))
+            for group in self.search(filterstr=filterstr, attrlist=['dn']):
+                key = jldap.groups.normalize(group.dn)
+                found.setdefault(key, (group.dn, set()))[1].add(attr)
+        return found
+    @connect
+    def enforce_profile(self, username, profile, jira=None, reread=False):
         ''' Convenience method, unfortunately somewhat hardcoded and specific
             against current format of profile yaml.
             Username is a string, profile is a jldap.profile.Profile()
+            Works out every change up front (see profile_modlists) and issues
+            exactly one modify per entry which needs changing. Returns the
+            (dn, modlist) changes made or, with reread, the changed entries
+            as they now stand.
         '''
         try:
             assert isinstance(profile, jldap.profile.Profile)
@@ -310,33 +600,27 @@ class LDAP(object):
             raise TypeError('Argument "profile" must be of type %s' %
                             jldap.profile.Profile)
         try:
-            self.degroup_user(username)
-        except StopIteration: # degroup_user calls search which may fail to
-                              # yield users
+            user = self.search(basedn=USERS,
+                               filterstr='(uid=%s)' % username).next()
+        except StopIteration: # search may fail to yield users
             print ("User %s not found in LDAP tree on host %s"
                    % (username, self.host))
-        user = self.search(basedn=USERS, filterstr='(uid=%s)' % username)
-        user = user.next()
-        samba_sid_base = '-'.join([i for i in user
-                                   .sambaPrimaryGroupSID[0]
-                                   .split('-')][:-1])
-        samba_sid = '%s-%s' % (samba_sid_base, profile.samba_group_sid)
-        self.replace_attribute('remoteAccess', user, 'TRUE')
-        self.replace_attribute('sambaPrimaryGroupSID', user, samba_sid)
-        self.replace_attribute('gidNumber', user, profile.primary_gid_number)
-        self.replace_attribute('employeeType',
-                               user,
-                               'LDAP Profile: %s' % profile.name)
-        if jira: # required for enablement
-            new_desc = ' '.join([user.description[0], jira])
-            self.replace_attribute('description', user, new_desc)
-        for group in profile.posix_group:
-            group_obj = self.search(basedn=group).next()
-            self.enforce_attribute('uniqueMember', group_obj, user.dn)
-            self.enforce_attribute('memberUid', group_obj, user.uid[0])
-        for group in profile.group_of_unique_names:
-            group_obj = self.search(basedn=group).next()
-            self.enforce_attribute('uniqueMember', group_obj, user.dn)
-        for group in profile.samba_group_mapping:
-            group_obj = self.search(basedn=group).next()
-            self.enforce_attribute('memberUid', group_obj, user.uid[0])
+            raise
+        changes = profile_modlists(user, self.memberships(user), profile, jira)
+        for dn, modlist in changes:
+            try:
+                self._do('modify_s', dn, modlist)
+            # pylint: disable=no-member
+            except ldap.OBJECT_CLASS_VIOLATION:
+                if dn != user.dn:
+                    raise
+                # apply what the user's object classes do allow, one
+                # attribute at a time
+                for mod in modlist:
+                    try:
+                        self._do('modify_s', dn, [mod])
+                    except ldap.OBJECT_CLASS_VIOLATION as err:
+                        print 'Just fyi: %s' % str(err)
+        if reread:
+            return [self.search(basedn=dn).next() for dn, _ in changes]
+        return changes
@@ -1 +1 @@
-__all__ = ['config', 'LDAP', 'attdict', 'profile', 'userdict']
+__all__ = ['config', 'LDAP', 'attdict', 'profile', 'userdict', 'pool']
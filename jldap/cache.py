@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""cache module
+Read-through cache of LDAP search results
+
+Example:
+    import jldap.LDAP
+    import jldap.cache
+    ldap_conn = jldap.LDAP.LDAP(fqdn, cache=jldap.cache.SearchCache())
+    ldap_conn.get_user(uid) # asks the server
+    ldap_conn.get_user(uid) # doesn't
+
+Results are kept per (basedn, scope, filter, attrlist), least recently used
+first out once there are more than max_entries of them, and expire ttl
+seconds after they were fetched. Writing to a dn drops every cached search
+whose subtree holds it, or which was rooted at or below it.
+
+Attributes:
+	TTL (int): Default seconds a result stays cached
+	MAX_ENTRIES (int): Default number of results kept
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+import jldap.groups
+
+TTL = 300
+MAX_ENTRIES = 1024
+
+def related(first, second):
+    ''' Whether one (normalized) dn is the other or lies beneath it
+    '''
+    return (first == second
+            or first.endswith(',' + second)
+            or second.endswith(',' + first))
+
+class SearchCache(object):
+    ''' LRU of search results with a per-entry time to live, safe to share
+        between threads
+    '''
+    def __init__(self, ttl=TTL, max_entries=MAX_ENTRIES, clock=time.time):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict() # key: (expiry, normalized base, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self._entries)
+    @property
+    def ttl(self):
+        ''' Seconds a result stays cached
+        '''
+        return self._ttl
+    @property
+    def max_entries(self):
+        ''' Number of results kept
+        '''
+        return self._max_entries
+    def get(self, key):
+        ''' A copy of the result cached under key, None if there is none or
+            it has expired
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] <= self._clock():
+                self.misses += 1
+                return None
+            self._entries[key] = entry # most recently used goes last
+            self.hits += 1
+            return copy.deepcopy(entry[2])
+    def put(self, base, key, result):
+        ''' Cache (a copy of) the result of a search rooted at base
+        '''
+        entry = (self._clock() + self._ttl,
+                 jldap.groups.normalize(base),
+                 copy.deepcopy(result))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+    def invalidate(self, *dns):
+        ''' Drop every result a write to any of dns could have changed
+        '''
+        dns = [jldap.groups.normalize(i) for i in dns if i]
+        with self._lock:
+            for key, entry in self._entries.items():
+                if any(related(entry[1], i) for i in dns):
+                    del self._entries[key]
+    def clear(self):
+        ''' Drop everything
+        '''
+        with self._lock:
+            self._entries.clear()
+    def stats(self):
+        ''' Hits, misses and current size
+        '''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries)}
@@ -6,10 +6,14 @@ Example:
     import jldap.config
     conf = jldap.config.Config(path)
 
-
+Attributes:
+	STATE_DIR (str): Directory for state and caches kept between runs
 """
 import functools
-import yaml
+import os
+import jldap.yamlio
+
+STATE_DIR = os.path.expanduser('~/.juser')
 
 def obtain(func):
     ''' Decorator to make sure configs are obtained upon use
@@ -92,7 +96,7 @@ class Config(object):
         '''
         try:
             with open(self._configfile, 'r') as yml:
-                yml_opts = yaml.load(yml)
+                yml_opts = jldap.yamlio.load(yml)
             self._user = yml_opts['user']
             self._password = yml_opts['password']
             self._basedn = yml_opts['basedn']
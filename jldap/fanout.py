@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""fanout module
+Run the same piece of LDAP work against several environments at once
+
+Example:
+    import jldap.fanout
+    report = jldap.fanout.fan_out(lambda conn: conn.user_search(uid),
+                                  {'qa': qa_conn, 'jcint': jcint_conn})
+    for env, outcome in report.items():
+        print env, outcome.host, outcome.result, outcome.error
+
+    pool = jldap.pool.Pool.from_config(config)
+    report = jldap.fanout.fan_out(lambda conn: conn.user_search(uid), pool)
+
+conns is either env:connection or a jldap.pool.Pool; with a pool, each piece
+of work checks a connection out for its environment and back in when done.
+
+Attributes:
+	TIMEOUT (int): Default number of seconds to wait on any one host
+"""
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+import ldap
+import jldap.pool
+from jldap.attdict import Attdict
+
+TIMEOUT = 300
+
+class Report(OrderedDict):
+    ''' Outcome of a fan-out, env:Attdict(host, result, error, elapsed) in
+        the order the environments were given
+    '''
+    @property
+    def errors(self):
+        ''' env:error for every environment which failed or timed out
+        '''
+        return OrderedDict((env, outcome.error)
+                           for env, outcome in self.items()
+                           if outcome.error)
+    def dict(self):
+        ''' Plain dict version of the report, e.g. for yaml.dump
+        '''
+        return dict((env, dict(outcome)) for env, outcome in self.items())
+
+def environments(conns):
+    ''' The environments of conns, in order
+    '''
+    if isinstance(conns, jldap.pool.Pool):
+        return sorted(conns.environments)
+    return list(conns)
+
+def host(conns, env):
+    ''' The host an environment of conns points at
+    '''
+    if isinstance(conns, jldap.pool.Pool):
+        return conns.host(env)
+    return conns[env].host
+
+@contextlib.contextmanager
+def connection(conns, env):
+    ''' A connection to env, checked out of conns (and back in) if it is a
+        pool
+    '''
+    if isinstance(conns, jldap.pool.Pool):
+        with conns.connection(env) as conn:
+            yield conn
+    else:
+        yield conns[env]
+
+def fan_out(func, conns, timeout=TIMEOUT, envs=None):
+    ''' Call func(conn) for every environment in conns (or just envs), each
+        in its own thread, and wait up to timeout seconds for each host to
+        answer. func may also be env:func, for different work per
+        environment.
+        Exceptions are caught and reported per environment rather than
+        raised. A host which doesn't finish in time is reported as timed
+        out, and whatever its thread goes on to do is left out of the
+        report. Its connection is not used again: a pooled one goes back in
+        as broken once the thread is done, and one from an env:conn mapping
+        is dropped from conns and closed once the thread is done.
+    '''
+    tasks = [_Task(func[env] if isinstance(func, dict) else func,
+                   conns,
+                   env,
+                   timeout)
+             for env in (environments(conns) if envs is None else envs)]
+    report = Report()
+    for task in tasks:
+        report[task.env] = task.wait()
+        if (report[task.env] is not task.outcome
+                and not isinstance(conns, jldap.pool.Pool)):
+            del conns[task.env]
+    return report
+
+def call(func, conn):
+    ''' Call func(conn) right here, reporting the outcome the way fan_out
+        does for each environment
+    '''
+    outcome = Attdict(host=conn.host, result=None, error=None, elapsed=None)
+    _call(func, conn, outcome)
+    return outcome
+
+class _Task(object):
+    ''' One environment's share of a fan-out. Its thread records into an
+        outcome of its own, which only makes it into the report if the
+        thread finishes before its deadline.
+    '''
+    def __init__(self, func, conns, env, timeout):
+        self.env = env
+        self.outcome = Attdict(host=host(conns, env),
+                               result=None,
+                               error=None,
+                               elapsed=None)
+        self._func = func
+        self._conns = conns
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._state = 'running' # then finished or abandoned, whichever first
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._deadline = time.time() + timeout
+        self._thread.start()
+    def _settle(self, state):
+        ''' Leave the running state for state, unless it has been left
+            already. Returns the state settled on.
+        '''
+        with self._lock:
+            if self._state == 'running':
+                self._state = state
+            return self._state
+    def _abandoned(self):
+        ''' Whether the fan-out has given up on the thread
+        '''
+        with self._lock:
+            return self._state == 'abandoned'
+    def _run(self):
+        ''' Thread target
+        '''
+        pooled = isinstance(self._conns, jldap.pool.Pool)
+        try:
+            conn = (self._conns.checkout(self.env)
+                    if pooled
+                    else self._conns[self.env])
+        # pylint: disable=broad-except
+        except Exception as err:
+            self.outcome.error = '%s: %s' % (type(err).__name__, err)
+            self._settle('finished')
+            return
+        if pooled and self._abandoned():
+            # checked out too late to be of any use
+            self._conns.checkin(conn)
+            return
+        error = _call(self._func, conn, self.outcome)
+        abandoned = self._settle('finished') == 'abandoned'
+        if pooled:
+            # pylint: disable=no-member
+            self._conns.checkin(conn,
+                                broken=(abandoned
+                                        or isinstance(error, ldap.LDAPError)))
+        elif abandoned:
+            conn.close()
+    def wait(self):
+        ''' Wait for the thread until the deadline. Returns its outcome if it
+            finished, otherwise a timed out one.
+        '''
+        self._thread.join(max(self._deadline - time.time(), 0))
+        if self._settle('abandoned') == 'finished':
+            return self.outcome
+        return Attdict(host=self.outcome.host,
+                       result=None,
+                       error='Timed out after %ss' % self._timeout,
+                       elapsed=None)
+
+def _call(func, conn, outcome):
+    ''' Record the result (or error) of func(conn) in outcome.
+        Returns the exception func raised, if any.
+    '''
+    start = time.time()
+    error = None
+    try:
+        outcome.result = func(conn)
+    # pylint: disable=broad-except
+    # whatever went wrong belongs in the report, not a dead thread
+    except Exception as err:
+        outcome.error = '%s: %s' % (type(err).__name__, err)
+        error = err
+    outcome.elapsed = round(time.time() - start, 3)
+    return error
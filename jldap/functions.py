@@ -16,9 +16,14 @@ Attributes:
 
 import re
 import os
+import sys
+import csv
+import json
 from collections import defaultdict
-import yaml
-from jldap import config, LDAP, profile
+from StringIO import StringIO
+from jldap import config, LDAP, profile, groups, fanout, plan, matching
+from jldap import workers, incremental, yamlio, mirror, pool
+from jldap.report import write_audits
 
 LDAP_USER = os.environ.get('LDAP_USER')
 LDAP_PASS = os.environ.get('LDAP_PASS')
@@ -38,12 +43,43 @@ def ldap_creds(configs):
     ldap_password = configs.password if configs.password else LDAP_PASS
     return ldap_user, ldap_password
 
+def open_mirror(args, configs):
+    ''' The mirror of args.environment, exiting if it has never been synced
+    '''
+    host = configs.environments[args.environment]
+    the_mirror = mirror.Mirror.for_host(host, path=args.mirror)
+    if the_mirror.synced is None:
+        the_mirror.close()
+        sys.exit('No mirror of %s at %s; run "sync" first'
+                 % (host, the_mirror.path))
+    return the_mirror
+
+def sync(args):
+    ''' Mirror the users and groups of an environment to disk for offline
+        use, fetching only what changed since the last sync
+    '''
+    configs = config.Config(args.config)
+    ldap_user, ldap_password = ldap_creds(configs)
+    host = configs.environments[args.environment]
+    with LDAP.LDAP(host,
+                   user=ldap_user,
+                   password=ldap_password,
+                   basedn=configs.basedn) as ldap_conn:
+        with mirror.Mirror.for_host(host, path=args.mirror) as the_mirror:
+            stats = the_mirror.sync(ldap_conn, full=args.full)
+            print 'Synced %s to %s' % (host, the_mirror.path)
+            print yamlio.dump(stats)
+
 def usersearch(args):
     """ Perform a user search against LDAP
     """
     configs = config.Config(args.config)
     results = {}
-    for ldap_conn in LDAP.LDAP.from_config(configs, env=args.environment):
+    if args.offline:
+        sources = [open_mirror(args, configs)]
+    else:
+        sources = LDAP.LDAP.from_config(configs, env=args.environment)
+    for ldap_conn in sources:
         if args.raw:
             if args.common_name:
                 result = ldap_conn.get_user(args.user, filterfield='cn')
@@ -58,120 +94,329 @@ def usersearch(args):
                       if result.found
                       else '%s not found' % args.user)
         results[ldap_conn.host] = result
-    print yaml.dump(results, default_flow_style=False)
+    print yamlio.dump(results)
+
+def environment_conns(configs, ldap_user, ldap_password):
+    ''' A jldap.pool.Pool of connections to every configured environment,
+        each environment's reading through one search cache for the length
+        of the command
+    '''
+    return pool.Pool.from_config(configs,
+                                 user=ldap_user,
+                                 password=ldap_password,
+                                 cache=True)
+
+def print_diff(prof, diff):
+    ''' Show the permissions a profile is about to change, if any
+    '''
+    if diff and not 'profile match' in diff['text'].lower():
+        print 'Permissions to be changed via "%s" profile:' % prof.name
+        if isinstance(diff['diff'], list):
+            print diff['text']
+        print yamlio.dump(diff['diff'])
+
+def print_report(report, prof=None):
+    ''' Show the outcome of a fan-out across environments
+    '''
+    for env, outcome in report.items():
+        if outcome.error:
+            print 'Failed on %s (%s): %s' % (env, outcome.host, outcome.error)
+            continue
+        if prof and outcome.result:
+            print_diff(prof, outcome.result.get('diff'))
+        if outcome.result and outcome.result.get('user'):
+            print yamlio.dump(outcome.result['user'])
+
+def find_user(ldap_conn, uid, basedn=None):
+    ''' LDAP.get_user, but None rather than StopIteration if uid is absent
+    '''
+    try:
+        return ldap_conn.get_user(uid, basedn=basedn)
+    except StopIteration:
+        return None
+
+def apply_profile(ldap_conn, uid, prof, jira=None, move=False, source=None):
+    ''' Per-environment half of enable/adjust: make sure the user exists,
+        optionally move it out of purgatory, and enforce the profile.
+        A missing user is copied from source (the origin environment's
+        entry, already enforced, jira and all) if given, otherwise it is an
+        error.
+    '''
+    # pylint: disable=too-many-arguments
+    if not find_user(ldap_conn, uid):
+        if source is None:
+            raise RuntimeError('%s not found. Please contact PLOPS.' % uid)
+        try:
+            ldap_conn.add_object(source, ignore_attrs=['dn'])
+        # pylint: disable=no-member
+        except LDAP.ldap.ALREADY_EXISTS: # definitely exists
+            print ('User %s already exists on %s but is also "not found"???'
+                   % (uid, ldap_conn.host))
+        if not find_user(ldap_conn, uid):
+            raise RuntimeError('Adding user object to tree %s failed. \
+Please contact PLOPS.' % ldap_conn.host)
+        # the copy's description already carries the ticket
+        jira = None
+    elif move:
+        ldap_conn.move_user(uid, LDAP.USERS)
+    user = ldap_conn.user_search(uid)
+    diff = prof.audit(user, explicit=True, ignore_inherited=True)
+    ldap_conn.enforce_profile(uid, prof, jira)
+    return {'diff': diff, 'user': ldap_conn.user_search(uid).dict()}
+
+def push_profile(conns, origin, uid, prof, **kwargs):
+    ''' Apply a profile to uid on the origin environment, then on every
+        other environment at once, copying the origin's entry wherever the
+        user is missing. conns is env:LDAP or a jldap.pool.Pool. Keyword
+        arguments jira and move are passed on to apply_profile, timeout to
+        fanout.fan_out.
+        Returns a fanout.Report, origin first.
+    '''
+    jira = kwargs.get('jira')
+    move = kwargs.get('move', False)
+    report = fanout.Report()
+    with fanout.connection(conns, origin) as ldap_conn:
+        report[origin] = fanout.call(lambda conn: apply_profile(conn,
+                                                                uid,
+                                                                prof,
+                                                                jira=jira,
+                                                                move=move),
+                                     ldap_conn)
+        if report[origin].error:
+            return report
+        source = ldap_conn.get_user(uid, LDAP.USERS)
+    replicas = [env for env in fanout.environments(conns) if env != origin]
+    report.update(fanout.fan_out(lambda conn: apply_profile(conn,
+                                                            uid,
+                                                            prof,
+                                                            jira=jira,
+                                                            move=move,
+                                                            source=source),
+                                 conns,
+                                 timeout=kwargs.get('timeout', fanout.TIMEOUT),
+                                 envs=replicas))
+    return report
 
 def userenable(args):
     """ Enable a user; move user out of purgatory at a minimum.
+        The origin environment is done first, then every other environment
+        at once.
     """
     configs = config.Config(args.config)
     ldap_user, ldap_password = ldap_creds(configs)
     prof = args.profile_dir + '/%s' % args.profile
     prof = profile.Profile(prof)
-    host = configs.environments.pop(args.environment)
-    origin_ldap = LDAP.LDAP(host,
-                            user=ldap_user,
-                            password=ldap_password,
-                            basedn=configs.basedn)
-    user_obj = origin_ldap.get_user(args.user)
-    if not user_obj:
-        raise RuntimeError('%s not found. Please contact PLOPS.' % args.user)
-    origin_ldap.move_user(args.user, LDAP.USERS)
-    user = origin_ldap.user_search(args.user)
-    diff = prof.audit(user, explicit=True, ignore_inherited=True)
-    if not 'profile match' in diff['text'].lower():
-        print 'Permissions to be changed via "%s" profile:' % prof.name
-        if isinstance(diff['diff'], list):
-            print diff['text']
-        print yaml.dump(diff['diff'], default_flow_style=False)
-    origin_ldap.enforce_profile(args.user, prof, args.jira)
-    user_obj = origin_ldap.get_user(args.user, LDAP.USERS)
-    for _, host in configs.environments.items():
-        next_ldap = LDAP.LDAP(host,
-                              user=ldap_user,
-                              password=ldap_password,
-                              basedn=configs.basedn)
-        next_user_obj = next_ldap.get_user(args.user)
-        if not next_user_obj:
-            next_ldap.add_object(user_obj, ignore_attrs=['dn'])
-            modded_user = next_ldap.user_search(args.user)
-            if not modded_user:
-                raise RuntimeError('Adding user object to tree %s failed. \
-Please contact PLOPS.' % next_ldap.host)
-            print yaml.dump(modded_user, default_flow_style=False)
-            return
-        next_ldap.move_user(args.user, LDAP.USERS)
-        next_user = next_ldap.user_search(args.user)
-        diff = prof.audit(next_user, explicit=True, ignore_inherited=True)
-        if not 'profile match' in diff['text'].lower():
-            print 'Permissions to be changed via "%s" profile:' % prof.name
-            if isinstance(diff['diff'], list):
-                print diff['text']
-            print yaml.dump(diff['diff'], default_flow_style=False)
-        next_ldap.enforce_profile(args.user, prof, args.jira)
-        modded_user = next_ldap.user_search(args.user)
-        if modded_user:
-            print yaml.dump(modded_user, default_flow_style=False)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    report = push_profile(conns, args.environment, args.user, prof,
+                          jira=args.jira,
+                          move=True,
+                          timeout=args.timeout)
+    print_report(report, prof)
 
 def useradjust(args):
     """ Give a user a new profile on all environments
+        The origin environment is done first, then every other environment
+        at once.
     """
     configs = config.Config(args.config)
     ldap_user, ldap_password = ldap_creds(configs)
     prof = args.profile_dir + '/%s' % args.profile
     prof = profile.Profile(prof)
-    env = configs.environments.pop(args.environment)
-    origin_ldap = LDAP.LDAP(env,
-                            user=ldap_user,
-                            password=ldap_password,
-                            basedn=configs.basedn)
-    user_obj = origin_ldap.get_user(args.user, LDAP.USERS)
-    user = origin_ldap.user_search(args.user)
-    diff = prof.audit(user, explicit=True, ignore_inherited=True)
-    if not 'profile match' in diff['text'].lower():
-        print 'Permissions to be changed via "%s" profile:' % prof.name
-        if isinstance(diff['diff'], list):
-            print diff['text']
-        print yaml.dump(diff['diff'], default_flow_style=False)
-    origin_ldap.enforce_profile(args.user, prof)
-    for _, host in configs.environments.items():
-        next_ldap = LDAP.LDAP(host,
-                              user=ldap_user,
-                              password=ldap_password,
-                              basedn=configs.basedn)
-        next_user = next_ldap.user_search(args.user)
-        if not next_user.found:
-            print ('User %s not found on %s. Full dict: "%s"'
-                   % (args.user, next_ldap.host, next_user))
-            try:
-                next_ldap.add_object(user_obj, ignore_attrs=['dn'])
-            # pylint: disable=no-member
-            except LDAP.ldap.ALREADY_EXISTS: # definitely exists
-                print ('User %s already exists on %s but is also "not found"???'
-                       % (args.user, next_ldap.host))
-            next_user = next_ldap.user_search(args.user)
-        diff = prof.audit(next_user, explicit=True, ignore_inherited=True)
-        if not 'profile match' in diff['text'].lower():
-            print 'Permissions to be changed via "%s" profile:' % prof.name
-            if isinstance(diff['diff'], list):
-                print diff['text']
-            print yaml.dump(diff['diff'], default_flow_style=False)
-        next_ldap.enforce_profile(args.user, prof)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    report = push_profile(conns, args.environment, args.user, prof,
+                          timeout=args.timeout)
+    print_report(report, prof)
+
+def disable(ldap_conn, uid):
+    ''' Per-environment work for userdisable
+    '''
+    ldap_conn.disable_user(uid)
+    modded_user = ldap_conn.user_search(uid)
+    return {'user': modded_user.dict() if modded_user.found else None}
 
 def userdisable(args):
     """ Disable a user; move user into purgatory at a minimum.
+        Every environment is done at once.
     """
     configs = config.Config(args.config)
     ldap_user, ldap_password = ldap_creds(configs)
-    for _, host in configs.environments.items():
-        print "Working on ldap host %s" % host
-        next_ldap = LDAP.LDAP(host,
-                              user=ldap_user,
-                              password=ldap_password,
-                              basedn=configs.basedn)
-        next_ldap.disable_user(args.user)
-        modded_user = next_ldap.user_search(args.user)
-        if modded_user:
-            print yaml.dump(modded_user, default_flow_style=False)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    print 'Working on ldap hosts %s' % ', '.join(fanout.host(conns, i)
+                                                for i in fanout.environments(conns))
+    report = fanout.fan_out(lambda conn: disable(conn, args.user),
+                            conns,
+                            timeout=args.timeout)
+    print_report(report)
+
+def read_bulk(stream):
+    ''' Parse bulk requests, one user per line, either as JSON objects with
+        user, profile and jira keys or as CSV user[,profile[,jira]].
+        Blank lines, comments and a CSV header line are skipped.
+    '''
+    fields = ['user', 'profile', 'jira']
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            request = json.loads(line)
+        else:
+            values = [i.strip() for i in csv.reader([line]).next()]
+            if values[0] == 'user':
+                continue
+            request = dict(zip(fields, values))
+        yield dict((key, request.get(key) or None) for key in fields)
+
+def bulk_requests(args):
+    ''' Generate the users (with any profile and jira) a bulk-style command
+        was given, either as arguments or in --file, which is closed once
+        read
+    '''
+    if args.users:
+        for user in args.users:
+            yield {'user': user, 'profile': None, 'jira': None}
+    elif args.file and args.file != '-':
+        with open(args.file, 'r') as stream:
+            for request in read_bulk(stream):
+                yield request
+    else:
+        for request in read_bulk(sys.stdin):
+            yield request
+
+def bulk_profile(args, request, profiles):
+    ''' The (profile, jira) a bulk request is to be enabled/moved with.
+        profiles caches parsed profiles by file name across requests.
+    '''
+    name = prof_file(request['profile'] or args.profile or '')
+    jira = request['jira'] or args.jira
+    if name == '.yaml':
+        raise ValueError('No profile given')
+    if args.action == 'enable' and not jira:
+        raise ValueError('No JIRA given')
+    if name not in profiles:
+        profiles[name] = profile.Profile(os.path.join(args.profile_dir, name))
+        profiles[name].run()
+    return profiles[name], jira
+
+def bulk(args):
+    """ Enable, move or disable many users in one go. Connections are bound
+        once per environment and each profile is parsed once, however many
+        users share it. One JSON result line is printed per user as soon as
+        that user is done.
+    """
+    configs = config.Config(args.config)
+    ldap_user, ldap_password = ldap_creds(configs)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    profiles = {}
+    for request in bulk_requests(args):
+        result = {'user': request['user'], 'action': args.action}
+        try:
+            if args.action == 'disable':
+                report = fanout.fan_out(lambda conn: disable(conn,
+                                                             request['user']),
+                                        conns,
+                                        timeout=args.timeout)
+            else:
+                prof, jira = bulk_profile(args, request, profiles)
+                report = push_profile(conns,
+                                      args.environment,
+                                      request['user'],
+                                      prof,
+                                      jira=jira if args.action == 'enable' else None,
+                                      move=args.action == 'enable',
+                                      timeout=args.timeout)
+            result['errors'] = report.errors
+            result['environments'] = report.dict()
+        except (ValueError, IOError) as err:
+            result['errors'] = {'*': str(err)}
+        print json.dumps(result, default=str)
+        sys.stdout.flush()
+
+def plan_users(args):
+    ''' Work out every change enabling or moving users would make on every
+        environment, without making any, and write it out as JSON (for
+        apply_plan) or LDIF (for review)
+    '''
+    configs = config.Config(args.config)
+    ldap_user, ldap_password = ldap_creds(configs)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    the_plan = plan.Plan()
+    profiles = {}
+    for request in bulk_requests(args):
+        try:
+            prof, jira = bulk_profile(args, request, profiles)
+        except (ValueError, IOError) as err:
+            the_plan.errors[request['user']] = str(err)
+            continue
+        the_plan.add_user(conns,
+                          args.environment,
+                          request['user'],
+                          prof,
+                          jira=jira if args.action == 'enable' else None,
+                          move=args.action == 'enable')
+    # written out whole, so a failure leaves no half-written plan behind
+    rendered = StringIO()
+    if args.format == 'ldif':
+        the_plan.write_ldif(rendered)
+    else:
+        the_plan.write_json(rendered)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(rendered.getvalue())
+    else:
+        sys.stdout.write(rendered.getvalue())
+    if the_plan.errors:
+        sys.stderr.write('Not planned: %s\n' % ', '.join(the_plan.errors))
+
+def apply_plan(args):
+    ''' Make the changes in a plan written by plan_users
+    '''
+    configs = config.Config(args.config)
+    ldap_user, ldap_password = ldap_creds(configs)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    with open(args.plan, 'r') as stream:
+        the_plan = plan.Plan.load(stream)
+    try:
+        report = the_plan.apply(conns, timeout=args.timeout)
+    except ValueError as err:
+        sys.exit(str(err))
+    for env, outcome in report.items():
+        if outcome.error:
+            print 'Failed on %s (%s): %s' % (env, outcome.host, outcome.error)
+        else:
+            print 'Made %s change(s) on %s (%s)' % (outcome.result,
+                                                   env,
+                                                   outcome.host)
+
+def explicit_results(source, users, prof, ignore_inherited):
+    ''' Generate (profile name, audit) for every user of users which
+        matches prof explicitly
+    '''
+    for user in users:
+        the_audit = prof.audit(source.user_search(user),
+                               explicit=True,
+                               ignore_inherited=ignore_inherited)
+        if the_audit['value'] != 3:
+            continue
+        yield the_audit.pop('name'), the_audit
+
+def write_results(args, results, grouped=False):
+    ''' Print (profile name, audit) results by profile, as html or yaml.
+        Results already grouped by profile are written as html row by row as
+        they come; otherwise they are grouped once they are all in.
+    '''
+    if args.html and grouped:
+        write_audits(sys.stdout, results)
+        print
+        return
+    audits = defaultdict(list)
+    for key, the_audit in results:
+        audits[key].append(the_audit)
+    if args.html:
+        write_audits(sys.stdout, audits)
+        print
+        return
+    print yamlio.dump(audits)
 
 def explicit_audit(args):
     ''' Perform an LDAP audit. Find all users, evaluate how well they match to
@@ -181,7 +426,9 @@ def explicit_audit(args):
     ldap_user, ldap_password = ldap_creds(configs)
     prof = args.profile_dir + '/%s' % args.profile
     prof = profile.Profile(prof)
-    if args.environment:
+    if args.offline:
+        ldap_conn = open_mirror(args, configs)
+    elif args.environment:
         env = configs.environments.pop(args.environment)
         ldap_conn = LDAP.LDAP(env,
                               user=ldap_user,
@@ -192,22 +439,17 @@ def explicit_audit(args):
     if args.users:
         users = args.users
     else:
-        users = [i for i in ldap_conn.get_all_uids()]
-    audits = defaultdict(list)
-    for user in users:
-        usearch = ldap_conn.user_search(user)
-        the_audit = (prof
-                     .audit(usearch,
-                            explicit=True,
-                            ignore_inherited=args.ignore))
-        if the_audit['value'] != 3:
-            continue
-        key = the_audit.pop('name')
-        audits[key].append(the_audit)
-    if args.html:
-        print profile.audits2html(audits)
+        users = ldap_conn.iter_uids()
+    if args.offline:
+        source = ldap_conn.graph()
+    elif args.snapshot:
+        source = groups.GroupGraph.from_ldap(ldap_conn)
     else:
-        print yaml.dump(audits, default_flow_style=False)
+        source = ldap_conn
+    # one profile, so the results are grouped as they come
+    write_results(args,
+                  explicit_results(source, users, prof, args.ignore),
+                  grouped=True)
 
 def audit(args):
     ''' Perform an LDAP audit. Find all users, evaluate how well they match to
@@ -215,8 +457,9 @@ def audit(args):
     '''
     configs = config.Config(args.config)
     ldap_user, ldap_password = ldap_creds(configs)
-    profiles = [i for i in profile.Profile.from_directory(args.profile_dir)]
-    if args.environment:
+    if args.offline:
+        ldap_conn = open_mirror(args, configs)
+    elif args.environment:
         env = configs.environments.pop(args.environment)
         ldap_conn = LDAP.LDAP(env,
                               user=ldap_user,
@@ -224,27 +467,47 @@ def audit(args):
                               basedn=configs.basedn)
     else:
         ldap_conn = LDAP.LDAP.from_config(configs).next()
-    if args.users:
-        users = args.users
-    else:
-        users = [i for i in ldap_conn.get_all_uids()]
-    audits = defaultdict(list)
-    for user in users:
-        usearch = ldap_conn.user_search(user)
-        usearch.found = True # set this explicitly since we obtained the list
-                              # of users from LDAP
-        the_audit = (profile
-                     .Profile
-                     .bulk_audit(usearch,
-                                 profiles=profiles,
-                                 ignore_inherited=args.ignore,
-                                 explicit=args.explicit))
-        key = the_audit.pop('name')
-        audits[key].append(the_audit)
-    if args.html:
-        print profile.audits2html(audits)
+    connect = {'host': ldap_conn.host,
+               'user': ldap_user,
+               'password': ldap_password,
+               'basedn': configs.basedn}
+    def pooled(users, snapshot):
+        ''' Audit users across args.workers processes
+        '''
+        return workers.audit_users(users,
+                                   connect,
+                                   args.profile_dir,
+                                   workers=args.workers,
+                                   ignore_inherited=args.ignore,
+                                   explicit=args.explicit,
+                                   snapshot=snapshot)
+    profiles = profile.ProfileRegistry(args.profile_dir).profiles
+    if args.incremental and not args.users and not args.offline:
+        inc = incremental.IncrementalAudit(ldap_conn,
+                                           profiles,
+                                           path=args.state,
+                                           ignore_inherited=args.ignore,
+                                           explicit=args.explicit)
+        results = ((name, the_audit) for _, name, the_audit
+                   in inc.run(pooled if args.workers > 1 else None))
     else:
-        print yaml.dump(audits, default_flow_style=False)
+        users = args.users if args.users else ldap_conn.iter_uids()
+        if args.offline:
+            snapshot = ldap_conn.graph()
+        elif args.snapshot:
+            snapshot = groups.GroupGraph.from_ldap(ldap_conn)
+        else:
+            snapshot = None
+        if args.workers > 1:
+            results = pooled(users, snapshot)
+        else:
+            matcher = matching.Matcher(profiles,
+                                       ignore_inherited=args.ignore,
+                                       explicit=args.explicit)
+            source = snapshot if snapshot is not None else ldap_conn
+            results = (workers.audit_user(source, matcher, user)
+                       for user in users)
+    write_results(args, results)
 
 def profile_suf(prof_name):
     ''' Ensure correct yaml extension for profiles found in profiles directory
@@ -263,31 +526,35 @@ def profile_dumper(args):
         profiles = ([profile.Profile(os.path.join(args.profile_dir,
                                                   args.single))])
     else:
-        profiles = [i for i in profile.Profile.from_directory(args.profile_dir)]
+        profiles = profile.ProfileRegistry(args.profile_dir).profiles
     for prof in profiles:
         print 'Profile "%s"' % prof.name
         print prof
 
 def propagate_pubkeys(args):
     ''' Copy a user's public key from chosen LDAP environment to other
-        environments.
+        environments (all at once).
     '''
     configs = config.Config(args.config)
     ldap_user, ldap_password = ldap_creds(configs)
-    origin = configs.environments.pop(args.environment)
-    ldap_conn = LDAP.LDAP(origin,
-                          user=ldap_user,
-                          password=ldap_password,
-                          basedn=configs.basedn)
-    user = ldap_conn.search(basedn=configs.basedn,
-                            filterstr='(uid=%s)' % args.user).next()
-    for _, host in configs.environments.items():
-        next_ldap = LDAP.LDAP(host,
-                              user=ldap_user,
-                              password=ldap_password,
-                              basedn=configs.basedn)
+    conns = environment_conns(configs, ldap_user, ldap_password)
+    with conns.connection(args.environment) as ldap_conn:
+        user = ldap_conn.search(basedn=configs.basedn,
+                                filterstr='(uid=%s)' % args.user).next()
+    def copy_key(next_ldap):
+        ''' Per-environment work: replace the key with the origin's
+        '''
         nextuser = next_ldap.search(basedn=configs.basedn,
                                     filterstr='(uid=%s)' % args.user).next()
         next_ldap.replace_attribute('sshPublicKey', nextuser, user.sshPublicKey)
-        print 'Copied public key for user %s to LDAP host %s' % (args.user,
-                                                                 next_ldap.host)
+    report = fanout.fan_out(copy_key,
+                            conns,
+                            timeout=args.timeout,
+                            envs=[i for i in fanout.environments(conns)
+                                  if i != args.environment])
+    for env, outcome in report.items():
+        if outcome.error:
+            print 'Failed on %s (%s): %s' % (env, outcome.host, outcome.error)
+        else:
+            print 'Copied public key for user %s to LDAP host %s' % (args.user,
+                                                                     outcome.host)
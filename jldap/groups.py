@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""groups module
+Resolution of nested group memberships
+
+Example:
+    import jldap.groups
+    resolver = jldap.groups.GroupResolver(ldap_conn)
+    parents = resolver.parents(group_dns)
+    nested = jldap.groups.nest(group_dns, parents)
+
+    graph = jldap.groups.GroupGraph.from_ldap(ldap_conn)
+    userdict = graph.user_search(uid) # no round trips
+
+Attributes:
+	MAX_FILTER_LEN (int): Longest OR-combined filter to send in one search;
+            longer frontiers are split across several searches
+	GROUP_FILTER (str): Filter matching every group object
+	MEMBER_ATTRS (list): Group attributes holding memberships
+"""
+from collections import defaultdict
+import ldap.filter
+import jldap.LDAP
+import jldap.userdict
+
+MAX_FILTER_LEN = 4096
+GROUP_FILTER = ('(|(objectClass=groupOfUniqueNames)'
+                '(objectClass=posixGroup)'
+                '(objectClass=sambaGroupMapping))')
+MEMBER_ATTRS = ['uniqueMember', 'memberUid']
+
+def normalize(dn):
+    ''' Normalise a dn for comparison: case and whitespace around rdns don't
+        matter to the directory, so they shouldn't matter to us
+    '''
+    return ','.join(i.strip() for i in dn.lower().split(','))
+
+def nest(dns, parents, path=frozenset()):
+    ''' Arrange dns in the nested format produced by LDAP.user_search: each dn
+        is followed by a list of its own parent groups (nested in the same
+        way), if it has any.
+        parents maps normalised dns to the dns of the groups containing them.
+        A group already seen on the way up is listed but not followed again,
+        so membership cycles terminate.
+    '''
+    retlist = []
+    for dn in dns:
+        retlist.append(dn)
+        key = normalize(dn)
+        if key in path:
+            continue
+        nested = nest(parents.get(key, []), parents, path | frozenset([key]))
+        if nested:
+            retlist.append(nested)
+    return retlist
+
+class GroupResolver(object):
+    ''' Walks group hierarchies breadth-first, finding the parents of a whole
+        frontier of dns with one (uniqueMember=...) OR-filter search per level
+        instead of one search per group
+    '''
+    def __init__(self, ldap_conn, max_filter_len=MAX_FILTER_LEN):
+        self._ldap = ldap_conn
+        self._max_filter_len = max_filter_len
+    def filters(self, dns):
+        ''' OR-combined (uniqueMember=dn) filters for dns, each no longer than
+            max_filter_len (unless a single clause is longer by itself)
+        '''
+        def combine(clauses):
+            ''' OR together clauses, if there's more than one
+            '''
+            return clauses[0] if len(clauses) == 1 else '(|%s)' % ''.join(clauses)
+        chunk, length = [], 3 # '(|' and ')'
+        for dn in dns:
+            clause = '(uniqueMember=%s)' % ldap.filter.escape_filter_chars(dn)
+            if chunk and length + len(clause) > self._max_filter_len:
+                yield combine(chunk)
+                chunk, length = [], 3
+            chunk.append(clause)
+            length += len(clause)
+        if chunk:
+            yield combine(chunk)
+    def parents(self, dns):
+        ''' Map the normalised form of dns, and of every group above them, to
+            the dns of the groups which have them as a uniqueMember
+        '''
+        parents = {}
+        seen = set()
+        frontier = dict((normalize(i), i) for i in dns)
+        while frontier:
+            seen.update(frontier)
+            next_frontier = {}
+            for filterstr in self.filters(frontier.values()):
+                for group in self._ldap.search(filterstr=filterstr,
+                                               attrlist=['uniqueMember']):
+                    for member in group.get('uniqueMember', []):
+                        key = normalize(member)
+                        if key in frontier:
+                            parents.setdefault(key, []).append(group.dn)
+                    key = normalize(group.dn)
+                    if key not in seen:
+                        next_frontier[key] = group.dn
+            frontier = next_frontier
+        return parents
+
+class GroupGraph(object):
+    ''' In-memory snapshot of every group under a base dn, indexed so that
+        user_search-equivalent queries need no round trips at all
+    '''
+    @classmethod
+    def from_ldap(cls, ldap_conn, basedn=None):
+        ''' Load every group (and every not-yet-enabled user) in one paged
+            pass
+        '''
+        groups = ldap_conn.paged_search(basedn=basedn,
+                                        filterstr=GROUP_FILTER,
+                                        attrlist=MEMBER_ATTRS)
+        purgatory = ldap_conn.paged_search(basedn=jldap.LDAP.PURGATORY,
+                                           filterstr='(uid=*)',
+                                           attrlist=['uid'])
+        return cls(groups, purgatory)
+
+    def __init__(self, groups=(), purgatory=()):
+        ''' groups and purgatory are iterables of Attdicts as produced by
+            jldap.LDAP.LDAP.search
+        '''
+        self._groups = {}
+        self._purgatory = {}
+        self._parents = {}
+        self._by_uid = {}
+        self._ancestors = {}
+        self.purgatory = purgatory
+        self.update(groups)
+    def __len__(self):
+        return len(self._groups)
+    def __contains__(self, dn):
+        return normalize(dn) in self._groups
+    @property
+    def purgatory(self):
+        ''' uid:dn of every not-yet-enabled user
+        '''
+        return dict(self._purgatory)
+    @purgatory.setter
+    def purgatory(self, users):
+        ''' Replace the not-yet-enabled users with an iterable of Attdicts
+        '''
+        self._purgatory = dict((i.uid[0], i.dn) for i in users)
+    def update(self, groups):
+        ''' Add or replace group entries, then re-index
+        '''
+        for group in groups:
+            self._groups[normalize(group.dn)] = {
+                'dn': group.dn,
+                'uniqueMember': list(group.get('uniqueMember', [])),
+                'memberUid': list(group.get('memberUid', []))}
+        self._index()
+    def remove(self, dns):
+        ''' Drop group entries, then re-index
+        '''
+        for dn in dns:
+            self._groups.pop(normalize(dn), None)
+        self._index()
+    def _index(self):
+        ''' Build the reverse (member -> groups) indexes and the transitive
+            closure of every group's ancestors
+        '''
+        parents = defaultdict(list)
+        by_uid = defaultdict(list)
+        for group in self._groups.values():
+            for member in group['uniqueMember']:
+                parents[normalize(member)].append(group['dn'])
+            for uid in group['memberUid']:
+                by_uid[uid].append(group['dn'])
+        self._parents = dict(parents)
+        self._by_uid = dict(by_uid)
+        self._ancestors = {}
+        for key in self._groups:
+            seen = set()
+            frontier = [key]
+            while frontier:
+                up = [normalize(i)
+                      for j in frontier
+                      for i in self._parents.get(j, [])]
+                frontier = [i for i in up if i not in seen]
+                seen.update(frontier)
+            seen.discard(key)
+            self._ancestors[key] = frozenset(self._groups[i]['dn']
+                                             for i in seen
+                                             if i in self._groups)
+    @property
+    def dns(self):
+        ''' The dns of every group in the snapshot
+        '''
+        return [i['dn'] for i in self._groups.values()]
+    def members(self, dn, attr='uniqueMember'):
+        ''' Direct values of a group's membership attribute
+        '''
+        return list(self._groups[normalize(dn)][attr])
+    def parents(self, dn):
+        ''' Groups which have dn as a uniqueMember
+        '''
+        return list(self._parents.get(normalize(dn), []))
+    def ancestors(self, dn):
+        ''' Every group dn inherits membership of, directly or not
+        '''
+        key = normalize(dn)
+        if key in self._ancestors:
+            return set(self._ancestors[key])
+        retset = set()
+        for parent in self.parents(dn):
+            retset.add(parent)
+            retset.update(self._ancestors.get(normalize(parent), ()))
+        return retset
+    def affected_uids(self, dns):
+        ''' uids of every user whose user_search involves any of dns: the
+            members of those groups and of every group below them
+        '''
+        keys = set(normalize(i) for i in dns)
+        hit = set(keys)
+        for key, ancestors in self._ancestors.items():
+            if any(normalize(i) in keys for i in ancestors):
+                hit.add(key)
+        uids = set()
+        for key in hit:
+            if key not in self._groups:
+                continue
+            uids.update(self._groups[key]['memberUid'])
+            for member in self._groups[key]['uniqueMember']:
+                attr, _, val = member.split(',', 1)[0].partition('=')
+                if attr.strip().lower() == 'uid':
+                    uids.add(val.strip())
+        return uids
+    def user_search(self, user):
+        ''' Equivalent of jldap.LDAP.LDAP.user_search, answered from the
+            snapshot
+        '''
+        direct = {'memberUid': list(self._by_uid.get(user, [])),
+                  'user-purgatory': ([self._purgatory[user]]
+                                     if user in self._purgatory
+                                     else []),
+                  'uniqueMember': self.parents('uid=%s,%s'
+                                               % (user, jldap.LDAP.USERS))}
+        results = jldap.userdict.Userdict(name=user)
+        for key, dns in direct.items():
+            # assignment sets userdict.found, as in LDAP.user_search
+            results[key] = nest(dns, self._parents)
+        return results
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""incremental module
+Audit only what changed since the last audit
+
+Example:
+    import jldap.incremental
+    inc = jldap.incremental.IncrementalAudit(ldap_conn, profiles)
+    for uid, name, the_audit in inc.run():
+        audits[name].append(the_audit)
+    print inc.stats
+
+The previous run's per-user audits and a groups.GroupGraph snapshot are
+pickled to a state file per host. Each run asks the directory only for the
+groups and users whose modifyTimestamp moved since the previous run (less
+SKEW, to allow for clock differences), plus cheap dn-only and uid-only
+listings to notice deletions. Only users those changes can affect --
+changed users, new users, and the members of changed groups and of every
+group below them, before and after the change -- are audited again; the
+rest of the report comes from the state file.
+
+Attributes:
+	SKEW (int): Seconds to reach back before the previous run's start
+	VERSION (int): State file format; other versions are ignored
+"""
+import cPickle as pickle
+import hashlib
+import os
+import time
+from collections import OrderedDict
+import jldap.config
+import jldap.LDAP
+import jldap.groups
+import jldap.matching
+import jldap.workers
+
+SKEW = 300
+VERSION = 1
+
+def state_path(host):
+    ''' Default state file for a host
+    '''
+    return os.path.join(jldap.config.STATE_DIR, 'audit-%s.pickle' % host)
+
+def generalized_time(when):
+    ''' LDAP GeneralizedTime (UTC) for a unix timestamp
+    '''
+    return time.strftime('%Y%m%d%H%M%SZ', time.gmtime(when))
+
+def fingerprint(profiles, ignore_inherited=False, explicit=False):
+    ''' Digest of everything besides the directory an audit depends on
+    '''
+    digest = hashlib.sha1(repr((ignore_inherited, explicit)))
+    for prof in profiles:
+        digest.update(repr((prof.name, prof.owner, sorted(prof.permissions))))
+    return digest.hexdigest()
+
+class IncrementalAudit(object):
+    ''' Audits every user in LDAP against profiles, re-auditing only users
+        affected by changes since the state file was last written
+    '''
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self,
+                 ldap_conn,
+                 profiles,
+                 path=None,
+                 ignore_inherited=False,
+                 explicit=False):
+        self._ldap = ldap_conn
+        self._profiles = list(profiles)
+        self._path = path or state_path(ldap_conn.host)
+        self._ignore_inherited = ignore_inherited
+        self._explicit = explicit
+        self._stats = OrderedDict()
+    @property
+    def path(self):
+        ''' The state file
+        '''
+        return self._path
+    @property
+    def stats(self):
+        ''' What the last run did: whether it was full, and how many users
+            and groups were looked at
+        '''
+        return self._stats
+    def load(self):
+        ''' The previous run's state, or None if there is no usable one
+        '''
+        try:
+            with open(self._path, 'rb') as stream:
+                state = pickle.load(stream)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if (state.get('version') != VERSION
+                or state.get('host') != self._ldap.host
+                or state.get('fingerprint') != self.fingerprint()):
+            return None
+        return state
+    def save(self, state):
+        ''' Write state atomically, so an interrupted run leaves the
+            previous state intact
+        '''
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '%s.tmp' % self._path
+        with open(tmp, 'wb') as stream:
+            pickle.dump(state, stream, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self._path)
+    def fingerprint(self):
+        ''' Fingerprint of this audit's profiles and options
+        '''
+        return fingerprint(self._profiles,
+                           ignore_inherited=self._ignore_inherited,
+                           explicit=self._explicit)
+    def changes(self, graph, since):
+        ''' Bring graph up to date and work out which uids need auditing
+            again. Returns (uids in LDAP now, uids to audit).
+        '''
+        # pylint: disable=no-member
+        stamp = '(modifyTimestamp>=%s)' % since
+        changed = list(self._ldap.paged_search(
+            filterstr='(&%s%s)' % (jldap.groups.GROUP_FILTER, stamp),
+            attrlist=jldap.groups.MEMBER_ATTRS))
+        present = set(jldap.groups.normalize(i.dn)
+                      for i in self._ldap.paged_search(
+                          filterstr=jldap.groups.GROUP_FILTER,
+                          attrlist=['1.1']))
+        removed = [i for i in graph.dns
+                   if jldap.groups.normalize(i) not in present]
+        touched = [i.dn for i in changed] + removed
+        affected = graph.affected_uids(touched)
+        graph.remove(removed)
+        graph.update(changed)
+        affected |= graph.affected_uids(touched)
+        purgatory = graph.purgatory
+        graph.purgatory = self._ldap.paged_search(basedn=jldap.LDAP.PURGATORY,
+                                                  filterstr='(uid=*)',
+                                                  attrlist=['uid'])
+        affected |= set(uid for uid in set(purgatory) | set(graph.purgatory)
+                        if purgatory.get(uid) != graph.purgatory.get(uid))
+        affected.update(i.uid[0] for i in self._ldap.paged_search(
+            basedn=jldap.LDAP.USERS,
+            filterstr='(&(objectClass=person)(uid=*)%s)' % stamp,
+            attrlist=['uid']))
+        self._stats['changed_groups'] = len(changed)
+        self._stats['removed_groups'] = len(removed)
+        return list(self._ldap.iter_uids()), affected
+    def run(self, audit_users=None):
+        ''' Generate (uid, profile name, audit) for every user in LDAP, in
+            LDAP order, and write the new state.
+            audit_users(uids, graph) generates (profile name, audit) for uids
+            in order; by default they are audited in this process.
+        '''
+        if audit_users is None:
+            audit_users = self.audit_users
+        started = time.time()
+        state = self.load()
+        self._stats = OrderedDict([('full', state is None),
+                                   ('changed_groups', 0),
+                                   ('removed_groups', 0)])
+        if state is None:
+            graph = jldap.groups.GroupGraph.from_ldap(self._ldap)
+            uids = list(self._ldap.iter_uids())
+            stale = set(uids)
+            cached = {}
+        else:
+            graph = state['graph']
+            uids, stale = self.changes(graph,
+                                       generalized_time(state['started'] - SKEW))
+            cached = state['audits']
+            stale.update(i for i in uids if i not in cached)
+        todo = [i for i in uids if i in stale]
+        results = dict(zip(todo, audit_users(todo, graph)))
+        audits = OrderedDict()
+        for uid in uids:
+            audits[uid] = results[uid] if uid in results else cached[uid]
+        self._stats['users'] = len(uids)
+        self._stats['audited'] = len(todo)
+        self.save({'version': VERSION,
+                   'host': self._ldap.host,
+                   'fingerprint': self.fingerprint(),
+                   'started': started,
+                   'graph': graph,
+                   'audits': audits})
+        for uid, (name, the_audit) in audits.items():
+            yield uid, name, OrderedDict(the_audit)
+    def audit_users(self, uids, graph):
+        ''' Default auditor: audit uids from graph in this process
+        '''
+        matcher = jldap.matching.Matcher(self._profiles,
+                                         ignore_inherited=self._ignore_inherited,
+                                         explicit=self._explicit)
+        for uid in uids:
+            yield jldap.workers.audit_user(graph, matcher, uid)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""matching module
+Classify many users against many profiles at once
+
+Example:
+    import jldap.matching
+    import jldap.profile
+    profiles = jldap.profile.ProfileRegistry(path).profiles
+    matcher = jldap.matching.Matcher(profiles)
+    for user in users:
+        the_audit = matcher.audit(ldap_conn.user_search(user))
+
+Every group dn is interned to a bit position, so that profiles and users are
+plain integer bitsets and comparing one against the other is a handful of
+integer operations rather than set construction. Users with the same
+permissions (the common case) are only ever classified once.
+
+Attributes:
+	MATCH (int): Audit value of a profile match
+	PARTIAL (int): Audit value of missing or extra permissions
+	NO_MATCH (int): Audit value of a profile which cannot match
+	NOT_FOUND (int): Audit value of a user not found in LDAP
+"""
+MATCH = 3
+PARTIAL = 2
+NO_MATCH = 1
+NOT_FOUND = 4
+
+def popcount(bits):
+    ''' Number of set bits in an int
+    '''
+    return bin(bits).count('1')
+
+class Matcher(object):
+    ''' Picks the profile Profile.bulk_audit would pick for a user, for any
+        number of users, without auditing every user against every profile
+    '''
+    def __init__(self, profiles, ignore_inherited=False, explicit=False):
+        ''' profiles is a list of Profiles, in the order bulk_audit would be
+            given them (ties go to the first)
+        '''
+        self._profiles = list(profiles)
+        if not self._profiles:
+            raise TypeError('Matcher needs at least one profile')
+        self._ignore_inherited = ignore_inherited
+        self._explicit = explicit
+        self._bits = {}
+        self._masks = [self.mask(prof.permissions) for prof in self._profiles]
+        self._best = {}
+    @property
+    def profiles(self):
+        ''' The profiles users are matched against
+        '''
+        return self._profiles
+    def mask(self, dns):
+        ''' Bitset of dns, interning any not seen before
+        '''
+        bits = 0
+        for dn in dns:
+            if dn not in self._bits:
+                self._bits[dn] = 1 << len(self._bits)
+            bits |= self._bits[dn]
+        return bits
+    def user_mask(self, user):
+        ''' Bitset of a user_search result's permissions
+        '''
+        return self.mask(user.permissions(
+            ignore_inherited=self._ignore_inherited))
+    def classify(self, bits):
+        ''' (value, diff size) of every profile against a user's bitset, the
+            two things bulk_audit ranks audits by
+        '''
+        ranks = []
+        for prof_bits in self._masks:
+            extra = bits & ~prof_bits
+            missing = prof_bits & ~bits
+            if not extra and not missing:
+                ranks.append((MATCH, 0))
+            elif not extra:
+                ranks.append((PARTIAL, popcount(missing)))
+            elif not missing:
+                ranks.append((PARTIAL, popcount(extra)))
+            else:
+                # an explicit mismatch's diff is {'extra':..., 'missing':...}
+                ranks.append((NO_MATCH, 2 if self._explicit else 0))
+        return ranks
+    def best(self, bits):
+        ''' Index of the profile bulk_audit would pick for a user's bitset:
+            highest value, then smallest diff, then first given
+        '''
+        if bits not in self._best:
+            ranks = self.classify(bits)
+            self._best[bits] = min(range(len(ranks)),
+                                   key=lambda i: (-ranks[i][0], ranks[i][1], i))
+        return self._best[bits]
+    def match(self, user):
+        ''' The profile bulk_audit would pick for a user_search result
+        '''
+        if not user.found:
+            return self._profiles[0]
+        return self._profiles[self.best(self.user_mask(user))]
+    def audit(self, user):
+        ''' Same as Profile.bulk_audit(user, profiles=profiles, ...), but only
+            the winning profile's audit is ever built
+        '''
+        return self.match(user).audit(user,
+                                      explicit=self._explicit,
+                                      ignore_inherited=self._ignore_inherited)
+    def audit_all(self, users):
+        ''' Generate audits for any number of user_search results
+        '''
+        for user in users:
+            yield self.audit(user)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""mirror module
+Local SQLite copy of an environment's users and groups
+
+Example:
+    import jldap.mirror
+    with jldap.mirror.Mirror.for_host(ldap_conn.host) as mirror:
+        mirror.sync(ldap_conn) # whole subtrees the first time, changes after
+        userdict = mirror.user_search(uid) # no LDAP at all
+        graph = mirror.graph() # for audits
+
+Entries are kept whole (less SECRET_ATTRS), along with indexed uid, cn and
+membership (memberUid and uniqueMember) columns, so a mirror answers what
+LDAP.user_search, cn_search, get_user and iter_uids answer without a
+connection. After the first sync, only entries whose modifyTimestamp moved
+since the previous sync (less incremental.SKEW) are fetched, plus dn-only
+listings to notice deletions and moves.
+
+Attributes:
+	VERSION (int): Schema version; mirrors of other versions are rebuilt
+	SECRET_ATTRS (set): Attributes never written to disk
+	GROUP_SUBTREE (str): Name of the subtree holding every group
+	USER_SUBTREES (OrderedDict): Name:base dn of each subtree of users
+	USER_FILTER (str): Filter matching every user
+	MAX_VARIABLES (int): Most values to bind in one IN (...) query
+	SCHEMA (str): Tables and indexes
+"""
+import cPickle as pickle
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+import jldap.attdict
+import jldap.config
+import jldap.groups
+import jldap.incremental
+import jldap.LDAP
+import jldap.userdict
+
+VERSION = 1
+SECRET_ATTRS = set(['userPassword', 'sambaNTPassword', 'sambaLMPassword'])
+GROUP_SUBTREE = 'groups'
+USER_SUBTREES = OrderedDict([('users', jldap.LDAP.USERS),
+                             ('purgatory', jldap.LDAP.PURGATORY),
+                             ('disabled', jldap.LDAP.DISABLED)])
+USER_FILTER = '(uid=*)'
+MAX_VARIABLES = 500
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    ndn TEXT PRIMARY KEY,
+    dn TEXT NOT NULL,
+    subtree TEXT NOT NULL,
+    uid TEXT,
+    cn TEXT,
+    attrs BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS entries_subtree ON entries (subtree, uid);
+CREATE INDEX IF NOT EXISTS entries_uid ON entries (uid);
+CREATE INDEX IF NOT EXISTS entries_cn ON entries (cn);
+CREATE TABLE IF NOT EXISTS members (
+    ndn TEXT NOT NULL,
+    attr TEXT NOT NULL,
+    value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS members_ndn ON members (ndn);
+CREATE INDEX IF NOT EXISTS members_value ON members (attr, value);
+'''
+
+def state_path(host):
+    ''' Default mirror file for a host
+    '''
+    return os.path.join(jldap.config.STATE_DIR, 'mirror-%s.sqlite' % host)
+
+def chunks(values, size=MAX_VARIABLES):
+    ''' values in lists of at most size
+    '''
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+class Mirror(object):
+    ''' SQLite mirror of the users and groups of one LDAP host
+    '''
+    @classmethod
+    def for_host(cls, host, path=None):
+        ''' The mirror of host, at path or its default location
+        '''
+        return cls(path or state_path(host), host)
+
+    def __init__(self, path, host):
+        self._path = path
+        self._host = host
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if not os.path.exists(path):
+            # entries hold personal details; keep them to ourselves
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0600))
+        self._db = sqlite3.connect(path)
+        self._db.text_factory = str
+        if self.meta('version') not in (None, str(VERSION)):
+            self._drop()
+        self._db.executescript(SCHEMA)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        ''' Close the database
+        '''
+        self._db.close()
+    @property
+    def host(self):
+        ''' The host mirrored
+        '''
+        return self._host
+    @property
+    def path(self):
+        ''' The mirror file
+        '''
+        return self._path
+    @property
+    def synced(self):
+        ''' Unix time the last sync started, None if there hasn't been one
+        '''
+        value = self.meta('synced')
+        if value is None or self.meta('host') != self._host:
+            return None
+        return float(value)
+    def meta(self, key):
+        ''' A value from the meta table, None if unset
+        '''
+        try:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                                   (key,)).fetchone()
+        except sqlite3.OperationalError: # no schema yet
+            return None
+        return row[0] if row else None
+    def _drop(self):
+        ''' Throw away every table
+        '''
+        with self._db:
+            for table in ['meta', 'entries', 'members']:
+                self._db.execute('DROP TABLE IF EXISTS %s' % table)
+    def _store(self, subtree, entry):
+        ''' Insert or replace an entry (an Attdict from LDAP.search)
+        '''
+        ndn = jldap.groups.normalize(entry.dn)
+        attrs = dict((i, j) for i, j in entry.items()
+                     if i != 'dn' and i not in SECRET_ATTRS)
+        self._db.execute('DELETE FROM members WHERE ndn = ?', (ndn,))
+        self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                         (ndn,
+                          entry.dn,
+                          subtree,
+                          attrs.get('uid', [None])[0],
+                          attrs.get('cn', [None])[0],
+                          sqlite3.Binary(pickle.dumps(attrs,
+                                                      pickle.HIGHEST_PROTOCOL))))
+        rows = ([(ndn, 'memberUid', i) for i in attrs.get('memberUid', [])] +
+                [(ndn, 'uniqueMember', jldap.groups.normalize(i))
+                 for i in attrs.get('uniqueMember', [])])
+        self._db.executemany('INSERT INTO members VALUES (?, ?, ?)', rows)
+    def _remove(self, ndns):
+        ''' Delete entries by normalised dn
+        '''
+        for chunk in chunks(ndns):
+            marks = ','.join('?' * len(chunk))
+            self._db.execute('DELETE FROM entries WHERE ndn IN (%s)' % marks, chunk)
+            self._db.execute('DELETE FROM members WHERE ndn IN (%s)' % marks, chunk)
+    def _subtrees(self, ldap_conn):
+        ''' (name, base dn, filter) of every subtree mirrored
+        '''
+        retlist = [(GROUP_SUBTREE, ldap_conn.basedn, jldap.groups.GROUP_FILTER)]
+        retlist.extend((name, base, USER_FILTER)
+                       for name, base in USER_SUBTREES.items())
+        return retlist
+    def sync(self, ldap_conn, full=False):
+        ''' Bring the mirror up to date with ldap_conn, reloading everything
+            if asked to or if it has never been synced from that host.
+            Returns stats: whether the sync was full, and how many entries
+            were fetched and removed per subtree.
+        '''
+        started = time.time()
+        synced = None if full else self.synced
+        stats = OrderedDict([('full', synced is None)])
+        with self._db: # one transaction: a failed sync changes nothing
+            for name, base, filterstr in self._subtrees(ldap_conn):
+                if synced is None:
+                    self._db.execute('DELETE FROM members WHERE ndn IN '
+                                     '(SELECT ndn FROM entries WHERE subtree = ?)',
+                                     (name,))
+                    self._db.execute('DELETE FROM entries WHERE subtree = ?',
+                                     (name,))
+                    changed = ldap_conn.paged_search(basedn=base,
+                                                     filterstr=filterstr)
+                    removed = []
+                else:
+                    since = jldap.incremental.generalized_time(
+                        synced - jldap.incremental.SKEW)
+                    changed = ldap_conn.paged_search(
+                        basedn=base,
+                        filterstr='(&%s(modifyTimestamp>=%s))' % (filterstr, since))
+                    present = set(jldap.groups.normalize(i.dn)
+                                  for i in ldap_conn.paged_search(basedn=base,
+                                                                  filterstr=filterstr,
+                                                                  attrlist=['1.1']))
+                    removed = [i for (i,) in self._db.execute(
+                        'SELECT ndn FROM entries WHERE subtree = ?', (name,))
+                               if i not in present]
+                    self._remove(removed)
+                count = 0
+                for entry in changed:
+                    self._store(name, entry)
+                    count += 1
+                stats[name] = OrderedDict([('fetched', count),
+                                           ('removed', len(removed))])
+            self._db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                 [('version', str(VERSION)),
+                                  ('host', self._host),
+                                  ('synced', repr(started))])
+        return stats
+    def _entries(self, where, params):
+        ''' Attdicts of the entries matching a where clause, in dn order
+        '''
+        for dn, attrs in self._db.execute('SELECT dn, attrs FROM entries '
+                                          'WHERE %s ORDER BY ndn' % where,
+                                          params):
+            entry = jldap.attdict.Attdict(pickle.loads(str(attrs)))
+            entry['dn'] = dn
+            yield entry
+    def search(self, value, filterfield='uid', basedn=None):
+        ''' Generate the entries whose uid or cn (filterfield) is value,
+            under basedn if given
+        '''
+        if filterfield not in ('uid', 'cn'):
+            raise ValueError('Mirrors are only searchable by uid or cn')
+        base = jldap.groups.normalize(basedn) if basedn else None
+        for entry in self._entries('%s = ?' % filterfield, (value,)):
+            ndn = jldap.groups.normalize(entry.dn)
+            if base is None or ndn == base or ndn.endswith(',' + base):
+                yield entry
+    def get_user(self, user, basedn=None, filterfield='uid'):
+        ''' Equivalent of jldap.LDAP.LDAP.get_user
+        '''
+        return self.search(user, filterfield=filterfield, basedn=basedn).next()
+    def iter_uids(self):
+        ''' The uid of every (enabled) user. A list, not a generator: the
+            database can only be read from this thread, and uids are often
+            consumed from another (multiprocessing.Pool.imap's task feeder)
+        '''
+        return [uid for (uid,) in self._db.execute('SELECT uid FROM entries '
+                                                   'WHERE subtree = ? '
+                                                   'ORDER BY uid',
+                                                   ('users',)).fetchall()]
+    def parents(self, dns):
+        ''' Map the normalised form of dns, and of every group above them, to
+            the dns of the groups which have them as a uniqueMember, as
+            jldap.groups.GroupResolver.parents does
+        '''
+        parents = {}
+        seen = set()
+        frontier = set(jldap.groups.normalize(i) for i in dns)
+        while frontier:
+            seen.update(frontier)
+            next_frontier = set()
+            for chunk in chunks(frontier):
+                for value, ndn, dn in self._db.execute(
+                        'SELECT m.value, e.ndn, e.dn FROM members m '
+                        'JOIN entries e ON e.ndn = m.ndn '
+                        'WHERE m.attr = ? AND m.value IN (%s) '
+                        'ORDER BY e.ndn' % ','.join('?' * len(chunk)),
+                        ['uniqueMember'] + chunk):
+                    parents.setdefault(value, []).append(dn)
+                    if ndn not in seen:
+                        next_frontier.add(ndn)
+            frontier = next_frontier
+        return parents
+    def user_search(self, user):
+        ''' Equivalent of jldap.LDAP.LDAP.user_search, answered from the
+            mirror
+        '''
+        query = ('SELECT e.dn FROM members m JOIN entries e ON e.ndn = m.ndn '
+                 'WHERE m.attr = ? AND m.value = ? ORDER BY e.ndn')
+        unique = jldap.groups.normalize('uid=%s,%s' % (user, jldap.LDAP.USERS))
+        direct = {'memberUid': [i for (i,) in self._db.execute(
+                      query, ('memberUid', user))],
+                  'user-purgatory': [i.dn for i in self._entries(
+                      'subtree = ? AND uid = ?', ('purgatory', user))],
+                  'uniqueMember': [i for (i,) in self._db.execute(
+                      query, ('uniqueMember', unique))]}
+        parents = self.parents([i for dns in direct.values() for i in dns])
+        results = jldap.userdict.Userdict(name=user)
+        for key, dns in direct.items():
+            # assignment sets userdict.found, as in LDAP.user_search
+            results[key] = jldap.groups.nest(dns, parents)
+        return results
+    def cn_search(self, common_name):
+        ''' Equivalent of jldap.LDAP.LDAP.cn_search
+        '''
+        for entry in self.search(common_name, filterfield='cn'):
+            if 'uid' in entry:
+                return self.user_search(entry.uid[0])
+        return jldap.userdict.Userdict()
+    def graph(self):
+        ''' A jldap.groups.GroupGraph of every mirrored group, for audits
+        '''
+        return jldap.groups.GroupGraph(
+            self._entries('subtree = ?', (GROUP_SUBTREE,)),
+            self._entries('subtree = ?', ('purgatory',)))
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""plan module
+Work out every LDAP change enabling or moving users would make, without
+making any, and apply such plans later without reading anything back.
+
+Example:
+    import jldap.plan
+    the_plan = jldap.plan.Plan()
+    the_plan.add_user(conns, 'phx', uid, prof, jira=jira, move=True)
+    the_plan.write_ldif(sys.stdout)
+    with open(path, 'w') as out:
+        the_plan.write_json(out)
+
+    the_plan = jldap.plan.Plan.load(open(path))
+    report = the_plan.apply(conns)
+
+Changes are Attdicts of user, dn and op -- one of 'add' (with attrs and
+origin), 'modrdn' (with newrdn and newsuperior) or 'modify' (with mods, a
+list of [operation name, attribute, values]; see ldif.MOD_OP_INTEGER).
+Plans are written to disk and shown, so an add's attrs leave out
+jldap.mirror.SECRET_ATTRS; those are read from the user's entry on the
+origin environment when the plan is applied.
+"""
+import json
+from collections import OrderedDict
+import ldap.modlist
+import ldif
+import jldap.LDAP
+import jldap.groups
+import jldap.mirror
+from jldap.attdict import Attdict
+from jldap import fanout
+
+def _applied(entry, modlist):
+    ''' Copy of an entry with attribute-replacing modlist applied to it
+    '''
+    entry = Attdict(entry)
+    for _, attr, vals in modlist:
+        entry[attr] = vals
+    return entry
+
+def _encoded(data):
+    ''' Copy of data read from JSON with every string UTF-8 encoded, as
+        python-ldap only takes str
+    '''
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+    if isinstance(data, list):
+        return [_encoded(i) for i in data]
+    if isinstance(data, dict):
+        return OrderedDict((_encoded(i), _encoded(j)) for i, j in data.items())
+    return data
+
+def plan_user(ldap_conn, uid, prof, jira=None, move=False, source=None):
+    ''' The changes jldap.functions.apply_profile would make to uid on one
+        environment, found by reading only.
+        Returns (changes, entry) where entry is the user's entry as it will
+        stand once the changes are made.
+    '''
+    # pylint: disable=too-many-arguments
+    try:
+        entry = ldap_conn.get_user(uid)
+    except StopIteration:
+        entry = None
+    changes = []
+    if entry is None:
+        if source is None:
+            raise RuntimeError('%s not found. Please contact PLOPS.' % uid)
+        attrs = dict((i, j) for i, j in source.items()
+                     if i != 'dn' and i not in jldap.mirror.SECRET_ATTRS)
+        changes.append(Attdict(user=uid, dn=source.dn, op='add', attrs=attrs))
+        entry = Attdict(source)
+        memberships = {}
+        # the copy's description already carries the ticket
+        jira = None
+    else:
+        target = 'uid=%s,%s' % (uid, jldap.LDAP.USERS)
+        if move and (jldap.groups.normalize(entry.dn)
+                     != jldap.groups.normalize(target)):
+            changes.append(Attdict(user=uid,
+                                   dn=entry.dn,
+                                   op='modrdn',
+                                   newrdn='uid=%s' % uid,
+                                   newsuperior=jldap.LDAP.USERS))
+            entry = Attdict(entry, dn=target)
+        memberships = ldap_conn.memberships(entry)
+    for dn, modlist in jldap.LDAP.profile_modlists(entry, memberships, prof, jira):
+        changes.append(Attdict(user=uid,
+                               dn=dn,
+                               op='modify',
+                               mods=[[ldif.MOD_OP_STR[i], j, k]
+                                     for i, j, k in modlist]))
+        if dn == entry.dn:
+            entry = _applied(entry, modlist)
+    return changes, entry
+
+def apply_change(ldap_conn, change):
+    ''' Make a single planned change, writing only
+    '''
+    if change['op'] == 'add':
+        ldap_conn.add_entry(change['dn'], change['attrs'])
+    elif change['op'] == 'modrdn':
+        ldap_conn.rename(change['dn'],
+                         change['newrdn'],
+                         newsuperior=change['newsuperior'])
+    else:
+        ldap_conn.modify(change['dn'],
+                         [(ldif.MOD_OP_INTEGER[i], j, k)
+                          for i, j, k in change['mods']])
+
+class Plan(object):
+    ''' Ordered changes per environment for any number of users
+    '''
+    @classmethod
+    def load(cls, stream):
+        ''' Read a plan written by write_json
+        '''
+        data = _encoded(json.load(stream, object_pairs_hook=OrderedDict))
+        return cls(hosts=data['hosts'],
+                   changes=data['changes'],
+                   errors=data['errors'])
+
+    def __init__(self, hosts=None, changes=None, errors=None):
+        self._hosts = OrderedDict(hosts or {})
+        self._changes = OrderedDict(changes or {})
+        self._errors = OrderedDict(errors or {})
+    @property
+    def hosts(self):
+        ''' env:host for every environment in the plan
+        '''
+        return self._hosts
+    @property
+    def changes(self):
+        ''' env:list of changes, in the order they are to be made
+        '''
+        return self._changes
+    @property
+    def errors(self):
+        ''' uid:error for every user which could not be planned
+        '''
+        return self._errors
+    def add_user(self, conns, origin, uid, prof, jira=None, move=False):
+        ''' Plan uid on the origin environment, then on every other
+            environment (at once), the way jldap.functions.push_profile
+            would go about it. conns is env:LDAP or a jldap.pool.Pool.
+        '''
+        # pylint: disable=too-many-arguments
+        try:
+            with fanout.connection(conns, origin) as ldap_conn:
+                changes, source = plan_user(ldap_conn, uid, prof,
+                                            jira=jira, move=move)
+        # pylint: disable=no-member
+        except (RuntimeError, ldap.LDAPError) as err:
+            self._errors[uid] = '%s: %s' % (origin, err)
+            return
+        report = fanout.fan_out(lambda conn: plan_user(conn, uid, prof,
+                                                       jira=jira,
+                                                       move=move,
+                                                       source=source)[0],
+                                conns,
+                                envs=[env for env in fanout.environments(conns)
+                                      if env != origin])
+        if report.errors:
+            self._errors[uid] = '; '.join('%s: %s' % (env, err)
+                                          for env, err in report.errors.items())
+            return
+        planned = [(origin, changes)]
+        planned.extend((env, outcome.result) for env, outcome in report.items())
+        for env, env_changes in planned:
+            for change in env_changes:
+                if change.op == 'add':
+                    change.origin = origin
+            self._hosts[env] = fanout.host(conns, env)
+            self._changes.setdefault(env, []).extend(env_changes)
+    def dict(self):
+        ''' Plain dict version of the plan
+        '''
+        return OrderedDict([('hosts', self._hosts),
+                            ('changes', self._changes),
+                            ('errors', self._errors)])
+    def write_json(self, stream):
+        ''' Serialise the plan as JSON, which Plan.load reads back
+        '''
+        json.dump(self.dict(), stream, indent=2)
+        stream.write('\n')
+    def write_ldif(self, stream):
+        ''' Serialise the plan as LDIF change records (one section per
+            environment), e.g. for review or ldapmodify
+        '''
+        writer = ldif.LDIFWriter(stream)
+        for env, changes in self._changes.items():
+            stream.write('# environment: %s (%s)\n\n' % (env, self._hosts[env]))
+            for change in changes:
+                if change['op'] == 'modrdn':
+                    stream.write('dn: %s\nchangetype: modrdn\nnewrdn: %s\n'
+                                 'deleteoldrdn: 1\nnewsuperior: %s\n\n'
+                                 % (change['dn'],
+                                    change['newrdn'],
+                                    change['newsuperior']))
+                elif change['op'] == 'add':
+                    writer.unparse(change['dn'],
+                                   ldap.modlist.addModlist(change['attrs']))
+                else:
+                    writer.unparse(change['dn'],
+                                   [(ldif.MOD_OP_INTEGER[i], j, k)
+                                    for i, j, k in change['mods']])
+        for uid, err in self._errors.items():
+            stream.write('# not planned: %s: %s\n' % (uid, err))
+    def _secrets(self, conns):
+        ''' (origin, uid):SECRET_ATTRS of the user's origin entry, for
+            every user the plan adds somewhere
+        '''
+        secrets = {}
+        for changes in self._changes.values():
+            for change in changes:
+                if change['op'] != 'add':
+                    continue
+                key = (change['origin'], change['user'])
+                if key in secrets:
+                    continue
+                try:
+                    with fanout.connection(conns, key[0]) as ldap_conn:
+                        entry = ldap_conn.get_user(key[1])
+                except StopIteration:
+                    raise ValueError('Plan adds %s, who is no longer on %s'
+                                     % (key[1], key[0]))
+                secrets[key] = dict((i, entry[i])
+                                    for i in jldap.mirror.SECRET_ATTRS
+                                    if i in entry)
+        return secrets
+    def apply(self, conns, timeout=fanout.TIMEOUT):
+        ''' Make every planned change, every environment at once, reading
+            nothing but the password hashes of users to be added from their
+            origin environments. Returns a fanout.Report whose results are
+            the number of changes made per environment.
+            Raises ValueError, changing nothing, if conns lacks one of the
+            plan's environments or points it at another host than the plan
+            was made against, or a user to be added is gone from its origin.
+        '''
+        def apply_all(conn, changes):
+            ''' Make one environment's changes in order
+            '''
+            for change in changes:
+                apply_change(conn, change)
+            return len(changes)
+        known = fanout.environments(conns)
+        for env in self._changes:
+            if env not in known:
+                raise ValueError('Plan has changes for %s, which is not '
+                                 'configured' % env)
+            if fanout.host(conns, env) != self._hosts.get(env):
+                raise ValueError('Plan was made against %s for %s, which is '
+                                 'now %s' % (self._hosts.get(env),
+                                             env,
+                                             fanout.host(conns, env)))
+        secrets = self._secrets(conns)
+        work = {}
+        for env, changes in self._changes.items():
+            changes = [dict(i, attrs=dict(i['attrs'],
+                                          **secrets[(i['origin'], i['user'])]))
+                       if i['op'] == 'add' else i
+                       for i in changes]
+            work[env] = lambda conn, changes=changes: apply_all(conn, changes)
+        return fanout.fan_out(work,
+                              conns,
+                              timeout=timeout,
+                              envs=list(self._changes))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""pool module
+Thread-safe pool of bound LDAP connections shared across environments
+
+Example:
+    import jldap.config
+    import jldap.pool
+    pool = jldap.pool.Pool.from_config(jldap.config.Config(path))
+    with pool.connection('phx') as ldap_conn:
+        ldap_conn.user_search(uid)
+
+Attributes:
+	MAX_SIZE (int): Default cap on concurrent connections per server
+	MAX_IDLE (int): Default number of seconds an unused connection is kept
+            before being evicted
+	CHECK_AFTER (int): Seconds an idle connection may sit before it is
+            health-checked on checkout
+"""
+import contextlib
+import threading
+import time
+import ldap
+import jldap.LDAP
+import jldap.cache
+
+MAX_SIZE = 4
+MAX_IDLE = 300
+CHECK_AFTER = 30
+
+class PoolTimeout(Exception):
+    ''' Raised when no connection to a server frees up in time
+    '''
+    pass
+
+class _Server(object):
+    ''' Book-keeping for a single (host, bind dn, tls mode) key
+    '''
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.in_use = 0
+        self.idle = [] # (connection, time checked in), most recent last
+        self.cache = None
+
+class Pool(object):
+    ''' Keeps up to max_size bound jldap.LDAP.LDAP connections per server and
+        hands them out with checkout/checkin semantics
+    '''
+    # pylint: disable=too-many-instance-attributes
+    @classmethod
+    def from_config(cls, config, user=None, password=None, **kwargs):
+        ''' Create a pool for every environment in a config file
+            user/password override the credentials found in the config
+        '''
+        return cls(environments=config.environments,
+                   basedn=config.basedn,
+                   user=user or config.user,
+                   password=password or config.password,
+                   **kwargs)
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 environments=None,
+                 basedn=jldap.LDAP.BASE,
+                 user=None,
+                 password=None,
+                 max_size=MAX_SIZE,
+                 max_idle=MAX_IDLE,
+                 cache=False):
+        self._environments = dict(environments or {})
+        self._basedn = basedn
+        self._user = user
+        self._password = password
+        self._max_size = max_size
+        self._max_idle = max_idle
+        self._cache = cache
+        self._servers = {}
+        self._lock = threading.Lock()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    @property
+    def environments(self):
+        ''' The environments (name:fqdn) the pool knows about
+        '''
+        return self._environments
+    @property
+    def max_size(self):
+        ''' The maximum number of connections handed out per server
+        '''
+        return self._max_size
+    @property
+    def max_idle(self):
+        ''' Seconds an unused connection is kept before being evicted
+        '''
+        return self._max_idle
+    def host(self, env):
+        ''' Resolve an environment name to its host; hosts pass through
+        '''
+        return self._environments.get(env, env)
+    @property
+    def cache(self):
+        ''' Whether connections read through a jldap.cache.SearchCache, one
+            per server, shared by all of its connections
+        '''
+        return self._cache
+    def _server(self, key):
+        ''' Find or create the book-keeping for a key
+        '''
+        with self._lock:
+            if key not in self._servers:
+                self._servers[key] = _Server()
+                if self._cache:
+                    self._servers[key].cache = jldap.cache.SearchCache()
+            return self._servers[key]
+    def _evict(self, server):
+        ''' Close connections which have sat idle for too long
+            Caller must hold server.cond
+        '''
+        cutoff = time.time() - self._max_idle
+        while server.idle and server.idle[0][1] < cutoff:
+            server.idle.pop(0)[0].close()
+    def checkout(self, env, secure=False, timeout=None):
+        ''' Hand out a bound connection to an environment (or host), blocking
+            while max_size connections to that server are already out.
+            Raises PoolTimeout if none frees up within timeout seconds.
+            An idle connection which has sat for more than CHECK_AFTER
+            seconds is only handed out again if it still answers.
+        '''
+        host = self.host(env)
+        server = self._server((host, self._user, secure))
+        deadline = None if timeout is None else time.time() + timeout
+        with server.cond:
+            while server.in_use >= self._max_size:
+                if deadline is None:
+                    server.cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('No connection to %s freed up within '
+                                      '%ss' % (host, timeout))
+                server.cond.wait(remaining)
+            server.in_use += 1
+            self._evict(server)
+            conn, since = server.idle.pop() if server.idle else (None, None)
+        if conn is not None:
+            if time.time() - since <= CHECK_AFTER or conn.healthy():
+                return conn
+            conn.close()
+        conn = jldap.LDAP.LDAP(host,
+                               secure=secure,
+                               basedn=self._basedn,
+                               user=self._user,
+                               password=self._password,
+                               cache=server.cache)
+        try:
+            conn.open()
+        # pylint: disable=no-member
+        except ldap.LDAPError:
+            self._release(server)
+            raise
+        return conn
+    def checkin(self, conn, broken=False):
+        ''' Return a connection to the pool. Broken (or closed) connections
+            are dropped rather than handed out again.
+        '''
+        server = self._server((conn.host, conn.user, conn.secure))
+        if broken or conn.conn is None:
+            conn.close()
+            self._release(server)
+            return
+        with server.cond:
+            server.idle.append((conn, time.time()))
+            server.in_use -= 1
+            server.cond.notify()
+    def _release(self, server):
+        ''' Give up a checked out slot without keeping its connection
+        '''
+        with server.cond:
+            server.in_use -= 1
+            server.cond.notify()
+    @contextlib.contextmanager
+    def connection(self, env, secure=False, timeout=None):
+        ''' Context manager wrapping checkout/checkin. A connection which
+            raised an LDAP error is treated as broken.
+        '''
+        conn = self.checkout(env, secure=secure, timeout=timeout)
+        broken = False
+        try:
+            yield conn
+        # pylint: disable=no-member
+        except ldap.LDAPError:
+            broken = True
+            raise
+        finally:
+            self.checkin(conn, broken=broken)
+    def evict(self):
+        ''' Close idle-expired connections on every server
+        '''
+        with self._lock:
+            servers = self._servers.values()
+        for server in servers:
+            with server.cond:
+                self._evict(server)
+    def close(self):
+        ''' Close every idle connection
+        '''
+        with self._lock:
+            servers = self._servers.values()
+        for server in servers:
+            with server.cond:
+                while server.idle:
+                    server.idle.pop()[0].close()
@@ -4,19 +4,28 @@ Example:
     import jldap.profile
     prof = jldap.profile.Profile(path)
 
+    registry = jldap.profile.ProfileRegistry(path)
+    profiles = registry.profiles # parsed once, cached across runs
+    prof = registry['admin.yaml']
 
 Attributes:
 	PATTERN (str): Default pattern to match profile files against
 	PROFILE_KEYS (list): List of keys in profile (yaml) dict
+	GROUP_KEYS (list): Keys in PROFILE_KEYS which hold lists of group dns
+	CACHE_VERSION (int): Format of registry cache files; others are ignored
 	AUDIT_DICT (collections.OrderedDict): Order-dependent dictionary of
             results from auditing a user against a Profile
 """
 import functools
+import hashlib
 import re
 import os
+import cPickle as pickle
 from collections import OrderedDict
-import yaml
-from bs4 import BeautifulSoup
+import jldap.config
+import jldap.groups
+import jldap.report
+import jldap.yamlio
 
 PATTERN = r'\.yaml'
 PROFILE_KEYS = ['samba-group-sid',
@@ -25,6 +34,10 @@ PROFILE_KEYS = ['samba-group-sid',
                 'posix-group',
                 'group-of-unique-names',
                 'samba-group-mapping']
+GROUP_KEYS = ['posix-group',
+              'group-of-unique-names',
+              'samba-group-mapping']
+CACHE_VERSION = 1
 AUDIT_DICT = OrderedDict.fromkeys(['user',
                                    'name',
                                    'text',
@@ -45,69 +58,27 @@ def obtain(func):
         return func(self, *args, **kwargs)
     return wrapper
 
-# pylint: disable=too-many-locals
+def validate(prof_dict, prof=''):
+    ''' Raise ValueError unless prof_dict is a usable parsed profile
+    '''
+    if not isinstance(prof_dict, dict):
+        raise ValueError('Profile %s is not a mapping' % prof)
+    for key in GROUP_KEYS:
+        groups = prof_dict.get(key) or []
+        if (not isinstance(groups, list)
+                or not all(isinstance(i, basestring) for i in groups)):
+            raise ValueError('Profile %s: %s must be a list of group dns'
+                             % (prof, key))
+    for key in set(PROFILE_KEYS) - set(GROUP_KEYS):
+        if isinstance(prof_dict.get(key), (list, dict)):
+            raise ValueError('Profile %s: %s must be a single value'
+                             % (prof, key))
+
 def audits2html(audits):
     ''' Takes a dict of profile_name:audit_list and converts to an html table
+        (see jldap.report.write_audits to stream one instead)
     '''
-    soup = BeautifulSoup('', 'html5lib')
-    table = soup.new_tag('table')
-    table.attrs = {'style': 'border: 1px solid; border-width: 1px; border-color: #000000;'}
-    soup.append(table)
-
-    tbody = soup.new_tag('tbody')
-    table.append(tbody)
-    for name, audit_list in audits.items():
-        # Insert "heading" for profile name
-        table_row = soup.new_tag('tr')
-        table_row.attrs = {'style': 'background-color: #88bbff;'}
-        table_div = soup.new_tag('td')
-        table_div.attrs = {'colspan': '%s' % len(audit_list[0])}
-        table_div.string = ('Profile: %s, Owner: %s'
-                            % (name, audit_list[0].pop('owner')))
-        table_row.append(table_div)
-        tbody.append(table_row)
-        # Insert "heading" for notes
-        table_row = soup.new_tag('tr')
-        table_row.attrs = {'style': 'background-color: #dbdbdb;'}
-        table_div = soup.new_tag('td')
-        table_div.attrs = {'colspan': '%s' % len(audit_list[0])}
-        table_div.string = 'Notes/Changes Required'
-        table_row.append(table_div)
-        tbody.append(table_row)
-        # Insert row for notes
-        table_row = soup.new_tag('tr')
-        table_div = soup.new_tag('td')
-        table_div.attrs = {'colspan': '%s' % len(audit_list[0])}
-        table_div.string = '-'
-        table_row.append(table_div)
-        tbody.append(table_row)
-        # Insert heading for keys. User, text, diff, etc
-        table_row = soup.new_tag('tr')
-        table_row.attrs = {'style': 'background-color: #dbdbdb;'}
-        keys = audit_list[0].keys()[:-1] # we don't care about value at this point
-        for key in keys:
-            table_div = soup.new_tag('td')
-            table_div.string = key
-            table_row.append(table_div)
-        tbody.append(table_row)
-        # Insert each audit
-        for audit in audit_list:
-            table_row = soup.new_tag('tr')
-            tbody.append(table_row)
-            for key in keys:
-                table_div = soup.new_tag('td')
-                table_row.append(table_div)
-                pre = soup.new_tag('pre')
-                table_div.append(pre)
-                yml_stable_rowing = yaml.dump(audit[key], default_flow_style=False)
-                for line in yml_stable_rowing.split('\n'):
-                    # shitty hack because yaml.dump() serializes simple stable_rowings
-                    # with an extable_rowa '\n...\n'
-                    if not line == '...':
-                        paragraph = soup.new_tag('p')
-                        paragraph.string = line
-                        pre.append(paragraph)
-    return str(soup)
+    return jldap.report.audits2html(audits)
 
 class Profile(object):
     ''' Abstraction of profile yaml files, provides ability to audit an LDAP
@@ -126,6 +97,15 @@ class Profile(object):
         self._posix_group = []
         self._group_of_unique_names = []
         self._samba_group_mapping = []
+        self._permissions = None
+
+    @classmethod
+    def from_dict(cls, prof, prof_dict):
+        ''' A profile for the file prof from its already-parsed yaml dict
+        '''
+        retval = cls(prof)
+        retval.load(prof_dict)
+        return retval
 
     @classmethod
     def from_directory(cls, path, pattern=PATTERN):
@@ -225,6 +205,27 @@ class Profile(object):
         ''' The samba-group-mapping, allows LDAP resolution in Windowsland
         '''
         return self._samba_group_mapping
+    @property
+    @obtain
+    def permissions(self):
+        ''' Every group in the profile, as a frozenset, computed once
+        '''
+        if self._permissions is None:
+            self._permissions = frozenset(self.posix_group +
+                                          self.group_of_unique_names +
+                                          self.samba_group_mapping)
+        return self._permissions
+    @property
+    @obtain
+    def normalized_permissions(self):
+        ''' permissions, dn-normalised (see jldap.groups.normalize)
+        '''
+        return frozenset(jldap.groups.normalize(i) for i in self.permissions)
+    @property
+    def path(self):
+        ''' The profile's yaml file
+        '''
+        return self._prof_file
     @obtain
     def keys(self):
         ''' Return underlying dictionary keys
@@ -243,7 +244,13 @@ class Profile(object):
         ''' Read the profile and obtain the values
         '''
         with open(self._prof_file, 'r') as yml:
-            self._prof_dict = yaml.load(yml)
+            self.load(jldap.yamlio.load(yml))
+
+    def load(self, prof_dict):
+        ''' Obtain the values from a parsed profile
+        '''
+        self._prof_dict = prof_dict
+        self._permissions = None
         for i in PROFILE_KEYS:
             try:
                 attr = '_' + i.replace('-', '_')
@@ -256,7 +263,7 @@ class Profile(object):
 
     @obtain
     def __str__(self):
-        return yaml.dump(self._prof_dict, default_flow_style=False)
+        return jldap.yamlio.dump(self._prof_dict)
 
     @obtain
     def audit(self, user, explicit=False, ignore_inherited=False):
@@ -268,22 +275,8 @@ class Profile(object):
                     permissions, e.g., membership in a group which is a parent
                     of a group in the profile
         '''
-        def flatten(items, seqtypes=(list, tuple)):
-            ''' Flatten permissions so we can turn into set
-            '''
-            for i, _ in enumerate(items):
-                while i < len(items) and isinstance(items[i], seqtypes):
-                    items[i:i+1] = items[i] # slice assignment is magic
-            return items
-        if ignore_inherited:
-            user_perms = set([perm for val in user.values()
-                              for perm in val
-                              if not isinstance(perm, list)])
-        else:
-            user_perms = set(flatten(user.values()))
-        profile_perms = set(self.posix_group +
-                            self.group_of_unique_names +
-                            self.samba_group_mapping)
+        user_perms = user.permissions(ignore_inherited=ignore_inherited)
+        profile_perms = self.permissions
         audict = OrderedDict()
         for key, val in AUDIT_DICT.items():
             audict[key] = val
@@ -313,3 +306,93 @@ class Profile(object):
                 audict['diff']['extra'] = list(user_perms - profile_perms)
                 audict['diff']['missing'] = list(profile_perms - user_perms)
         return audict
+
+class ProfileRegistry(object):
+    ''' Every profile in a directory, parsed and validated once. Parsed
+        profiles are cached on disk keyed by file mtime and size, so only
+        new or changed files are ever parsed again.
+    '''
+    def __init__(self, path, pattern=PATTERN, cache=None):
+        ''' cache is the cache file (default: one per directory under
+            jldap.config.STATE_DIR); False disables caching
+        '''
+        self._path = path
+        self._pattern = pattern
+        if cache is None:
+            cache = os.path.join(jldap.config.STATE_DIR,
+                                 'profiles-%s.pickle'
+                                 % hashlib.sha1(os.path.abspath(path)).hexdigest())
+        self._cache = cache
+        self._profiles = OrderedDict()
+        self._parsed = 0
+        self.reload()
+    def __len__(self):
+        return len(self._profiles)
+    def __iter__(self):
+        return iter(self._profiles.values())
+    def __contains__(self, name):
+        return name in self._profiles
+    def __getitem__(self, name):
+        ''' A profile by file name, e.g. 'admin.yaml'
+        '''
+        return self._profiles[name]
+    @property
+    def profiles(self):
+        ''' Every profile, in Profile.from_directory order
+        '''
+        return self._profiles.values()
+    @property
+    def parsed(self):
+        ''' How many files the last (re)load had to parse
+        '''
+        return self._parsed
+    def _read_cache(self):
+        ''' path:(mtime, size, parsed dict) from the cache file
+        '''
+        if not self._cache:
+            return {}
+        try:
+            with open(self._cache, 'rb') as stream:
+                version, entries = pickle.load(stream)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return {}
+        return entries if version == CACHE_VERSION else {}
+    def _write_cache(self, entries):
+        ''' Replace the cache file; failing to is not an error
+        '''
+        if not self._cache:
+            return
+        try:
+            directory = os.path.dirname(self._cache)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp = '%s.%s.tmp' % (self._cache, os.getpid())
+            with open(tmp, 'wb') as stream:
+                pickle.dump((CACHE_VERSION, entries), stream,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self._cache)
+        except (IOError, OSError):
+            pass
+    def reload(self):
+        ''' Pick up added, changed and removed profile files, parsing only
+            files whose mtime or size differ from the cache
+        '''
+        cached = self._read_cache()
+        entries = {}
+        profiles = OrderedDict()
+        self._parsed = 0
+        for prof in Profile.from_directory(self._path, self._pattern):
+            stat = os.stat(prof.path)
+            key = (stat.st_mtime, stat.st_size)
+            if prof.path in cached and cached[prof.path][:2] == key:
+                prof_dict = cached[prof.path][2]
+            else:
+                with open(prof.path, 'r') as yml:
+                    prof_dict = jldap.yamlio.load(yml)
+                validate(prof_dict, prof.path)
+                self._parsed += 1
+            entries[prof.path] = key + (prof_dict,)
+            profiles[prof.name] = Profile.from_dict(prof.path, prof_dict)
+        self._profiles = profiles
+        if entries != cached:
+            self._write_cache(entries)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""report module
+HTML tables written a row at a time
+
+Example:
+    import sys
+    import jldap.report
+    table = jldap.report.HTMLTable(sys.stdout, headings=['Name', 'Permissions'])
+    table.row([jldap.report.text(name), jldap.report.pre(permissions)])
+    table.close()
+
+    jldap.report.write_audits(sys.stdout, audits)
+
+Nothing but the row being written is held in memory, so reports of any size
+can be piped out while they are still being produced.
+
+Attributes:
+	TABLE_STYLE (str): Style of every table
+	PROFILE_STYLE (str): Style of profile heading rows
+	HEADING_STYLE (str): Style of column heading rows
+	PREAMBLE (str): Written ahead of every table (what the html5lib tree
+            builder used to emit)
+"""
+import cgi
+from StringIO import StringIO
+import jldap.yamlio
+
+TABLE_STYLE = 'border: 1px solid; border-width: 1px; border-color: #000000;'
+PROFILE_STYLE = 'background-color: #88bbff;'
+HEADING_STYLE = 'background-color: #dbdbdb;'
+PREAMBLE = '<html><head></head><body></body></html>'
+
+def text(value):
+    ''' Escaped cell text; None is empty
+    '''
+    return '' if value is None else cgi.escape('%s' % value)
+
+def pre(value):
+    ''' A value dumped as yaml, one <p> per line, in a <pre>
+    '''
+    lines = jldap.yamlio.dump(value).split('\n')
+    # the pure-python dumper ends simple scalars with an extra '\n...\n'
+    return '<pre>%s</pre>' % ''.join('<p>%s</p>' % text(i)
+                                     for i in lines
+                                     if i != '...')
+
+def _attrs(attrs):
+    ''' Render tag attributes in a stable order
+    '''
+    return ''.join(' %s="%s"' % (i, cgi.escape('%s' % j, quote=True))
+                   for i, j in sorted(attrs.items())
+                   if j is not None)
+
+class HTMLTable(object):
+    ''' A table written to a stream as it is built
+    '''
+    def __init__(self, stream, headings=None):
+        ''' Writes the table's opening (and thead, given headings) right away
+        '''
+        self._stream = stream
+        self._closed = False
+        stream.write('%s<table%s>' % (PREAMBLE, _attrs({'style': TABLE_STYLE})))
+        if headings:
+            stream.write('<thead%s><tr>%s</tr></thead>'
+                         % (_attrs({'style': HEADING_STYLE}),
+                            ''.join('<th>%s</th>' % text(i) for i in headings)))
+        stream.write('<tbody>')
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def row(self, cells, style=None, colspan=None):
+        ''' Write a row of cells (html fragments, see text and pre)
+        '''
+        self._stream.write('<tr%s>%s</tr>'
+                           % (_attrs({'style': style}),
+                              ''.join('<td%s>%s</td>'
+                                      % (_attrs({'colspan': colspan}), i)
+                                      for i in cells)))
+        self._stream.flush()
+    def close(self):
+        ''' Finish the table
+        '''
+        if not self._closed:
+            self._stream.write('</tbody></table>')
+            self._stream.flush()
+            self._closed = True
+
+def _audit_heading(table, name, audit):
+    ''' Write the heading, notes and column rows of a profile's audits.
+        Returns the keys of the columns.
+    '''
+    first = audit.copy()
+    owner = first.pop('owner')
+    table.row([text('Profile: %s, Owner: %s' % (name, owner))],
+              style=PROFILE_STYLE,
+              colspan=len(audit))
+    table.row([text('Notes/Changes Required')],
+              style=HEADING_STYLE,
+              colspan=len(first))
+    table.row(['-'], colspan=len(first))
+    keys = first.keys()[:-1] # we don't care about value at this point
+    table.row([text(i) for i in keys], style=HEADING_STYLE)
+    return keys
+
+def write_audits(stream, audits):
+    ''' Write a dict of profile_name:audit_list, or (profile_name, audit)
+        pairs, as an html table: per profile, a heading, a notes row and a
+        row per audit. Pairs are written as they come, each run of audits
+        of one profile under one heading.
+    '''
+    if isinstance(audits, dict):
+        audits = ((name, i) for name, audit_list in audits.items()
+                  for i in audit_list)
+    with HTMLTable(stream) as table:
+        current = keys = None
+        for name, audit in audits:
+            if keys is None or name != current:
+                keys = _audit_heading(table, name, audit)
+                current = name
+            table.row([pre(audit[i]) for i in keys])
+
+def audits2html(audits):
+    ''' write_audits, to a string
+    '''
+    stream = StringIO()
+    write_audits(stream, audits)
+    return stream.getvalue()
@@ -8,6 +8,7 @@ Example:
     result = ldap_conn.search(**search_dict)
     results = jldap.userdict.Userdict(name=user)
     results[ldap_conn.host] = [i.dn for i in result]
+    results.permissions() # every group dn, flattened and cached
 
 Todo:
     * Make initialization not suck
@@ -21,6 +22,7 @@ class Userdict(object):
                              if permissions
                              else {})
         self._found = True if permissions else False
+        self._flat = {}
     @property
     def name(self):
         ''' The name of the user that was searched
@@ -59,6 +61,27 @@ class Userdict(object):
         dict_repr = {'name': self.name,
                      'permissions': self._permissions}
         return dict_repr
+    def permissions(self, ignore_inherited=False):
+        ''' Every group dn in the internal dictionary as a frozenset, nested
+            lists (inherited, parent groups) included unless ignore_inherited
+            Computed once, in linear time, and cached until the dictionary is
+            next assigned to; the value lists are never modified.
+        '''
+        if ignore_inherited not in self._flat:
+            perms = set()
+            for val in self._permissions.values():
+                if ignore_inherited:
+                    perms.update(i for i in val if not isinstance(i, list))
+                    continue
+                stack = [val]
+                while stack:
+                    for i in stack.pop():
+                        if isinstance(i, (list, tuple)):
+                            stack.append(i)
+                        else:
+                            perms.add(i)
+            self._flat[ignore_inherited] = frozenset(perms)
+        return self._flat[ignore_inherited]
     def values(self):
         ''' Values from internal dictionary
         '''
@@ -72,6 +95,7 @@ class Userdict(object):
             Update found status once internal dictionary has data
         '''
         self._permissions.update(dictionary)
+        self._flat = {}
         self._found = True
     def __getitem__(self, k):
         ''' Mock dictionary behavior
@@ -83,8 +107,10 @@ class Userdict(object):
             empty)
         '''
         self._permissions[key] = val
+        self._flat = {}
         self._found = self._found or bool(val)
     def __delitem__(self, key):
         ''' Mock dictionary behavior
         '''
+        self._flat = {}
         return self._permissions.pop(key)
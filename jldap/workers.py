@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""workers module
+Audit a whole directory across a pool of worker processes
+
+Example:
+    import jldap.workers
+    connect = {'host': host, 'user': user, 'password': password}
+    for name, the_audit in jldap.workers.audit_users(uids,
+                                                     connect,
+                                                     profile_dir,
+                                                     workers=8):
+        audits[name].append(the_audit)
+
+Each worker process binds its own LDAP connection (or, given a
+groups.GroupGraph snapshot, shares that read-only and binds nothing) and
+parses its own profiles, once, when it starts.
+
+Attributes:
+	CHUNK_SIZE (int): Default number of uids handed to a worker at a time
+"""
+import multiprocessing
+import jldap.LDAP
+import jldap.matching
+import jldap.profile
+
+CHUNK_SIZE = 50
+
+# per-process state, set up by _init in each worker
+_WORKER = {}
+
+def audit_user(source, matcher, uid):
+    ''' Audit one uid found in LDAP against the best matching profile.
+        source is anything with a user_search method (an LDAP connection or
+        a groups.GroupGraph). Returns (profile name, audit).
+    '''
+    usearch = source.user_search(uid)
+    usearch.found = True # set this explicitly since we obtained the list
+                          # of users from LDAP
+    the_audit = matcher.audit(usearch)
+    return the_audit.pop('name'), the_audit
+
+def _init(connect, profile_dir, ignore_inherited, explicit, snapshot):
+    ''' Worker process initializer
+    '''
+    # pylint: disable=too-many-arguments
+    _WORKER['source'] = (snapshot
+                         if snapshot is not None
+                         else jldap.LDAP.LDAP(**connect))
+    profiles = jldap.profile.ProfileRegistry(profile_dir).profiles
+    _WORKER['matcher'] = jldap.matching.Matcher(profiles,
+                                                ignore_inherited=ignore_inherited,
+                                                explicit=explicit)
+
+def _audit(uid):
+    ''' Worker process task
+    '''
+    return audit_user(_WORKER['source'], _WORKER['matcher'], uid)
+
+def audit_users(uids,
+                connect,
+                profile_dir,
+                workers=None,
+                ignore_inherited=False,
+                explicit=False,
+                snapshot=None,
+                chunksize=CHUNK_SIZE):
+    ''' Generate (profile name, audit) for every uid, in the order given,
+        auditing up to workers (default: one per cpu) uids at once.
+        connect holds the keyword arguments for each worker's
+        jldap.LDAP.LDAP; snapshot, if given, is used instead.
+    '''
+    # pylint: disable=too-many-arguments
+    pool = multiprocessing.Pool(workers,
+                                initializer=_init,
+                                initargs=(connect,
+                                          profile_dir,
+                                          ignore_inherited,
+                                          explicit,
+                                          snapshot))
+    try:
+        for result in pool.imap(_audit, uids, chunksize):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
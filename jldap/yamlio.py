@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""yamlio module
+YAML reading and writing, through libyaml when PyYAML was built with it
+
+Example:
+    import jldap.yamlio
+    with open(path, 'r') as yml:
+        data = jldap.yamlio.load(yml)
+    print jldap.yamlio.dump(audits)
+
+Only the safe subset of YAML is read. Everything we write is plain YAML
+as well: OrderedDicts are written as mappings in their own order, other
+dict types (defaultdict, Attdict, ...) and Userdicts as sorted mappings,
+tuples as lists and sets as sorted lists, rather than as python/object tags.
+
+Attributes:
+	LIBYAML (bool): Whether the C loader and dumper are in use
+"""
+from collections import OrderedDict
+import yaml
+import jldap.userdict
+
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
+    LIBYAML = False
+
+class Loader(_SafeLoader):
+    ''' Safe loader, C-accelerated if possible
+    '''
+    # pylint: disable=too-few-public-methods
+    pass
+
+class Dumper(_SafeDumper):
+    ''' Safe dumper, C-accelerated if possible, which knows our types
+    '''
+    # pylint: disable=too-few-public-methods
+    pass
+
+def _represent_ordered(dumper, data):
+    ''' OrderedDicts keep their order
+    '''
+    return dumper.represent_mapping('tag:yaml.org,2002:map', data.items())
+
+def _represent_set(dumper, data):
+    ''' sets and frozensets as sorted lists
+    '''
+    return dumper.represent_list(sorted(data))
+
+def _represent_userdict(dumper, data):
+    ''' Userdicts as their dict() form
+    '''
+    return dumper.represent_dict(data.dict())
+
+Dumper.add_multi_representer(OrderedDict, _represent_ordered)
+Dumper.add_multi_representer(dict, Dumper.represent_dict)
+Dumper.add_representer(tuple, Dumper.represent_list)
+Dumper.add_representer(set, _represent_set)
+Dumper.add_representer(frozenset, _represent_set)
+Dumper.add_representer(jldap.userdict.Userdict, _represent_userdict)
+
+def load(stream):
+    ''' Parse a yaml document from a string or file
+    '''
+    return yaml.load(stream, Loader=Loader)
+
+def dump(data, stream=None, **kwargs):
+    ''' Write data as block-style yaml to stream, or return it as a string
+    '''
+    kwargs.setdefault('default_flow_style', False)
+    return yaml.dump(data, stream, Dumper=Dumper, **kwargs)
@@ -4,4 +4,17 @@ __all__ = ['test_config',
            'test_userdict',
            'test_attdict',
            'test_profile',
-           'test_jive']
+           'test_jive',
+           'test_ldap',
+           'test_pool',
+           'test_groups',
+           'test_fanout',
+           'test_functions',
+           'test_plan',
+           'test_matching',
+           'test_workers',
+           'test_incremental',
+           'test_report',
+           'test_yamlio',
+           'test_cache',
+           'test_mirror']
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Tests the search cache
+
+Example:
+    import unittest
+    suite = test_cache.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import unittest
+import mock
+from jldap import LDAP
+from jldap import cache
+from jldap import groups
+
+HOST = 'ldap.example.com'
+USER_DN = 'uid=flolrus,%s' % LDAP.USERS
+DOCKER = 'cn=docker,ou=roles,ou=groups,%s' % LDAP.BASE
+
+class Clock(object):
+    ''' A clock which only moves when told to
+    '''
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.now = 0
+    def __call__(self):
+        return self.now
+
+class SearchCacheTestCase(unittest.TestCase):
+    ''' Test cases for jldap.cache.SearchCache
+    '''
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = cache.SearchCache(ttl=10, max_entries=2, clock=self.clock)
+    def test_copies(self):
+        ''' Test that what comes out can't change what is cached
+        '''
+        self.cache.put(LDAP.USERS, 'a', [(USER_DN, {'uid': ['flolrus']})])
+        self.cache.get('a')[0][1]['uid'].append('other')
+        self.assertEqual(self.cache.get('a'), [(USER_DN, {'uid': ['flolrus']})])
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 0, 'entries': 1})
+    def test_ttl(self):
+        ''' Test that results expire
+        '''
+        self.cache.put(LDAP.USERS, 'a', [])
+        self.clock.now = 9
+        self.assertEqual(self.cache.get('a'), [])
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+    def test_lru(self):
+        ''' Test that the least recently used result goes first
+        '''
+        self.cache.put(LDAP.USERS, 'a', [])
+        self.cache.put(LDAP.USERS, 'b', [])
+        self.cache.get('a')
+        self.cache.put(LDAP.USERS, 'c', [])
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), [])
+        self.assertEqual(self.cache.get('c'), [])
+    def test_invalidate(self):
+        ''' Test that only searches over or under a written dn are dropped
+        '''
+        self.cache = cache.SearchCache()
+        self.cache.put(LDAP.BASE, 'base', [])
+        self.cache.put(LDAP.USERS, 'users', [])
+        self.cache.put(USER_DN, 'user', [])
+        self.cache.put(DOCKER, 'docker', [])
+        self.cache.invalidate('UID=flolrus, ou=users,dc=example,dc=com')
+        self.assertEqual(sorted(self.cache._entries), ['docker']) # pylint: disable=protected-access
+        self.assertTrue(cache.related(groups.normalize(DOCKER), 'dc=example,dc=com'))
+        self.assertFalse(cache.related('uid=flo,ou=users', 'uid=flolrus,ou=users'))
+
+class CachedLDAPTestCase(unittest.TestCase):
+    ''' Test cases for jldap.LDAP.LDAP reading through a SearchCache
+    '''
+    def setUp(self):
+        patcher = mock.patch('jldap.LDAP.ldap.initialize')
+        self.conn = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.conn.search_s.side_effect = lambda *args, **kwargs: [
+            (USER_DN, {'uid': ['flolrus']})]
+        self.ldap = LDAP.LDAP(HOST, cache=cache.SearchCache())
+    def test_repeat_reads(self):
+        ''' Test that repeated lookups are only made once
+        '''
+        first = self.ldap.get_user('flolrus')
+        first.uid.append('other')
+        self.assertEqual(self.ldap.get_user('flolrus').uid, ['flolrus'])
+        self.assertEqual(self.ldap.get_user('flolrus').dn, USER_DN)
+        self.assertEqual(self.conn.search_s.call_count, 1)
+        self.ldap.get_user('flolrus', basedn=LDAP.USERS)
+        self.assertEqual(self.conn.search_s.call_count, 2)
+    def test_writes(self):
+        ''' Test that writes drop what they could have changed
+        '''
+        self.ldap.get_user('flolrus')
+        self.ldap.modify(USER_DN, [])
+        self.ldap.get_user('flolrus')
+        self.assertEqual(self.conn.search_s.call_count, 2)
+        self.ldap.rename(USER_DN, 'uid=flolrus', newsuperior=LDAP.DISABLED)
+        self.ldap.get_user('flolrus')
+        self.assertEqual(self.conn.search_s.call_count, 3)
+    def test_written(self):
+        ''' Test working out which dns a write touches
+        '''
+        self.assertEqual(LDAP.written('modify_s', USER_DN, []), [USER_DN])
+        self.assertEqual(LDAP.written('rename_s', USER_DN, 'uid=flo'),
+                         [USER_DN, 'uid=flo,%s' % LDAP.USERS])
+        self.assertEqual(LDAP.written('rename_s', USER_DN, 'uid=flolrus',
+                                      newsuperior=LDAP.DISABLED),
+                         [USER_DN, 'uid=flolrus,%s' % LDAP.DISABLED])
+    def test_uncached(self):
+        ''' Test that without a cache every search goes to the server
+        '''
+        self.ldap.cache = None
+        self.ldap.get_user('flolrus')
+        self.ldap.get_user('flolrus')
+        self.assertEqual(self.conn.search_s.call_count, 2)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [SearchCacheTestCase, CachedLDAPTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
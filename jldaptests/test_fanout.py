@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Tests LDAP fan-out
+
+Example:
+    import unittest
+    suite = test_fanout.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import time
+import unittest
+from collections import OrderedDict
+import mock
+from jldap import fanout, pool
+
+class Conn(object):
+    ''' Stand-in connection to host which takes delay seconds to answer
+    '''
+    # pylint: disable=too-few-public-methods
+    def __init__(self, host, delay):
+        self.host = host
+        self.delay = delay
+        self.closed = False
+    def close(self):
+        ''' Note that the connection was closed
+        '''
+        self.closed = True
+
+def work(conn):
+    ''' Pretend to talk to conn.host for conn.delay seconds
+    '''
+    time.sleep(max(conn.delay, 0))
+    if conn.delay < 0:
+        raise RuntimeError('no such host')
+    return conn.host.upper()
+
+class FanoutTestCase(unittest.TestCase):
+    ''' Test cases for jldap.fanout
+    '''
+    def setUp(self):
+        ''' Set up for testing
+        '''
+        self.conns = OrderedDict([('qa', Conn('qa.example.com', 0.2)),
+                                  ('jcint', Conn('jcint.example.com', 0.2)),
+                                  ('jcadev', Conn('jcadev.example.com', 0.2))])
+    def test_results(self):
+        ''' Test that every environment's result is reported, in order
+        '''
+        report = fanout.fan_out(work, self.conns)
+        self.assertEqual(report.keys(), self.conns.keys())
+        self.assertEqual(report['qa'].result, 'QA.EXAMPLE.COM')
+        self.assertEqual(report['qa'].host, 'qa.example.com')
+        self.assertEqual(report.errors, {})
+    def test_concurrent(self):
+        ''' Test that hosts are worked on at once rather than in turn
+        '''
+        start = time.time()
+        fanout.fan_out(work, self.conns)
+        self.assertTrue(time.time() - start < 0.5)
+    def test_errors(self):
+        ''' Test that an exception is reported for its environment only
+        '''
+        self.conns['qa'] = Conn('qa.example.com', -1)
+        report = fanout.fan_out(work, self.conns)
+        self.assertEqual(report.errors.keys(), ['qa'])
+        self.assertTrue('no such host' in report['qa'].error)
+        self.assertEqual(report['jcint'].result, 'JCINT.EXAMPLE.COM')
+    def test_timeout(self):
+        ''' Test that a slow host is reported as timed out
+        '''
+        self.conns['qa'] = Conn('qa.example.com', 1)
+        report = fanout.fan_out(work, self.conns, timeout=0.5)
+        self.assertTrue('Timed out' in report['qa'].error)
+        self.assertIsNone(report['qa'].result)
+        self.assertEqual(report['jcint'].result, 'JCINT.EXAMPLE.COM')
+    def test_timed_out_result_dropped(self):
+        ''' Test that a thread finishing after its deadline doesn't change
+            the report
+        '''
+        slow = Conn('qa.example.com', 0.6)
+        self.conns['qa'] = slow
+        report = fanout.fan_out(work, self.conns, timeout=0.35)
+        time.sleep(0.5)
+        self.assertTrue('Timed out' in report['qa'].error)
+        self.assertIsNone(report['qa'].result)
+        self.assertIsNone(report['qa'].elapsed)
+    def test_timed_out_conn_dropped(self):
+        ''' Test that a timed out connection is taken out of conns and
+            closed once its thread is done
+        '''
+        slow = Conn('qa.example.com', 0.6)
+        self.conns['qa'] = slow
+        fanout.fan_out(work, self.conns, timeout=0.35)
+        self.assertEqual(self.conns.keys(), ['jcint', 'jcadev'])
+        self.assertFalse(slow.closed)
+        time.sleep(0.5)
+        self.assertTrue(slow.closed)
+        self.assertFalse(self.conns['jcint'].closed)
+    def test_per_host_deadline(self):
+        ''' Test that each host gets the whole timeout from its own start
+        '''
+        report = fanout.fan_out(work, self.conns, timeout=0.3)
+        self.assertEqual(report.errors, {})
+    def test_per_env_func(self):
+        ''' Test that env:func does different work per environment
+        '''
+        report = fanout.fan_out({'qa': lambda conn: 1, 'jcint': lambda conn: 2},
+                                self.conns,
+                                envs=['qa', 'jcint'])
+        self.assertEqual(report.keys(), ['qa', 'jcint'])
+        self.assertEqual([i.result for i in report.values()], [1, 2])
+    def test_dict(self):
+        ''' Test the plain dict version of a report
+        '''
+        report = fanout.fan_out(work, self.conns)
+        self.assertEqual(report.dict()['qa']['result'], 'QA.EXAMPLE.COM')
+
+class PooledFanoutTestCase(unittest.TestCase):
+    ''' Test cases for jldap.fanout over a jldap.pool.Pool
+    '''
+    def setUp(self):
+        ''' Patch out ldap.initialize so no real connections are made
+        '''
+        patcher = mock.patch('jldap.LDAP.ldap.initialize')
+        self.initialize = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.initialize.side_effect = lambda uri: mock.MagicMock()
+        self.pool = pool.Pool(environments={'qa': 'qa.example.com',
+                                            'jcint': 'jcint.example.com'})
+    def test_results(self):
+        ''' Test that every environment gets a connection to its own host
+        '''
+        report = fanout.fan_out(lambda conn: conn.host, self.pool)
+        self.assertEqual(report.keys(), ['jcint', 'qa'])
+        self.assertEqual(report['qa'].result, 'qa.example.com')
+        self.assertEqual(report['qa'].host, 'qa.example.com')
+    def test_reused(self):
+        ''' Test that connections go back in the pool for the next fan-out
+        '''
+        first = fanout.fan_out(lambda conn: conn, self.pool, envs=['qa'])
+        second = fanout.fan_out(lambda conn: conn, self.pool, envs=['qa'])
+        self.assertIs(first['qa'].result, second['qa'].result)
+        self.assertEqual(self.initialize.call_count, 1)
+    def test_broken(self):
+        ''' Test that a connection which raised an LDAP error isn't reused
+        '''
+        def fail(conn):
+            ''' Remember conn, then fail
+            '''
+            seen.append(conn)
+            raise fanout.ldap.LDAPError()
+        seen = []
+        report = fanout.fan_out(fail, self.pool, envs=['qa'])
+        self.assertTrue('LDAPError' in report['qa'].error)
+        again = fanout.fan_out(lambda conn: conn, self.pool, envs=['qa'])
+        self.assertIsNot(again['qa'].result, seen[0])
+    def test_timed_out_not_reused(self):
+        ''' Test that a timed out connection isn't handed to the next
+            fan-out, even while its thread is still at work
+        '''
+        def slow(conn):
+            ''' Remember conn, and take a while
+            '''
+            seen.append(conn)
+            time.sleep(0.3)
+        seen = []
+        report = fanout.fan_out(slow, self.pool, envs=['qa'], timeout=0.1)
+        self.assertTrue('Timed out' in report['qa'].error)
+        again = fanout.fan_out(lambda conn: conn, self.pool, envs=['qa'])
+        self.assertIsNot(again['qa'].result, seen[0])
+        time.sleep(0.4)
+        self.assertIsNone(seen[0].conn) # closed once its thread was done
+        third = fanout.fan_out(lambda conn: conn, self.pool, envs=['qa'])
+        self.assertIsNot(third['qa'].result, seen[0])
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [FanoutTestCase, PooledFanoutTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
@@ -3,19 +3,212 @@
 
 Example:
     import unittest
-    suite = test_jive.suite()
+    suite = test_functions.suite()
     unittest.TextTestRunner().run(suite)
 
 """
+import os
+import shutil
+import tempfile
 import unittest
-from collections import namedtuple
+from StringIO import StringIO
+from collections import OrderedDict
 import mock
 from jldap import functions
+from jldap import LDAP
+from jldap import userdict
+from jldaptests.test_ldap import make_profile, make_user
 
 class FunctionsTestCase(unittest.TestCase):
     ''' Test cases for jldap.functions
-        TODO: write some tests
     '''
+    def setUp(self):
+        ''' Set up a mock LDAP connection and profile
+        '''
+        self.ldap = mock.Mock(host='qa.example.com')
+        self.ldap.user_search.return_value = userdict.Userdict(
+            name='flolrus', permissions={'memberUid': ['cn=a,dc=example,dc=com']})
+        self.prof = mock.Mock()
+        self.prof.audit.return_value = {'text': 'Profile match', 'diff': []}
+    def test_prof_file(self):
+        ''' Test that a missing yaml extension is added
+        '''
+        self.assertEqual(functions.prof_file('admin'), 'admin.yaml')
+        self.assertEqual(functions.prof_file('admin.yml'), 'admin.yml')
+    def test_find_user_missing(self):
+        ''' Test that find_user turns StopIteration into None
+        '''
+        self.ldap.get_user.side_effect = StopIteration
+        self.assertIsNone(functions.find_user(self.ldap, 'flolrus'))
+    def test_apply_existing(self):
+        ''' Test that an existing user is moved and given the profile
+        '''
+        result = functions.apply_profile(self.ldap, 'flolrus', self.prof,
+                                         jira='JIRA-1', move=True)
+        self.ldap.move_user.assert_called_once_with('flolrus',
+                                                    functions.LDAP.USERS)
+        self.ldap.enforce_profile.assert_called_once_with('flolrus',
+                                                          self.prof,
+                                                          'JIRA-1')
+        self.assertFalse(self.ldap.add_object.called)
+        self.assertEqual(result['user']['name'], 'flolrus')
+    def test_apply_missing(self):
+        ''' Test that a missing user is copied from the origin object and
+            still given the profile
+        '''
+        self.ldap.get_user.side_effect = [StopIteration, {'uid': ['flolrus']}]
+        functions.apply_profile(self.ldap, 'flolrus', self.prof,
+                                source={'uid': ['flolrus']})
+        self.ldap.add_object.assert_called_once_with({'uid': ['flolrus']},
+                                                     ignore_attrs=['dn'])
+        self.assertFalse(self.ldap.move_user.called)
+        self.assertTrue(self.ldap.enforce_profile.called)
+    def test_apply_add_failed(self):
+        ''' Test that a user which cannot be added is an error
+        '''
+        self.ldap.get_user.side_effect = StopIteration
+        with self.assertRaises(RuntimeError):
+            functions.apply_profile(self.ldap, 'flolrus', self.prof, source={})
+    def test_apply_missing_without_source(self):
+        ''' Test that a missing user without a source entry is an error
+        '''
+        self.ldap.get_user.side_effect = StopIteration
+        with self.assertRaises(RuntimeError):
+            functions.apply_profile(self.ldap, 'flolrus', self.prof)
+        self.assertFalse(self.ldap.add_object.called)
+    def test_push_profile(self):
+        ''' Test that the origin is done before, and is the source for, the
+            other environments
+        '''
+        replica = mock.Mock(host='jcint.example.com')
+        replica.get_user.side_effect = [StopIteration, {'uid': ['flolrus']}]
+        replica.user_search.return_value = self.ldap.user_search.return_value
+        self.ldap.get_user.return_value = {'uid': ['flolrus'], 'dn': 'x'}
+        conns = OrderedDict([('jcint', replica), ('qa', self.ldap)])
+        report = functions.push_profile(conns, 'qa', 'flolrus', self.prof)
+        self.assertEqual(report.keys(), ['qa', 'jcint'])
+        self.assertEqual(report.errors, {})
+        replica.add_object.assert_called_once_with({'uid': ['flolrus'],
+                                                    'dn': 'x'},
+                                                   ignore_attrs=['dn'])
+    def test_push_profile_jira(self):
+        ''' Test that a replica copied from the origin keeps the origin's
+            description, rather than having the ticket appended again
+        '''
+        copied = make_user(description=['Flolrus JIRA-1'])
+        replica = mock.Mock(host='jcint.example.com')
+        replica.get_user.side_effect = [StopIteration, copied]
+        replica.user_search.return_value = self.ldap.user_search.return_value
+        descriptions = []
+        def enforce(_, prof, jira):
+            ''' Note any description enforcing would give the copy
+            '''
+            for _, modlist in LDAP.profile_modlists(copied, {}, prof, jira):
+                descriptions.extend(vals for _, attr, vals in modlist
+                                    if attr == 'description')
+        replica.enforce_profile.side_effect = enforce
+        self.ldap.get_user.return_value = copied
+        conns = OrderedDict([('jcint', replica), ('qa', self.ldap)])
+        report = functions.push_profile(conns, 'qa', 'flolrus', make_profile(),
+                                        jira='JIRA-1')
+        self.assertEqual(report.errors, {})
+        self.assertEqual(self.ldap.enforce_profile.call_args[0][2], 'JIRA-1')
+        self.assertEqual(descriptions, [])
+    def test_push_profile_origin_failed(self):
+        ''' Test that nothing is pushed if the origin fails
+        '''
+        replica = mock.Mock(host='jcint.example.com')
+        self.ldap.get_user.side_effect = StopIteration
+        conns = OrderedDict([('jcint', replica), ('qa', self.ldap)])
+        report = functions.push_profile(conns, 'qa', 'flolrus', self.prof)
+        self.assertEqual(report.errors.keys(), ['qa'])
+        self.assertFalse(replica.enforce_profile.called)
+    def test_read_bulk(self):
+        ''' Test parsing of CSV and JSON lines of bulk requests
+        '''
+        lines = ['user,profile,jira',
+                 '# a comment',
+                 'flolrus, admin, JIRA-1',
+                 '',
+                 'walrus',
+                 '{"user": "narwhal", "jira": "JIRA-2"}']
+        self.assertEqual(list(functions.read_bulk(lines)),
+                         [{'user': 'flolrus', 'profile': 'admin', 'jira': 'JIRA-1'},
+                          {'user': 'walrus', 'profile': None, 'jira': None},
+                          {'user': 'narwhal', 'profile': None, 'jira': 'JIRA-2'}])
+    def test_bulk_requests_file(self):
+        ''' Test that --file is read, and closed once it has been
+        '''
+        opened = []
+        def tracked(*args):
+            ''' open, remembering what was opened
+            '''
+            opened.append(open(*args))
+            return opened[-1]
+        with tempfile.NamedTemporaryFile() as stream:
+            stream.write('flolrus,admin\n')
+            stream.flush()
+            args = mock.Mock(users=None, file=stream.name)
+            with mock.patch('jldap.functions.open', tracked, create=True):
+                requests = list(functions.bulk_requests(args))
+        self.assertEqual(requests,
+                         [{'user': 'flolrus', 'profile': 'admin', 'jira': None}])
+        self.assertTrue(opened[0].closed)
+    def test_write_results_grouped(self):
+        ''' Test that html has one section per profile, whether or not the
+            results come grouped
+        '''
+        def result(name, user):
+            ''' A (profile name, audit) result
+            '''
+            return name, OrderedDict([('owner', 'ops'),
+                                      ('user', user),
+                                      ('value', 3)])
+        mixed = [result('admin', 'a'), result('dev', 'b'), result('admin', 'c')]
+        for results, grouped in [(mixed, False),
+                                 (sorted(mixed), True)]:
+            with mock.patch('sys.stdout', new_callable=StringIO) as out:
+                functions.write_results(mock.Mock(html=True), results,
+                                        grouped=grouped)
+            self.assertEqual(out.getvalue().count('Profile: admin'), 1)
+            self.assertEqual(out.getvalue().count('Profile: dev'), 1)
+            for user in 'abc':
+                self.assertIn('<p>%s</p>' % user, out.getvalue())
+    def test_plan_users_file(self):
+        ''' Test that a plan is written whole to --output, which is closed,
+            and that a plan which fails to render leaves no file
+        '''
+        args = mock.Mock(config='config.yaml', users=['flolrus'], file=None,
+                         profile='admin', jira='JIRA-1', action='enable',
+                         environment='qa', format='json')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        args.output = os.path.join(directory, 'plan.json')
+        opened = []
+        def tracked(*args):
+            ''' open, remembering what was opened
+            '''
+            opened.append(open(*args))
+            return opened[-1]
+        with mock.patch.multiple('jldap.functions',
+                                 config=mock.DEFAULT,
+                                 ldap_creds=mock.Mock(return_value=('u', 'p')),
+                                 environment_conns=mock.DEFAULT,
+                                 bulk_profile=mock.Mock(
+                                     return_value=(self.prof, 'JIRA-1'))):
+            with mock.patch('jldap.functions.plan.Plan') as plan_class:
+                the_plan = plan_class.return_value
+                the_plan.errors = {}
+                the_plan.write_json.side_effect = lambda out: out.write('{}')
+                with mock.patch('jldap.functions.open', tracked, create=True):
+                    functions.plan_users(args)
+                self.assertEqual(open(args.output).read(), '{}')
+                self.assertTrue(opened[0].closed)
+                os.remove(args.output)
+                the_plan.write_json.side_effect = IOError
+                with self.assertRaises(IOError):
+                    functions.plan_users(args)
+                self.assertFalse(os.path.exists(args.output))
 
 def suite():
     ''' Create a suite of tests
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Tests LDAP group resolution
+
+Example:
+    import unittest
+    suite = test_groups.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import re
+import unittest
+from jldap import groups
+from jldap import attdict
+from jldap import LDAP
+
+USER = 'uid=flolrus,ou=users,dc=example,dc=com'
+DOCKER = 'cn=docker,ou=roles,ou=groups,dc=example,dc=com'
+PWM = 'cn=pwm,ou=servicegroups,ou=groups,dc=example,dc=com'
+UNRESTRICTED = 'cn=unrestricted,ou=roles,ou=groups,dc=example,dc=com'
+ADMINS = 'cn=admins,ou=roles,ou=groups,dc=example,dc=com'
+
+''' DIRECTORY maps group dns to their uniqueMember values. DOCKER and PWM are
+    both in UNRESTRICTED which is in ADMINS which, pathologically, is in
+    UNRESTRICTED.
+'''
+DIRECTORY = {DOCKER: [USER],
+             PWM: [USER],
+             UNRESTRICTED: [DOCKER, 'CN=PWM, ou=servicegroups,ou=groups,dc=example,dc=com', ADMINS],
+             ADMINS: [UNRESTRICTED]}
+
+class FakeLDAP(object):
+    ''' Answers (uniqueMember=...) searches from DIRECTORY, counting them
+    '''
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.searches = 0
+    def search(self, filterstr=None, attrlist=None):
+        ''' Mock jldap.LDAP.LDAP.search
+        '''
+        # pylint: disable=unused-argument
+        self.searches += 1
+        wanted = set(groups.normalize(i)
+                     for i in re.findall(r'\(uniqueMember=([^)]*)\)', filterstr))
+        for dn, members in sorted(DIRECTORY.items()):
+            if wanted & set(groups.normalize(i) for i in members):
+                yield attdict.Attdict({'dn': dn, 'uniqueMember': members})
+
+class GroupsTestCase(unittest.TestCase):
+    ''' Test cases for jldap.groups
+    '''
+    def setUp(self):
+        ''' Set up for testing
+        '''
+        self.ldap = FakeLDAP()
+        self.resolver = groups.GroupResolver(self.ldap)
+    def test_normalize(self):
+        ''' Test that case and rdn whitespace are ignored
+        '''
+        self.assertEqual(groups.normalize('CN=PWM, ou=servicegroups,ou=groups,dc=example,dc=com'),
+                         groups.normalize(PWM))
+    def test_parents(self):
+        ''' Test that the whole hierarchy above a frontier is resolved
+        '''
+        parents = self.resolver.parents([DOCKER, PWM])
+        self.assertEqual(parents[groups.normalize(DOCKER)], [UNRESTRICTED])
+        self.assertEqual(parents[groups.normalize(PWM)], [UNRESTRICTED])
+        self.assertEqual(parents[groups.normalize(UNRESTRICTED)], [ADMINS])
+        self.assertEqual(parents[groups.normalize(ADMINS)], [UNRESTRICTED])
+    def test_one_search_per_level(self):
+        ''' Test that every level of the hierarchy costs a single search, no
+            matter how many groups are in it, and that the cycle terminates
+        '''
+        self.resolver.parents([DOCKER, PWM])
+        self.assertEqual(self.ldap.searches, 3)
+    def test_nest(self):
+        ''' Test the nested user_search format, cycle included once
+        '''
+        parents = self.resolver.parents([DOCKER])
+        self.assertEqual(groups.nest([DOCKER], parents),
+                         [DOCKER, [UNRESTRICTED, [ADMINS, [UNRESTRICTED]]]])
+    def test_nest_without_parents(self):
+        ''' Test that groups without parents are not followed by a list
+        '''
+        self.assertEqual(groups.nest([ADMINS, PWM], {}), [ADMINS, PWM])
+    def test_filters_chunked(self):
+        ''' Test that long frontiers are split across filters of bounded length
+        '''
+        resolver = groups.GroupResolver(self.ldap, max_filter_len=100)
+        filters = list(resolver.filters([DOCKER, PWM, UNRESTRICTED, ADMINS]))
+        self.assertEqual(len(filters), 4)
+        self.assertEqual(filters[0], '(uniqueMember=%s)' % DOCKER)
+        resolver = groups.GroupResolver(self.ldap)
+        filters = list(resolver.filters([DOCKER, PWM]))
+        self.assertEqual(filters, ['(|(uniqueMember=%s)(uniqueMember=%s))'
+                                   % (DOCKER, PWM)])
+    def test_filters_escaped(self):
+        ''' Test that filter metacharacters in dns are escaped
+        '''
+        filters = list(self.resolver.filters(['cn=a(b)*,dc=example,dc=com']))
+        self.assertEqual(filters, [r'(uniqueMember=cn=a\28b\29\2a,dc=example,dc=com)'])
+
+class GroupGraphTestCase(unittest.TestCase):
+    ''' Test cases for jldap.groups.GroupGraph
+    '''
+    def setUp(self):
+        ''' Build a snapshot of DIRECTORY, with flolrus also a memberUid of
+            DOCKER and newbie waiting in purgatory
+        '''
+        entries = [attdict.Attdict({'dn': dn, 'uniqueMember': members})
+                   for dn, members in sorted(DIRECTORY.items())]
+        for entry in entries:
+            if entry.dn == DOCKER:
+                entry['memberUid'] = ['flolrus']
+        newbie = attdict.Attdict({'dn': 'uid=newbie,%s' % LDAP.PURGATORY,
+                                  'uid': ['newbie']})
+        self.graph = groups.GroupGraph(entries, [newbie])
+    def test_len(self):
+        ''' Test that every group is in the snapshot
+        '''
+        self.assertEqual(len(self.graph), len(DIRECTORY))
+        self.assertTrue(PWM.upper() in self.graph)
+    def test_parents(self):
+        ''' Test the reverse membership index
+        '''
+        self.assertEqual(sorted(self.graph.parents(USER)), [DOCKER, PWM])
+        self.assertEqual(self.graph.parents(PWM), [UNRESTRICTED])
+    def test_ancestors(self):
+        ''' Test the transitive closure, cycle included
+        '''
+        self.assertEqual(self.graph.ancestors(DOCKER), set([UNRESTRICTED, ADMINS]))
+        self.assertEqual(self.graph.ancestors(ADMINS), set([UNRESTRICTED]))
+        self.assertEqual(self.graph.ancestors(USER),
+                         set([DOCKER, PWM, UNRESTRICTED, ADMINS]))
+    def test_user_search(self):
+        ''' Test that the snapshot answers exactly like a live search
+        '''
+        parents = groups.GroupResolver(FakeLDAP()).parents([DOCKER, PWM])
+        result = self.graph.user_search('flolrus')
+        self.assertTrue(result.found)
+        self.assertEqual(result['uniqueMember'],
+                         groups.nest(self.graph.parents(USER), parents))
+        self.assertEqual(result['memberUid'], groups.nest([DOCKER], parents))
+        self.assertEqual(result['user-purgatory'], [])
+    def test_user_search_purgatory(self):
+        ''' Test that users awaiting enablement are reported
+        '''
+        result = self.graph.user_search('newbie')
+        self.assertEqual(result['user-purgatory'], ['uid=newbie,%s' % LDAP.PURGATORY])
+    def test_update_remove(self):
+        ''' Test that replacing and dropping groups re-indexes
+        '''
+        self.graph.update([attdict.Attdict({'dn': ADMINS, 'uniqueMember': []})])
+        self.assertEqual(self.graph.ancestors(DOCKER), set([UNRESTRICTED]))
+        self.graph.remove([UNRESTRICTED])
+        self.assertEqual(self.graph.ancestors(DOCKER), set())
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [GroupsTestCase, GroupGraphTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
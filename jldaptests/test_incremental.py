@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Tests incremental audits
+
+Example:
+    import unittest
+    suite = test_incremental.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+from jldap import groups
+from jldap import incremental
+from jldap import LDAP
+from jldap.attdict import Attdict
+from jldaptests.test_matching import make_profile
+
+DOCKER = 'cn=docker,ou=roles,ou=groups,dc=example,dc=com'
+PWM = 'cn=pwm,ou=servicegroups,ou=groups,dc=example,dc=com'
+UNRESTRICTED = 'cn=unrestricted,ou=roles,ou=groups,dc=example,dc=com'
+LONG_AGO = time.time() - 86400
+
+class FakeDirectory(object):
+    ''' Answers the searches IncrementalAudit makes, honouring
+        modifyTimestamp filters, and counts the entries it returns
+    '''
+    def __init__(self):
+        self.host = 'ldap.example.com'
+        self.returned = 0
+        self.groups = {DOCKER: {'memberUid': ['user0', 'user1', 'user2'],
+                                'uniqueMember': [],
+                                'mtime': LONG_AGO},
+                       PWM: {'memberUid': ['user0'],
+                             'uniqueMember': [],
+                             'mtime': LONG_AGO},
+                       UNRESTRICTED: {'memberUid': [],
+                                      'uniqueMember': [PWM],
+                                      'mtime': LONG_AGO}}
+        self.users = dict(('user%s' % i, LONG_AGO) for i in range(4))
+    def touch(self, dn, **kwargs):
+        ''' Change a group, now
+        '''
+        self.groups[dn].update(kwargs, mtime=time.time())
+    def paged_search(self, basedn=None, filterstr=None, attrlist=None):
+        ''' Mock jldap.LDAP.LDAP.paged_search
+        '''
+        # pylint: disable=unused-argument
+        since = re.search(r'modifyTimestamp>=(\w+)', filterstr)
+        since = since.group(1) if since else ''
+        if basedn == LDAP.PURGATORY:
+            return []
+        if basedn == LDAP.USERS:
+            entries = [Attdict(dn='uid=%s,%s' % (uid, LDAP.USERS), uid=[uid])
+                       for uid, mtime in sorted(self.users.items())
+                       if incremental.generalized_time(mtime) >= since]
+        else:
+            entries = [Attdict(dn=dn,
+                               memberUid=group['memberUid'],
+                               uniqueMember=group['uniqueMember'])
+                       for dn, group in sorted(self.groups.items())
+                       if incremental.generalized_time(group['mtime']) >= since]
+        self.returned += len(entries)
+        return entries
+    def iter_uids(self):
+        ''' Mock jldap.LDAP.LDAP.iter_uids
+        '''
+        return iter(sorted(self.users))
+
+class IncrementalTestCase(unittest.TestCase):
+    ''' Test cases for jldap.incremental
+    '''
+    def setUp(self):
+        ''' Set up a directory, profiles and a state file location
+        '''
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.path = os.path.join(tempdir, 'state', 'audit.pickle')
+        self.ldap = FakeDirectory()
+        self.profiles = [make_profile('docker', posix=[DOCKER]),
+                         make_profile('admin', posix=[DOCKER, PWM, UNRESTRICTED])]
+    def audit(self, **kwargs):
+        ''' Run an incremental audit, returning it and its results
+        '''
+        inc = incremental.IncrementalAudit(self.ldap,
+                                           kwargs.pop('profiles', self.profiles),
+                                           path=self.path,
+                                           **kwargs)
+        return inc, list(inc.run())
+    def assert_fresh(self, results):
+        ''' Test results against an audit with no state to go on
+        '''
+        os.rename(self.path, self.path + '.bak')
+        _, fresh = self.audit()
+        os.rename(self.path + '.bak', self.path)
+        self.assertEqual(results, fresh)
+    def test_full_then_unchanged(self):
+        ''' Test that the first run audits everyone, and an unchanged
+            directory nobody, with the same report
+        '''
+        inc, first = self.audit()
+        self.assertTrue(inc.stats['full'])
+        self.assertEqual(inc.stats['audited'], 4)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual([i[1] for i in first],
+                         ['admin.yaml', 'docker.yaml', 'docker.yaml', 'docker.yaml'])
+        self.ldap.returned = 0
+        inc, second = self.audit()
+        self.assertFalse(inc.stats['full'])
+        self.assertEqual(inc.stats['audited'], 0)
+        self.assertEqual(self.ldap.returned, 3) # the dn-only group listing
+        self.assertEqual(second, first)
+    def test_changed_group(self):
+        ''' Test that a group change re-audits members of it and of the
+            groups below it, and nobody else
+        '''
+        self.audit()
+        self.ldap.touch(UNRESTRICTED, memberUid=['user1'])
+        inc, results = self.audit()
+        self.assertEqual(inc.stats['changed_groups'], 1)
+        # user0 via PWM, user1 directly
+        self.assertEqual(inc.stats['audited'], 2)
+        self.assert_fresh(results)
+    def test_removed_group_and_users(self):
+        ''' Test that a removed group's members are re-audited, and that new
+            and removed users are picked up
+        '''
+        self.audit()
+        del self.ldap.groups[PWM]
+        del self.ldap.users['user3']
+        self.ldap.users['user4'] = time.time()
+        inc, results = self.audit()
+        self.assertEqual(inc.stats['removed_groups'], 1)
+        self.assertEqual(inc.stats['audited'], 2) # user0 and user4
+        self.assertEqual([i[0] for i in results],
+                         ['user0', 'user1', 'user2', 'user4'])
+        self.assert_fresh(results)
+    def test_profiles_changed(self):
+        ''' Test that different profiles or options mean a full run
+        '''
+        self.audit()
+        inc, _ = self.audit(explicit=True)
+        self.assertTrue(inc.stats['full'])
+        inc, _ = self.audit(explicit=True,
+                            profiles=self.profiles[:1])
+        self.assertTrue(inc.stats['full'])
+    def test_affected_uids(self):
+        ''' Test the reverse membership lookup the audit relies on
+        '''
+        graph = groups.GroupGraph(self.ldap.paged_search(filterstr='x'))
+        self.assertEqual(graph.affected_uids([UNRESTRICTED]), set(['user0']))
+        self.assertEqual(graph.affected_uids([DOCKER.upper()]),
+                         set(['user0', 'user1', 'user2']))
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(IncrementalTestCase)
+    return the_suite
@@ -3,19 +3,298 @@
 
 Example:
     import unittest
-    suite = test_jive.suite()
+    suite = test_ldap.suite()
     unittest.TextTestRunner().run(suite)
 
 """
 import unittest
-from collections import namedtuple
 import mock
 from jldap import LDAP
+from jldap import attdict
+from jldap import profile
+
+HOST = 'ldap.example.com'
+USER_DN = 'uid=flolrus,%s' % LDAP.USERS
+DOCKER = 'cn=docker,ou=roles,%s' % LDAP.BASE
+PWM = 'cn=pwm,ou=servicegroups,%s' % LDAP.BASE
+SAMBA = 'cn=Domain Admins,ou=windows,%s' % LDAP.BASE
+OLD = 'cn=old,ou=roles,%s' % LDAP.BASE
+
+def make_profile():
+    ''' A Profile with DOCKER as posix-group, PWM as group-of-unique-names
+        and SAMBA as samba-group-mapping
+    '''
+    prof = profile.Profile('test.yaml')
+    # pylint: disable=protected-access
+    prof._obtained = True
+    prof._samba_group_sid = '2000'
+    prof._primary_gid_number = '10000'
+    prof._posix_group = [DOCKER]
+    prof._group_of_unique_names = [PWM]
+    prof._samba_group_mapping = [SAMBA]
+    return prof
+
+def make_user(**kwargs):
+    ''' A user entry already matching make_profile's attributes
+    '''
+    user = attdict.Attdict({'dn': USER_DN,
+                            'uid': ['flolrus'],
+                            'remoteAccess': ['TRUE'],
+                            'sambaPrimaryGroupSID': ['S-1-5-21-1-2000'],
+                            'gidNumber': ['10000'],
+                            'employeeType': ['LDAP Profile: test.yaml'],
+                            'description': ['Flolrus']})
+    user.update(kwargs)
+    return user
 
 class LDAPTestCase(unittest.TestCase):
     ''' Test cases for jldap.LDAP
-        TODO: write some tests
     '''
+    def setUp(self):
+        ''' Patch out ldap.initialize so no real connections are made
+        '''
+        patcher = mock.patch('jldap.LDAP.ldap.initialize')
+        self.initialize = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conn = self.initialize.return_value
+        self.conn.search_s.return_value = [('uid=a,%s' % LDAP.USERS,
+                                            {'uid': ['a']})]
+        self.conn.result3.return_value = (LDAP.ldap.RES_SEARCH_RESULT,
+                                          self.conn.search_s.return_value,
+                                          1,
+                                          [])
+        self.ldap = LDAP.LDAP(HOST, user='binder', password='secret')
+    def test_lazy_connect(self):
+        ''' Test that nothing is bound until the connection is needed
+        '''
+        self.assertIsNone(self.ldap.conn)
+        self.assertFalse(self.initialize.called)
+    def test_bind_once(self):
+        ''' Test that several decorated calls share a single bind
+        '''
+        self.ldap.get_user('a')
+        self.ldap.get_user('a')
+        self.ldap.get_all_uids()
+        self.initialize.assert_called_once_with('ldap://%s' % HOST)
+        self.conn.simple_bind_s.assert_called_once_with('binder', 'secret')
+    def test_rebind_on_server_down(self):
+        ''' Test that a dropped connection is rebound and the call retried
+        '''
+        self.ldap.get_user('a')
+        self.conn.search_s.side_effect = [LDAP.ldap.SERVER_DOWN(),
+                                          [('uid=a,%s' % LDAP.USERS,
+                                            {'uid': ['a']})]]
+        self.assertEqual(self.ldap.get_user('a').uid, ['a'])
+        self.assertEqual(self.conn.simple_bind_s.call_count, 2)
+    def test_idle_health_check(self):
+        ''' Test that an idle connection is health-checked and rebound if it
+            no longer answers
+        '''
+        self.ldap.get_user('a')
+        # pylint: disable=protected-access
+        self.ldap._last_used -= LDAP.IDLE_CHECK + 1
+        self.conn.whoami_s.side_effect = LDAP.ldap.SERVER_DOWN()
+        self.ldap.get_user('a')
+        self.assertEqual(self.conn.simple_bind_s.call_count, 2)
+    def test_close(self):
+        ''' Test that close unbinds and drops the connection
+        '''
+        self.ldap.get_user('a')
+        self.ldap.close()
+        self.conn.unbind_s.assert_called_once_with()
+        self.assertIsNone(self.ldap.conn)
+    def test_context_manager(self):
+        ''' Test that leaving a with block closes the connection
+        '''
+        with self.ldap as ldap_conn:
+            ldap_conn.get_user('a')
+        self.conn.unbind_s.assert_called_once_with()
+        self.assertFalse(self.ldap.healthy())
+    def test_user_search(self):
+        ''' Test that user_search nests inherited groups, resolving each
+            hierarchy level with a single search
+        '''
+        docker = 'cn=docker,ou=roles,%s' % LDAP.BASE
+        role = 'cn=unrestricted,ou=roles,%s' % LDAP.BASE
+        def search_s(*args, **kwargs):
+            ''' Mock ldap search_s answering from a tiny directory
+            '''
+            # pylint: disable=unused-argument
+            filterstr = kwargs.get('filterstr')
+            if filterstr == '(uniqueMember=uid=a,%s)' % LDAP.USERS:
+                return [(docker, {})]
+            if filterstr == '(uniqueMember=%s)' % docker:
+                return [(role, {'uniqueMember': [docker]})]
+            return []
+        self.conn.search_s.side_effect = search_s
+        result = self.ldap.user_search('a')
+        self.assertEqual(result['uniqueMember'], [docker, [role]])
+        self.assertEqual(result['memberUid'], [])
+        self.assertEqual(self.conn.search_s.call_count, 5)
+    def _pages(self, *pages):
+        ''' Make result3 answer with pages of uids, each but the last
+            carrying a paging cookie
+        '''
+        control = LDAP.ldap.controls.SimplePagedResultsControl
+        results = []
+        for num, page in enumerate(pages):
+            ctrl = mock.Mock(controlType=control.controlType,
+                             cookie='' if num == len(pages) - 1 else str(num))
+            data = [('uid=%s,%s' % (i, LDAP.USERS), {'uid': [i]}) for i in page]
+            results.append((LDAP.ldap.RES_SEARCH_RESULT, data, num, [ctrl]))
+        self.conn.result3.side_effect = results
+    def test_paged_search(self):
+        ''' Test that paged_search follows cookies across pages
+        '''
+        self._pages(['a', 'b'], ['c'])
+        result = [i.uid[0] for i in self.ldap.paged_search(page_size=2)]
+        self.assertEqual(result, ['a', 'b', 'c'])
+        self.assertEqual(self.conn.search_ext.call_count, 2)
+        cookie = self.conn.search_ext.call_args[1]['serverctrls'][0].cookie
+        self.assertEqual(cookie, '0')
+    def _ended(self, cookie):
+        ''' Assert the last search_ext gave cookie back asking for no more
+        '''
+        control = self.conn.search_ext.call_args[1]['serverctrls'][0]
+        self.assertEqual((control.size, control.cookie), (0, cookie))
+    def test_paged_search_limit(self):
+        ''' Test that paged_search stops at the result cap without asking
+            for further pages, and ends the search on the server
+        '''
+        self._pages(['a', 'b'], ['c'])
+        result = [i.uid[0] for i in self.ldap.search(limit=1)]
+        self.assertEqual(result, ['a'])
+        self.assertEqual(self.conn.search_ext.call_count, 2)
+        self._ended('0')
+    def test_paged_search_closed(self):
+        ''' Test that a paged search closed early is ended on the server,
+            and one read through isn't
+        '''
+        self._pages(['a', 'b'], ['c'], ['d'])
+        results = self.ldap.paged_search(page_size=2)
+        next(results)
+        next(results)
+        next(results) # second page
+        results.close()
+        self.assertEqual(self.conn.search_ext.call_count, 3)
+        self._ended('1')
+        self._pages(['a'])
+        self.assertEqual(len(list(self.ldap.paged_search())), 1)
+        self.assertEqual(self.conn.search_ext.call_count, 4)
+    def test_paged_search_failed(self):
+        ''' Test that a page request which fails is abandoned
+        '''
+        self._pages(['a'], ['b'])
+        self.conn.result3.side_effect = [self.conn.result3.side_effect.next(),
+                                         LDAP.ldap.LDAPError('gone')]
+        with self.assertRaises(LDAP.ldap.LDAPError):
+            list(self.ldap.paged_search())
+        self.conn.abandon.assert_called_once_with(
+            self.conn.search_ext.return_value)
+    def test_paged_search_reconnected(self):
+        ''' Test that a paged search whose connection is replaced fails
+            rather than sending its cookie on the new connection
+        '''
+        self._pages(['a'], ['b'])
+        results = self.ldap.paged_search()
+        next(results)
+        self.ldap.conn = mock.Mock()
+        with self.assertRaises(RuntimeError):
+            next(results)
+        self.assertFalse(self.ldap.conn.search_ext.called)
+        self.assertEqual(self.conn.search_ext.call_count, 2)
+        self._ended('0')
+    def test_iter_uids(self):
+        ''' Test that iter_uids streams uids from a paged search
+        '''
+        self._pages(['a'], ['b'])
+        self.assertEqual(self.ldap.get_all_uids(), ['a', 'b'])
+    def test_profile_modlists_match(self):
+        ''' Test that a user already matching its profile needs no changes
+        '''
+        memberships = {DOCKER.lower(): (DOCKER, set(['memberUid', 'uniqueMember'])),
+                       PWM.lower(): (PWM, set(['uniqueMember'])),
+                       SAMBA.lower(): (SAMBA, set(['memberUid']))}
+        self.assertEqual(LDAP.profile_modlists(make_user(), memberships,
+                                               make_profile()),
+                         [])
+    def test_profile_modlists(self):
+        ''' Test that only differing attributes and the user's own group
+            values are changed
+        '''
+        memberships = {DOCKER.lower(): (DOCKER, set(['uniqueMember'])),
+                       OLD.lower(): (OLD, set(['memberUid', 'uniqueMember']))}
+        user = make_user(gidNumber=['1'], sambaPrimaryGroupSID=['S-1-5-21-1-1'])
+        changes = LDAP.profile_modlists(user, memberships, make_profile(),
+                                        jira='JIRA-1')
+        ldap = LDAP.ldap
+        self.assertEqual(changes, [
+            (USER_DN, [(ldap.MOD_REPLACE, 'sambaPrimaryGroupSID', ['S-1-5-21-1-2000']),
+                       (ldap.MOD_REPLACE, 'gidNumber', ['10000']),
+                       (ldap.MOD_REPLACE, 'description', ['Flolrus JIRA-1'])]),
+            (DOCKER, [(ldap.MOD_ADD, 'memberUid', ['flolrus'])]),
+            (PWM, [(ldap.MOD_ADD, 'uniqueMember', [USER_DN])]),
+            (SAMBA, [(ldap.MOD_ADD, 'memberUid', ['flolrus'])]),
+            (OLD, [(ldap.MOD_DELETE, 'memberUid', ['flolrus']),
+                   (ldap.MOD_DELETE, 'uniqueMember', [USER_DN])])])
+    def test_enforce_profile(self):
+        ''' Test that enforce_profile issues one modify per changed entry
+            and doesn't read entries back unless asked
+        '''
+        def search_s(*args, **kwargs):
+            ''' Mock ldap search_s: the user is in OLD only
+            '''
+            if args[0] == LDAP.USERS:
+                return [(USER_DN, dict(make_user(gidNumber=['1'])))]
+            if 'flolrus' in kwargs.get('filterstr', ''):
+                return [(OLD, {})]
+            return []
+        self.conn.search_s.side_effect = search_s
+        changes = self.ldap.enforce_profile('flolrus', make_profile())
+        self.assertEqual([i[0] for i in changes], [USER_DN, DOCKER, PWM, SAMBA, OLD])
+        self.assertEqual(self.conn.modify_s.call_count, 5)
+        self.assertEqual(self.conn.search_s.call_count, 3)
+    def test_enforce_profile_type(self):
+        ''' Test that enforce_profile insists on a Profile
+        '''
+        with self.assertRaises(TypeError):
+            self.ldap.enforce_profile('flolrus', {})
+    def test_add_values(self):
+        ''' Test that add_values sends only the new values, in one modify
+        '''
+        modlist = self.ldap.add_values(attdict.Attdict(dn=DOCKER),
+                                       {'memberUid': ['flolrus'],
+                                        'uniqueMember': [USER_DN]})
+        self.conn.modify_s.assert_called_once_with(DOCKER, modlist)
+        self.assertEqual(modlist,
+                         [(LDAP.ldap.MOD_ADD, 'memberUid', ['flolrus']),
+                          (LDAP.ldap.MOD_ADD, 'uniqueMember', [USER_DN])])
+    def test_remove_values_nothing(self):
+        ''' Test that nothing is sent when there is nothing to remove
+        '''
+        self.assertEqual(self.ldap.remove_values(DOCKER, {'memberUid': []}), [])
+        self.assertFalse(self.conn.modify_s.called)
+    def test_degroup_user(self):
+        ''' Test that degroup_user deletes the user's values from each group
+            with a single modify, without reading member lists
+        '''
+        def search_s(*args, **kwargs):
+            ''' Mock ldap search_s: flolrus is in DOCKER both ways, and in
+                PWM by uniqueMember
+            '''
+            if args[0] == LDAP.USERS:
+                return [(USER_DN, dict(make_user()))]
+            self.assertEqual(kwargs['attrlist'], ['dn'])
+            if kwargs['filterstr'] == '(memberUid=flolrus)':
+                return [(DOCKER, {})]
+            return [(DOCKER, {}), (PWM, {})]
+        self.conn.search_s.side_effect = search_s
+        self.ldap.degroup_user('flolrus')
+        ldap = LDAP.ldap
+        self.assertEqual(sorted(i[0] for i in self.conn.modify_s.call_args_list),
+                         sorted([(DOCKER, [(ldap.MOD_DELETE, 'memberUid', ['flolrus']),
+                                           (ldap.MOD_DELETE, 'uniqueMember', [USER_DN])]),
+                                 (PWM, [(ldap.MOD_DELETE, 'uniqueMember', [USER_DN])])]))
 
 def suite():
     ''' Create a suite of tests
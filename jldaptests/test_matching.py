@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Tests bulk profile matching
+
+Example:
+    import unittest
+    suite = test_matching.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import random
+import unittest
+from jldap import matching
+from jldap import profile
+from jldap import userdict
+
+GROUPS = ['cn=group%s,ou=roles,ou=groups,dc=example,dc=com' % i
+          for i in range(12)]
+
+def make_profile(name, posix=(), unique=(), samba=()):
+    ''' A Profile which needs no yaml file
+    '''
+    prof = profile.Profile('%s.yaml' % name)
+    # pylint: disable=protected-access
+    prof._obtained = True
+    prof._posix_group = list(posix)
+    prof._group_of_unique_names = list(unique)
+    prof._samba_group_mapping = list(samba)
+    return prof
+
+class MatchingTestCase(unittest.TestCase):
+    ''' Test cases for jldap.matching
+    '''
+    def setUp(self):
+        ''' Set up overlapping profiles (including duplicates, so ties are
+            exercised) and random users
+        '''
+        rand = random.Random(42)
+        self.profiles = [make_profile('small', posix=GROUPS[:2]),
+                         make_profile('medium', posix=GROUPS[:2],
+                                      unique=GROUPS[2:5]),
+                         make_profile('other', unique=GROUPS[5:8],
+                                      samba=GROUPS[8:9]),
+                         make_profile('medium-too', unique=GROUPS[:5]),
+                         make_profile('empty')]
+        self.users = []
+        for i in range(200):
+            direct = rand.sample(GROUPS, rand.randint(0, 6))
+            inherited = [[rand.choice(GROUPS)]] if rand.random() < 0.3 else []
+            self.users.append(userdict.Userdict(
+                name='user%s' % i,
+                permissions={'memberUid': direct[:2] + inherited,
+                             'uniqueMember': direct[2:],
+                             'user-purgatory': []}))
+        self.users.append(userdict.Userdict(name='ghost'))
+    def assert_same(self, **kwargs):
+        ''' Compare the matcher against bulk_audit for every user
+        '''
+        matcher = matching.Matcher(self.profiles, **kwargs)
+        for user in self.users:
+            self.assertEqual(matcher.audit(user),
+                             profile.Profile.bulk_audit(user,
+                                                        profiles=self.profiles,
+                                                        **kwargs))
+    def test_same_as_bulk_audit(self):
+        ''' Test that the matcher picks what bulk_audit picks
+        '''
+        self.assert_same()
+    def test_same_ignore_inherited(self):
+        ''' Test that the matcher picks what bulk_audit picks when ignoring
+            inherited permissions
+        '''
+        self.assert_same(ignore_inherited=True)
+    def test_same_explicit(self):
+        ''' Test that the matcher picks what bulk_audit picks for explicit
+            audits, whose mismatches carry a diff
+        '''
+        self.assert_same(explicit=True)
+    def test_classify(self):
+        ''' Test the value and diff size of each kind of comparison
+        '''
+        matcher = matching.Matcher(self.profiles[:3])
+        bits = matcher.mask(GROUPS[:3])
+        self.assertEqual(matcher.classify(bits),
+                         [(matching.PARTIAL, 1),
+                          (matching.PARTIAL, 2),
+                          (matching.NO_MATCH, 0)])
+        self.assertEqual(matcher.classify(matcher.mask(GROUPS[:2]))[0],
+                         (matching.MATCH, 0))
+        self.assertEqual(matcher.best(bits), 0)
+    def test_no_profiles(self):
+        ''' Test that a matcher needs profiles, as bulk_audit does
+        '''
+        with self.assertRaises(TypeError):
+            matching.Matcher([])
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(MatchingTestCase)
+    return the_suite
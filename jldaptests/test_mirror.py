@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""Tests the on-disk directory mirror
+
+Example:
+    import unittest
+    suite = test_mirror.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import yaml
+from jldap import LDAP
+from jldap import config
+from jldap import groups
+from jldap import mirror
+from jldap import workers
+from jldap.attdict import Attdict
+
+DOCKER = 'cn=docker,ou=roles,ou=groups,%s' % LDAP.BASE
+ADMINS = 'cn=admins,ou=roles,ou=groups,%s' % LDAP.BASE
+STAFF = 'cn=staff,ou=roles,ou=groups,%s' % LDAP.BASE
+
+class FakeLDAP(object):
+    ''' Just enough of jldap.LDAP.LDAP for Mirror.sync: entries is a list of
+        Attdicts, and only those in changed match a modifyTimestamp filter
+    '''
+    # pylint: disable=too-few-public-methods
+    host = 'ldap.example.com'
+    basedn = LDAP.BASE
+    def __init__(self, entries):
+        self.entries = entries
+        self.changed = []
+    def paged_search(self, basedn=None, filterstr=None, attrlist=None):
+        ''' Entries under basedn which are groups or users, per filterstr
+        '''
+        base = groups.normalize(basedn)
+        for entry in self.entries:
+            if not groups.normalize(entry.dn).endswith(base):
+                continue
+            if ('modifyTimestamp' in filterstr
+                    and entry.dn not in self.changed):
+                continue
+            if ((groups.GROUP_FILTER in filterstr) != ('uid' not in entry)):
+                continue
+            yield Attdict(dn=entry.dn) if attrlist == ['1.1'] else Attdict(entry)
+
+def user(uid, base=LDAP.USERS, **kwargs):
+    ''' A user entry
+    '''
+    return Attdict(dn='uid=%s,%s' % (uid, base), uid=[uid], **kwargs)
+
+class MirrorTestCase(unittest.TestCase):
+    ''' Test cases for jldap.mirror.Mirror
+    '''
+    def setUp(self):
+        ''' Mirror a directory where flolrus is in docker directly and in
+            admins and staff through docker, and new.user is in purgatory
+        '''
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.ldap = FakeLDAP([
+            user('flolrus', cn=['Flo Lrus'], userPassword=['secret']),
+            user('other'),
+            user('new.user', base=LDAP.PURGATORY),
+            Attdict(dn=DOCKER, cn=['docker'], memberUid=['other'],
+                    uniqueMember=['uid=flolrus,%s' % LDAP.USERS]),
+            Attdict(dn=ADMINS, cn=['admins'], uniqueMember=[DOCKER.upper()]),
+            Attdict(dn=STAFF, cn=['staff'], uniqueMember=[ADMINS, DOCKER])])
+        self.mirror = mirror.Mirror(os.path.join(self.tmp, 'm.sqlite'),
+                                    self.ldap.host)
+        self.addCleanup(self.mirror.close)
+        self.stats = self.mirror.sync(self.ldap)
+    def test_full(self):
+        ''' Test the first sync
+        '''
+        self.assertTrue(self.stats['full'])
+        self.assertEqual(self.stats['groups']['fetched'], 3)
+        self.assertEqual(self.stats['users']['fetched'], 2)
+        self.assertIsNotNone(self.mirror.synced)
+        self.assertEqual(list(self.mirror.iter_uids()), ['flolrus', 'other'])
+        self.assertEqual(os.stat(self.mirror.path).st_mode & 0777, 0600)
+    def test_lookups(self):
+        ''' Test get_user and cn_search, and that secrets aren't kept
+        '''
+        entry = self.mirror.get_user('flolrus')
+        self.assertEqual(entry.dn, 'uid=flolrus,%s' % LDAP.USERS)
+        self.assertNotIn('userPassword', entry)
+        self.assertEqual(self.mirror.get_user('new.user',
+                                              basedn=LDAP.PURGATORY).uid,
+                         ['new.user'])
+        with self.assertRaises(StopIteration):
+            self.mirror.get_user('new.user', basedn=LDAP.USERS)
+        self.assertEqual(self.mirror.cn_search('Flo Lrus').name, 'flolrus')
+        self.assertFalse(self.mirror.cn_search('docker').found)
+    def test_user_search(self):
+        ''' Test that user_search answers as a GroupGraph of the same
+            directory does
+        '''
+        graph = groups.GroupGraph([i for i in self.ldap.entries if 'uid' not in i],
+                                  [self.ldap.entries[2]])
+        for uid in ['flolrus', 'other', 'new.user', 'nobody']:
+            self.assertEqual(self.mirror.user_search(uid).permissions(),
+                             graph.user_search(uid).permissions())
+        self.assertEqual(self.mirror.user_search('flolrus').permissions(),
+                         frozenset([DOCKER, ADMINS, STAFF]))
+        self.assertEqual(self.mirror.graph().user_search('new.user')['user-purgatory'],
+                         ['uid=new.user,%s' % LDAP.PURGATORY])
+    def test_incremental(self):
+        ''' Test that later syncs fetch changes and notice deletions
+        '''
+        self.ldap.entries[3] = Attdict(dn=DOCKER, cn=['docker'], memberUid=['other'])
+        self.ldap.entries[2] = user('new.user')
+        del self.ldap.entries[1]
+        self.ldap.changed = [DOCKER, self.ldap.entries[1].dn]
+        stats = self.mirror.sync(self.ldap)
+        self.assertFalse(stats['full'])
+        self.assertEqual(stats['groups'], {'fetched': 1, 'removed': 0})
+        self.assertEqual(stats['users'], {'fetched': 1, 'removed': 1})
+        self.assertEqual(stats['purgatory'], {'fetched': 0, 'removed': 1})
+        self.assertEqual(list(self.mirror.iter_uids()), ['flolrus', 'new.user'])
+        self.assertEqual(self.mirror.user_search('flolrus').permissions(),
+                         frozenset())
+        self.assertTrue(self.mirror.sync(self.ldap, full=True)['full'])
+    def test_pooled_audit(self):
+        ''' Test that the mirror's uids can be audited across worker
+            processes, as audit --offline --workers does
+        '''
+        profile_dir = os.path.join(self.tmp, 'profiles')
+        os.mkdir(profile_dir)
+        patcher = mock.patch.object(config, 'STATE_DIR', profile_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with open(os.path.join(profile_dir, 'docker.yaml'), 'w') as yml:
+            yaml.dump({'posix-group': [DOCKER], 'owner': 'first.last'}, yml)
+        results = list(workers.audit_users(self.mirror.iter_uids(),
+                                           {'host': self.ldap.host},
+                                           profile_dir,
+                                           workers=2,
+                                           snapshot=self.mirror.graph()))
+        self.assertEqual([i[1]['user'] for i in results], ['flolrus', 'other'])
+    def test_other_host(self):
+        ''' Test that a mirror of another host doesn't count as synced
+        '''
+        other = mirror.Mirror(self.mirror.path, 'other.example.com')
+        self.addCleanup(other.close)
+        self.assertIsNone(other.synced)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(MirrorTestCase)
+    return the_suite
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""Tests LDAP change planning
+
+Example:
+    import unittest
+    suite = test_plan.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import unittest
+from StringIO import StringIO
+from collections import OrderedDict
+import mock
+from jldap import plan
+from jldap import LDAP
+from jldaptests.test_ldap import make_profile, make_user, USER_DN, DOCKER, PWM
+
+class PlanTestCase(unittest.TestCase):
+    ''' Test cases for jldap.plan
+    '''
+    def setUp(self):
+        ''' Set up a mock origin, which has the user without the profile, and
+            a mock replica, which doesn't have the user at all
+        '''
+        self.prof = make_profile()
+        self.origin = mock.Mock(host='phx.example.com')
+        self.origin.get_user.return_value = make_user(
+            dn='uid=flolrus,%s' % LDAP.PURGATORY,
+            remoteAccess=['FALSE'],
+            userPassword=['{SSHA}hash'])
+        self.origin.memberships.return_value = {}
+        self.replica = mock.Mock(host='qa.example.com')
+        self.replica.get_user.side_effect = StopIteration
+        self.conns = OrderedDict([('phx', self.origin), ('qa', self.replica)])
+    def test_plan_user(self):
+        ''' Test that a move and the profile's modifies are planned, in order
+        '''
+        changes, entry = plan.plan_user(self.origin, 'flolrus', self.prof,
+                                        jira='JIRA-1', move=True)
+        self.assertEqual([i.op for i in changes],
+                         ['modrdn', 'modify', 'modify', 'modify', 'modify'])
+        self.assertEqual(changes[0].newsuperior, LDAP.USERS)
+        self.assertEqual(changes[1].dn, USER_DN)
+        self.assertIn(['replace', 'remoteAccess', ['TRUE']], changes[1].mods)
+        self.assertEqual(changes[2].dn, DOCKER)
+        self.assertEqual(entry.dn, USER_DN)
+        self.assertEqual(entry.description, ['Flolrus JIRA-1'])
+        self.assertFalse(self.origin.modify.called)
+        self.assertFalse(self.origin.rename.called)
+    def test_plan_missing(self):
+        ''' Test that a user missing from a replica is planned as an add of
+            the origin's entry, ticket and all
+        '''
+        _, entry = plan.plan_user(self.origin, 'flolrus', self.prof,
+                                  jira='JIRA-1', move=True)
+        changes, copied = plan.plan_user(self.replica, 'flolrus', self.prof,
+                                         jira='JIRA-1', move=True, source=entry)
+        self.assertEqual(changes[0].op, 'add')
+        self.assertEqual(changes[0].dn, USER_DN)
+        self.assertNotIn('dn', changes[0].attrs)
+        self.assertNotIn('userPassword', changes[0].attrs)
+        # the ticket came with the copy, and isn't appended again
+        self.assertEqual(changes[0].attrs['description'], ['Flolrus JIRA-1'])
+        self.assertEqual(copied.description, ['Flolrus JIRA-1'])
+        # the copy already has the origin's attributes, only groups remain
+        self.assertEqual([i.dn for i in changes[1:]], [DOCKER, PWM,
+                                                       self.prof.samba_group_mapping[0]])
+        with self.assertRaises(RuntimeError):
+            plan.plan_user(self.replica, 'flolrus', self.prof)
+    def test_add_user(self):
+        ''' Test that every environment is planned, and failures recorded
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof,
+                          jira='JIRA-1', move=True)
+        self.assertEqual(the_plan.hosts.keys(), ['phx', 'qa'])
+        self.assertEqual(the_plan.changes['qa'][0].op, 'add')
+        self.assertEqual(the_plan.errors, {})
+        self.origin.get_user.side_effect = StopIteration
+        the_plan.add_user(self.conns, 'phx', 'walrus', self.prof)
+        self.assertIn('walrus', the_plan.errors)
+    def test_round_trip(self):
+        ''' Test that a plan written as JSON is applied as planned
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof,
+                          jira='JIRA-1', move=True)
+        out = StringIO()
+        the_plan.write_json(out)
+        out.seek(0)
+        loaded = plan.Plan.load(out)
+        self.assertEqual(loaded.dict(), the_plan.dict())
+        report = loaded.apply(self.conns)
+        self.assertEqual(report.errors, {})
+        self.assertEqual(report['phx'].result, len(the_plan.changes['phx']))
+        self.origin.rename.assert_called_once_with(
+            'uid=flolrus,%s' % LDAP.PURGATORY,
+            'uid=flolrus',
+            newsuperior=LDAP.USERS)
+        self.assertEqual(self.origin.modify.call_args_list[0][0][1][0],
+                         (LDAP.ldap.MOD_REPLACE, 'remoteAccess', ['TRUE']))
+        self.assertEqual(self.replica.add_entry.call_args[0][0], USER_DN)
+        # the hash left out of the plan is read back from the origin
+        self.assertEqual(self.replica.add_entry.call_args[0][1]['userPassword'],
+                         ['{SSHA}hash'])
+        self.assertFalse(self.origin.get_user.call_count > 2)
+    def test_apply_by_env(self):
+        ''' Test that each environment's changes go to that environment,
+            even where two environments share a host
+        '''
+        self.replica.host = self.origin.host
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof, move=True)
+        report = the_plan.apply(self.conns)
+        self.assertEqual(report.errors, {})
+        self.assertTrue(self.origin.rename.called)
+        self.assertFalse(self.origin.add_entry.called)
+        self.assertTrue(self.replica.add_entry.called)
+        self.assertFalse(self.replica.rename.called)
+    def test_apply_other_config(self):
+        ''' Test that a plan is refused, untouched, by conns with another
+            host for, or without, one of its environments
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof, move=True)
+        moved = OrderedDict([('phx', self.origin),
+                             ('qa', mock.Mock(host='qa2.example.com'))])
+        with self.assertRaises(ValueError):
+            the_plan.apply(moved)
+        with self.assertRaises(ValueError):
+            the_plan.apply(OrderedDict([('phx', self.origin)]))
+        self.assertFalse(self.origin.rename.called)
+        self.assertFalse(self.origin.modify.called)
+    def test_no_secrets(self):
+        ''' Test that password hashes are in neither JSON nor LDIF output
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof, move=True)
+        self.assertEqual(the_plan.changes['qa'][0].origin, 'phx')
+        for write in [the_plan.write_json, the_plan.write_ldif]:
+            out = StringIO()
+            write(out)
+            self.assertNotIn('hash', out.getvalue())
+    def test_apply_origin_gone(self):
+        ''' Test that a plan adding a user no longer on the origin is
+            refused, untouched
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof, move=True)
+        self.origin.get_user.side_effect = StopIteration
+        with self.assertRaises(ValueError):
+            the_plan.apply(self.conns)
+        self.assertFalse(self.origin.rename.called)
+        self.assertFalse(self.replica.add_entry.called)
+    def test_load_str(self):
+        ''' Test that a loaded plan hands python-ldap str, not unicode
+        '''
+        the_plan = plan.Plan()
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof,
+                          jira='JIRA-1', move=True)
+        out = StringIO()
+        the_plan.write_json(out)
+        out.seek(0)
+        plan.Plan.load(out).apply(self.conns)
+        strings = [self.origin.rename.call_args[0][0],
+                   self.origin.rename.call_args[0][1],
+                   self.origin.rename.call_args[1]['newsuperior']]
+        for call in self.origin.modify.call_args_list:
+            strings.append(call[0][0])
+            for _, attr, vals in call[0][1]:
+                strings.append(attr)
+                strings.extend(vals)
+        dn, attrs = self.replica.add_entry.call_args[0]
+        strings.append(dn)
+        for attr, vals in attrs.items():
+            strings.append(attr)
+            strings.extend(vals)
+        for string in strings:
+            self.assertIs(type(string), str)
+    def test_write_ldif(self):
+        ''' Test that LDIF output has one change record per planned change
+        '''
+        the_plan = plan.Plan(errors={'walrus': 'phx: not found'})
+        the_plan.add_user(self.conns, 'phx', 'flolrus', self.prof, move=True)
+        out = StringIO()
+        the_plan.write_ldif(out)
+        text = out.getvalue()
+        self.assertIn('# environment: phx (phx.example.com)', text)
+        self.assertIn('changetype: modrdn', text)
+        self.assertIn('newsuperior: %s' % LDAP.USERS, text)
+        self.assertEqual(text.count('changetype: modify'),
+                         len(the_plan.changes['phx']) - 1 +
+                         len(the_plan.changes['qa']) - 1)
+        self.assertIn('# not planned: walrus: phx: not found', text)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(PlanTestCase)
+    return the_suite
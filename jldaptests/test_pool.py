@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Tests LDAP connection pool
+
+Example:
+    import unittest
+    suite = test_pool.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import unittest
+import mock
+from jldap import pool, LDAP
+
+ENVIRONMENTS = {'phx': 'phx.example.com', 'qa': 'qa.example.com'}
+
+class PoolTestCase(unittest.TestCase):
+    ''' Test cases for jldap.pool
+    '''
+    def setUp(self):
+        ''' Patch out ldap.initialize so no real connections are made
+        '''
+        patcher = mock.patch('jldap.LDAP.ldap.initialize')
+        self.initialize = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.initialize.side_effect = lambda uri: mock.MagicMock()
+        self.pool = pool.Pool(environments=ENVIRONMENTS,
+                              user='binder',
+                              password='secret',
+                              max_size=2)
+    def test_checkout(self):
+        ''' Test that checkout hands out a bound connection to the env host
+        '''
+        conn = self.pool.checkout('phx')
+        self.assertEqual(conn.host, ENVIRONMENTS['phx'])
+        conn.conn.simple_bind_s.assert_called_once_with('binder', 'secret')
+    def test_reuse(self):
+        ''' Test that a checked in connection is handed out again
+        '''
+        conn = self.pool.checkout('phx')
+        self.pool.checkin(conn)
+        self.assertIs(self.pool.checkout('phx'), conn)
+        self.assertEqual(self.initialize.call_count, 1)
+    def test_keyed_per_server(self):
+        ''' Test that environments do not share connections
+        '''
+        conn = self.pool.checkout('phx')
+        self.pool.checkin(conn)
+        self.assertIsNot(self.pool.checkout('qa'), conn)
+    def test_concurrency_cap(self):
+        ''' Test that no more than max_size connections are handed out
+        '''
+        self.pool.checkout('phx')
+        self.pool.checkout('phx')
+        with self.assertRaises(pool.PoolTimeout):
+            self.pool.checkout('phx', timeout=0.01)
+        # other servers are unaffected
+        self.pool.checkout('qa', timeout=0.01)
+    def test_broken_evicted(self):
+        ''' Test that a connection raising an LDAP error is not reused
+        '''
+        with self.assertRaises(LDAP.ldap.LDAPError):
+            with self.pool.connection('phx') as conn:
+                raise LDAP.ldap.LDAPError()
+        self.assertIsNot(self.pool.checkout('phx'), conn)
+        # the broken connection's slot was given back
+        self.pool.checkout('phx', timeout=0.01)
+    def test_idle_evicted(self):
+        ''' Test that connections idle past max_idle are closed
+        '''
+        conn = self.pool.checkout('phx')
+        bound = conn.conn
+        self.pool.checkin(conn)
+        with mock.patch('jldap.pool.time.time',
+                        return_value=pool.time.time() + pool.MAX_IDLE + 1):
+            self.pool.evict()
+        bound.unbind_s.assert_called_once_with()
+        self.assertIsNot(self.pool.checkout('phx'), conn)
+    def test_unhealthy_replaced(self):
+        ''' Test that an idle connection which no longer answers is not
+            handed out again
+        '''
+        conn = self.pool.checkout('phx')
+        conn.conn.whoami_s.side_effect = LDAP.ldap.LDAPError()
+        self.pool.checkin(conn)
+        with mock.patch('jldap.pool.time.time',
+                        return_value=pool.time.time() + pool.CHECK_AFTER + 1):
+            fresh = self.pool.checkout('phx')
+        self.assertIsNot(fresh, conn)
+        self.assertIsNone(conn.conn)
+    def test_shared_cache(self):
+        ''' Test that a server's connections share one search cache, and
+            other servers' don't
+        '''
+        cached = pool.Pool(environments=ENVIRONMENTS, cache=True)
+        first = cached.checkout('phx')
+        second = cached.checkout('phx')
+        self.assertIsNotNone(first.cache)
+        self.assertIs(first.cache, second.cache)
+        self.assertIsNot(cached.checkout('qa').cache, first.cache)
+        self.assertIsNone(self.pool.checkout('phx').cache)
+    def test_close(self):
+        ''' Test that closing the pool unbinds idle connections
+        '''
+        conn = self.pool.checkout('phx')
+        bound = conn.conn
+        self.pool.checkin(conn)
+        self.pool.close()
+        bound.unbind_s.assert_called_once_with()
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(PoolTestCase)
+    return the_suite
@@ -103,6 +103,7 @@ class ProfileTestCase(unittest.TestCase):
         ''' Clean up after ourselves
         '''
         shutil.rmtree(self.temp_profiles)
+        shutil.rmtree(self.empty)
     def test_constructor(self):
         ''' Test that the constructor fails without an argument
         '''
@@ -233,6 +234,57 @@ class ProfileTestCase(unittest.TestCase):
         prof = profile.Profile(self.prof_file)
         self.assertEquals(PROFILE['owner'],
                           prof['owner'])
+    def test_permissions(self):
+        ''' Test the cached permission set and its normalised form
+        '''
+        prof = profile.Profile(self.prof_file)
+        groups = (PROFILE['posix-group'] +
+                  PROFILE['group-of-unique-names'] +
+                  PROFILE['samba-group-mapping'])
+        self.assertEqual(prof.permissions, frozenset(groups))
+        self.assertIs(prof.permissions, prof.permissions)
+        self.assertIn('cn=domain admins,ou=windows,ou=accessgroups,'
+                      'ou=groups,dc=example,dc=com',
+                      prof.normalized_permissions)
+    def test_from_dict(self):
+        ''' Test that a profile built from a parsed dict equals one read
+            from its file
+        '''
+        prof = profile.Profile.from_dict(self.prof_file, dict(PROFILE))
+        self.assertTrue(prof.obtained)
+        self.assertEqual(prof.name, PROF_FILE)
+        self.assertEqual(prof.permissions,
+                         profile.Profile(self.prof_file).permissions)
+    def test_registry(self):
+        ''' Test that the registry parses files once, and only changed
+            files after that
+        '''
+        cache = os.path.join(self.empty, 'cache.pickle')
+        registry = profile.ProfileRegistry(self.temp_profiles, cache=cache)
+        self.assertEqual(registry.parsed, 1)
+        self.assertEqual(registry[PROF_FILE].owner, PROFILE['owner'])
+        registry = profile.ProfileRegistry(self.temp_profiles, cache=cache)
+        self.assertEqual(registry.parsed, 0)
+        self.assertEqual(registry[PROF_FILE].permissions,
+                         profile.Profile(self.prof_file).permissions)
+        other = os.path.join(self.temp_profiles, 'other.yaml')
+        with open(other, 'w') as prof:
+            prof.write(yaml.dump({'owner': 'someone.else'}))
+        registry.reload()
+        self.assertEqual(registry.parsed, 1)
+        self.assertEqual(sorted(i.name for i in registry),
+                         ['other.yaml', PROF_FILE])
+        os.remove(other)
+        registry.reload()
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(registry.parsed, 0)
+    def test_registry_invalid(self):
+        ''' Test that malformed profiles are rejected
+        '''
+        with open(self.prof_file, 'w') as prof:
+            prof.write(yaml.dump({'posix-group': 'cn=not,dc=a,dc=list'}))
+        with self.assertRaises(ValueError):
+            profile.ProfileRegistry(self.temp_profiles, cache=False)
 
 def suite():
     ''' Create a suite of tests
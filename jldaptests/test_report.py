@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Tests streaming HTML reports
+
+Example:
+    import unittest
+    suite = test_report.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import unittest
+from StringIO import StringIO
+from collections import OrderedDict
+from jldap import report
+from jldap import profile
+
+TABLE = ('<html><head></head><body></body></html><table style="border: 1px '
+         'solid; border-width: 1px; border-color: #000000;">')
+
+''' AUDITS_HTML is what audits2html made of AUDITS when it built a
+    BeautifulSoup tree, which the streamed table must reproduce
+'''
+AUDITS = {'p.yaml': [OrderedDict([('user', 'u<1>'),
+                                  ('text', 'Profile match'),
+                                  ('diff', ['cn=a&b']),
+                                  ('value', 3),
+                                  ('owner', 'o')])]}
+AUDITS_HTML = (TABLE +
+               '<tbody><tr style="background-color: #88bbff;"><td colspan="5">'
+               'Profile: p.yaml, Owner: o</td></tr>'
+               '<tr style="background-color: #dbdbdb;"><td colspan="4">'
+               'Notes/Changes Required</td></tr>'
+               '<tr><td colspan="4">-</td></tr>'
+               '<tr style="background-color: #dbdbdb;"><td>user</td>'
+               '<td>text</td><td>diff</td></tr>'
+               '<tr><td><pre><p>u&lt;1&gt;</p><p></p></pre></td>'
+               '<td><pre><p>Profile match</p><p></p></pre></td>'
+               '<td><pre><p>- cn=a&amp;b</p><p></p></pre></td></tr>'
+               '</tbody></table>')
+
+class Recorder(StringIO):
+    ''' A stream which remembers what had been written at each flush
+    '''
+    def __init__(self):
+        StringIO.__init__(self)
+        self.flushed = []
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+class ReportTestCase(unittest.TestCase):
+    ''' Test cases for jldap.report
+    '''
+    def test_audits2html(self):
+        ''' Test that audits render as they did, without changing them
+        '''
+        self.assertEqual(profile.audits2html(AUDITS), AUDITS_HTML)
+        self.assertEqual(AUDITS['p.yaml'][0]['owner'], 'o')
+    def test_audit_pairs(self):
+        ''' Test that (name, audit) pairs render as the dict would, each row
+            out before the next audit is asked for
+        '''
+        stream = Recorder()
+        def pairs():
+            ''' AUDITS as pairs, checking nothing is held back
+            '''
+            yield 'p.yaml', AUDITS['p.yaml'][0]
+            self.assertTrue(stream.flushed[-1].endswith(
+                '<td><pre><p>- cn=a&amp;b</p><p></p></pre></td></tr>'))
+        report.write_audits(stream, pairs())
+        self.assertEqual(stream.getvalue(), AUDITS_HTML)
+    def test_audit_runs(self):
+        ''' Test that each run of one profile's audits gets one heading
+        '''
+        audit = AUDITS['p.yaml'][0]
+        html = report.audits2html([('p.yaml', audit),
+                                   ('p.yaml', audit),
+                                   ('q.yaml', audit)])
+        self.assertEqual(html.count('Profile: p.yaml'), 1)
+        self.assertEqual(html.count('Profile: q.yaml'), 1)
+        self.assertEqual(html.count('<td><pre><p>u&lt;1&gt;'), 3)
+    def test_streaming(self):
+        ''' Test that every row is out before the next is written
+        '''
+        stream = Recorder()
+        table = report.HTMLTable(stream, headings=['Name', 'Permissions'])
+        table.row([report.text('a&b'), report.pre({'key': ['value']})])
+        self.assertEqual(stream.flushed[-1],
+                         TABLE +
+                         '<thead style="background-color: #dbdbdb;"><tr>'
+                         '<th>Name</th><th>Permissions</th></tr></thead><tbody>'
+                         '<tr><td>a&amp;b</td><td><pre><p>key:</p>'
+                         '<p>- value</p><p></p></pre></td></tr>')
+        table.close()
+        table.close()
+        self.assertTrue(stream.getvalue().endswith('</tr></tbody></table>'))
+    def test_text(self):
+        ''' Test cell text escaping
+        '''
+        self.assertEqual(report.text(None), '')
+        self.assertEqual(report.text('<"&">'), '&lt;"&amp;"&gt;')
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(ReportTestCase)
+    return the_suite
@@ -122,6 +122,33 @@ class UserdictTestCase(unittest.TestCase):
         self.userdict['key'] = 1
         self.assertEqual(self.userdict['key'], 1)
 
+    def test_permissions(self):
+        ''' Test the flattened permissions, with and without inherited
+            groups, and that the underlying lists are left alone
+        '''
+        nested = ['a', ['b', ['c']], 'd']
+        temp_userdict = userdict.Userdict(name=NAME,
+                                          permissions={'memberUid': nested,
+                                                       'uniqueMember': ['a']})
+        self.assertEqual(temp_userdict.permissions(),
+                         frozenset(['a', 'b', 'c', 'd']))
+        self.assertEqual(temp_userdict.permissions(ignore_inherited=True),
+                         frozenset(['a', 'd']))
+        self.assertEqual(nested, ['a', ['b', ['c']], 'd'])
+
+    def test_permissions_invalidated(self):
+        ''' Test that the cached permissions follow assignments
+        '''
+        temp_userdict = userdict.Userdict(name=NAME,
+                                          permissions={'memberUid': ['a']})
+        self.assertEqual(temp_userdict.permissions(), frozenset(['a']))
+        temp_userdict['uniqueMember'] = ['b']
+        self.assertEqual(temp_userdict.permissions(), frozenset(['a', 'b']))
+        temp_userdict.update({'memberUid': []})
+        self.assertEqual(temp_userdict.permissions(), frozenset(['b']))
+        del temp_userdict['uniqueMember']
+        self.assertEqual(temp_userdict.permissions(), frozenset())
+
 def suite():
     ''' Create a suite of tests
     '''
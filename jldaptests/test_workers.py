@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Tests process-pool audits
+
+Example:
+    import unittest
+    suite = test_workers.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import mock
+import yaml
+from jldap import config
+from jldap import groups
+from jldap import matching
+from jldap import profile
+from jldap import workers
+from jldap.attdict import Attdict
+
+DOCKER = 'cn=docker,ou=roles,ou=groups,dc=example,dc=com'
+PWM = 'cn=pwm,ou=servicegroups,ou=groups,dc=example,dc=com'
+USERS = ['user%s' % i for i in range(20)]
+
+class WorkersTestCase(unittest.TestCase):
+    ''' Test cases for jldap.workers
+    '''
+    def setUp(self):
+        ''' Set up a profile directory and a group snapshot in which even
+            users are in both groups and odd users in docker only
+        '''
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        patcher = mock.patch.object(config, 'STATE_DIR', self.profile_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, posix in [('docker', [DOCKER]), ('both', [DOCKER, PWM])]:
+            with open(os.path.join(self.profile_dir, name + '.yaml'), 'w') as yml:
+                yaml.dump({'posix-group': posix, 'owner': 'first.last'}, yml)
+        self.snapshot = groups.GroupGraph(
+            [Attdict(dn=DOCKER, memberUid=USERS),
+             Attdict(dn=PWM, memberUid=USERS[::2])])
+    def test_audit_user(self):
+        ''' Test that a single audit is keyed by its profile's name
+        '''
+        profiles = list(profile.Profile.from_directory(self.profile_dir))
+        matcher = matching.Matcher(profiles)
+        name, the_audit = workers.audit_user(self.snapshot, matcher, 'user0')
+        self.assertEqual(name, 'both.yaml')
+        self.assertEqual(the_audit['text'], 'Profile match')
+        self.assertNotIn('name', the_audit)
+    def test_audit_users(self):
+        ''' Test that pooled audits come back in order and match serial ones
+        '''
+        profiles = list(profile.Profile.from_directory(self.profile_dir))
+        matcher = matching.Matcher(profiles)
+        serial = [workers.audit_user(self.snapshot, matcher, i) for i in USERS]
+        pooled = list(workers.audit_users(USERS,
+                                          {'host': 'ldap.example.com'},
+                                          self.profile_dir,
+                                          workers=2,
+                                          snapshot=self.snapshot,
+                                          chunksize=3))
+        self.assertEqual(pooled, serial)
+        self.assertEqual([i[0] for i in pooled[:2]], ['both.yaml', 'docker.yaml'])
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(WorkersTestCase)
+    return the_suite
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Tests YAML I/O
+
+Example:
+    import unittest
+    suite = test_yamlio.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import unittest
+from collections import defaultdict, OrderedDict
+import yaml
+from jldap import yamlio
+from jldap import userdict
+from jldap.attdict import Attdict
+
+class YamlioTestCase(unittest.TestCase):
+    ''' Test cases for jldap.yamlio
+    '''
+    def test_audits(self):
+        ''' Test that audits dump as plain, ordered yaml
+        '''
+        audits = defaultdict(list)
+        audits['admin.yaml'].append(OrderedDict([('user', 'flolrus'),
+                                                 ('text', 'Profile match'),
+                                                 ('diff', []),
+                                                 ('value', 3)]))
+        self.assertEqual(yamlio.dump(audits),
+                         'admin.yaml:\n'
+                         '- user: flolrus\n'
+                         '  text: Profile match\n'
+                         '  diff: []\n'
+                         '  value: 3\n')
+    def test_types(self):
+        ''' Test the other types we dump
+        '''
+        self.assertEqual(yamlio.dump(Attdict(b=1, a=(1, 2))),
+                         'a:\n- 1\n- 2\nb: 1\n')
+        self.assertEqual(yamlio.load(yamlio.dump(
+            userdict.Userdict(name='flolrus',
+                              permissions={'memberUid': frozenset('ba')}))),
+                         {'name': 'flolrus', 'permissions': {'memberUid': ['a', 'b']}})
+    def test_safe_load(self):
+        ''' Test that only plain yaml is loaded
+        '''
+        self.assertEqual(yamlio.load('a: [1, b]'), {'a': [1, 'b']})
+        with self.assertRaises(yaml.YAMLError):
+            yamlio.load('!!python/object/apply:os.getcwd []')
+    def test_stream(self):
+        ''' Test dumping to a stream rather than a string
+        '''
+        with open('/dev/null', 'w') as stream:
+            self.assertIsNone(yamlio.dump({'a': 1}, stream))
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestLoader().loadTestsFromTestCase(YamlioTestCase)
+    return the_suite
@@ -2,63 +2,99 @@
 ''' Main module, basically a script
 '''
 import os
+import sys
 import argparse
+import itertools
 import pprint
 import regex
 import okta.client as client
+import okta.asyncclient as asyncclient
+import okta.cache as cache
 
 CFGYML = os.path.join(os.path.dirname(__file__), 'key.yml')
 
 def apps_by_user(args):
     ''' Default function for userapps parser.
-        Gets applications per user from Okta client(s)
+        Gets applications per user from Okta client(s): users are looked up
+        by email in batches, then each user's applications come with their
+        app-level profiles embedded, up to args.workers users at once,
+        printing each user as soon as their apps are in. Anything cached
+        less than args.ttl seconds ago (unless args.refresh) is not asked for.
     '''
     users = args.users
-    uclient = client.UserClient.from_config(args.config_file)
-    aclient = client.AppClient.from_config(args.config_file)
-    uids = {}
-    for user in users:
-        uids[uclient.get_user_by_email(user).id] = user
-    user_apps = aclient.get_apps_by_user(uids.keys())
-    for uid, apps in user_apps.items():
-        print 'User: %s' % uids[uid]
-        print 'Apps:'
-        for app in apps:
-            if not regex.match(args.filter,
-                               app.label,
-                               {True: regex.I,
-                                False: 0}[args.sensitive]):
-                continue
-            appinfo = aclient.get_user_from_app(app, uid)
-            try:
-                role = appinfo.profile['role']
-            except KeyError:
-                print('No "role" in appinfo.profile. Appinfo: %s' % appinfo)
-                continue
-            samlrole = ', '.join(appinfo.profile['samlRoles'])
-            print ('%s:\n\tRole:%s\n\tSamlRoles:%s'
-                   % (app.label, role, samlrole))
-        print
+    session = client.Session(pool_size=args.workers)
+    uclient = client.UserClient.from_config(args.config_file, session=session)
+    aclient = client.AppClient.from_config(args.config_file, session=session)
+    with aclient.executor() as pool, cache.Cache(uclient,
+                                                 aclient,
+                                                 ttl=args.ttl,
+                                                 refresh=args.refresh) as cached:
+        found = cached.users_by_email(users)
+        for user in users:
+            if user not in found:
+                print 'No Okta user with email %s\n' % user
+        uids = dict((found[user].id, user) for user in found)
+        for uid, apps in cached.apps_for_users(uids.keys(), pool):
+            print 'User: %s' % uids[uid]
+            print 'Apps:'
+            apps = [app for app in apps or []
+                    if regex.match(args.filter,
+                                   app.label,
+                                   {True: regex.I,
+                                    False: 0}[args.sensitive])]
+            appinfos = pool.imap(lambda app, uid=uid: aclient.app_user(app, uid),
+                                 apps)
+            for app, appinfo in itertools.izip(apps, appinfos):
+                try:
+                    role = appinfo.profile['role']
+                except KeyError:
+                    print('No "role" in appinfo.profile. Appinfo: %s' % appinfo)
+                    continue
+                samlrole = ', '.join(appinfo.profile['samlRoles'])
+                print ('%s:\n\tRole:%s\n\tSamlRoles:%s'
+                       % (app.label, role, samlrole))
+            print
+    print_stats(args, aclient)
+
+def print_stats(args, aclient):
+    ''' Show request stats on stderr, if asked to
+    '''
+    if args.stats:
+        stats = aclient.stats
+        sys.stderr.write('%s requests, %s retries, %s errors, %.1fs throttled, '
+                         '%.3fs mean/%.3fs max latency\n'
+                         % (stats.requests, stats.retries, stats.errors,
+                            stats.throttled, stats.mean_latency,
+                            stats.max_latency))
 
 def users_by_app(args):
     ''' Default function for appusers parser.
-        Gets users per application from Okta client(s)
+        Gets users per application from Okta client(s), asking for every
+        matching application's users at once (up to args.workers at a time),
+        unless cached less than args.ttl seconds ago (and not args.refresh)
     '''
-    aclient = client.AppClient.from_config(args.config_file)
-    apps = aclient.get_apps_by_label(args.app)
-    for app in apps:
-        appusers = aclient.get_user_from_app(app)
-        print 'Users for application "%s"' % app.label
-        for user in appusers:
-            if 'firstName' not in user.profile or user.profile['firstName'] is None:
-                print 'Misconfigured user? %s' % pprint.pformat(user)
-            else:
-                print ('%s %s, %s'
-                       % (user.profile['firstName'],
-                          user.profile['lastName'],
-                          user.profile['email']))
-                print '\tRole: %s' % user.profile['role']
-                print '\tSAMLRoles: %s' % ', '.join(user.profile['samlRoles'])
+    session = client.Session(pool_size=args.workers)
+    uclient = client.UserClient.from_config(args.config_file, session=session)
+    with asyncclient.AsyncAppClient.from_config(args.config_file,
+                                                session=session) as aclient, \
+            cache.Cache(uclient,
+                        aclient.client,
+                        ttl=args.ttl,
+                        refresh=args.refresh) as cached:
+        apps = cached.apps_by_label(args.app)
+        for app, appusers in cached.app_users(apps, aclient.executor):
+            print 'Users for application "%s"' % app.label
+            for user in appusers:
+                if 'firstName' not in user.profile or user.profile['firstName'] is None:
+                    print 'Misconfigured user? %s' % pprint.pformat(user)
+                else:
+                    print ('%s %s, %s'
+                           % (user.profile['firstName'],
+                              user.profile['lastName'],
+                              user.profile['email']))
+                    print '\tRole: %s' % user.profile['role']
+                    print '\tSAMLRoles: %s' % ', '.join(user.profile['samlRoles'])
+        print_stats(args, aclient)
 
 def main():
     ''' Main function. Entry point.
@@ -67,6 +103,18 @@ def main():
     parser.add_argument('-c', '--config_file',
                         help='Path to config yaml',
                         default=CFGYML)
+    parser.add_argument('-r', '--refresh',
+                        help='Ask Okta for everything rather than use what is \
+cached under %s' % cache.STATE_DIR,
+                        action='store_true')
+    parser.add_argument('--ttl',
+                        help='Seconds cached users, apps and assignments are \
+used for before asking Okta again. Default: %s' % cache.TTL,
+                        type=int,
+                        default=cache.TTL)
+    parser.add_argument('--stats',
+                        help='Print Okta request counts and latency to stderr',
+                        action='store_true')
     subparsers = parser.add_subparsers(dest='subparser_name')
     userapps = subparsers.add_parser('userapps',
                                      help='Get apps by user email')
@@ -83,6 +131,11 @@ def main():
                           case-sensitive.',
                           action='store_false',
                           default=True)
+    userapps.add_argument('-w', '--workers',
+                          help='Okta requests to make at once; keep it well \
+under the tenant\'s rate limit. Default: %s' % client.POOL_SIZE,
+                          type=int,
+                          default=client.POOL_SIZE)
     userapps.set_defaults(func=apps_by_user)
 
     appusers = subparsers.add_parser('appusers',
@@ -91,6 +144,11 @@ def main():
                           help='Case-insensitive substring to match against \
 application labels',
                           type=str)
+    appusers.add_argument('-w', '--workers',
+                          help='Okta requests to make at once; keep it well \
+under the tenant\'s rate limit. Default: %s' % client.POOL_SIZE,
+                          type=int,
+                          default=client.POOL_SIZE)
     appusers.set_defaults(func=users_by_app)
     args = parser.parse_args()
     args.func(args)
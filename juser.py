@@ -12,7 +12,7 @@ Attributes:
 import argparse
 import os
 
-from jldap import functions
+from jldap import functions, fanout, config
 
 LDAP_YML = os.path.expanduser('~/.ldap.yml')
 PROFILE_DIR = os.path.expanduser('./profiles')
@@ -29,6 +29,14 @@ Default location: %s' % LDAP_YML)
     parser.add_argument('-e', '--environment',
                         default='phx',
                         help='LDAP environment (host) to use in connection(s).')
+    parser.add_argument('-t', '--timeout',
+                        default=fanout.TIMEOUT,
+                        type=int,
+                        help='Seconds to wait on each LDAP host when working \
+on all environments at once. Default: %s' % fanout.TIMEOUT)
+    parser.add_argument('-m', '--mirror',
+                        help='SQLite mirror for sync and --offline. Default: \
+one per host under %s' % config.STATE_DIR)
     subparsers = parser.add_subparsers(dest='subparser_name')
 
     search_parser = subparsers.add_parser('search')
@@ -40,8 +48,19 @@ Default location: %s' % LDAP_YML)
     search_parser.add_argument('-r', '--raw',
                                action='store_true',
                                help='Return raw LDAP object')
+    search_parser.add_argument('-o', '--offline',
+                               action='store_true',
+                               help='Search the mirror written by sync \
+instead of LDAP')
     search_parser.set_defaults(func=functions.usersearch)
 
+    sync_parser = subparsers.add_parser('sync')
+    sync_parser.add_argument('-f', '--full',
+                             action='store_true',
+                             help='Reload everything rather than only what \
+changed since the last sync')
+    sync_parser.set_defaults(func=functions.sync)
+
     enable_parser = subparsers.add_parser('enable')
     enable_parser.add_argument('user',
                                help='User to enable in LDAP')
@@ -72,6 +91,58 @@ enablement')
                                 help='User to disable in LDAP')
     disable_parser.set_defaults(func=functions.userdisable)
 
+    bulk_parser = subparsers.add_parser('bulk')
+    bulk_parser.add_argument('action',
+                             choices=['enable', 'move', 'disable'],
+                             help='What to do to every user')
+    bulk_parser.add_argument('users',
+                             nargs='*',
+                             help='Users to act on. If none are given they are \
+read from --file, one per line, as CSV (user,profile,jira) or JSON objects')
+    bulk_parser.add_argument('-f', '--file',
+                             default='-',
+                             help='File of users to act on. Default: stdin')
+    bulk_parser.add_argument('-P', '--profile',
+                             help='Profile for users the file gives none for')
+    bulk_parser.add_argument('-j', '--jira',
+                             help='JIRA for users the file gives none for')
+    bulk_parser.add_argument('-p', '--profile_dir',
+                             default=PROFILE_DIR,
+                             help='Directory in which profiles reside')
+    bulk_parser.set_defaults(func=functions.bulk)
+
+    plan_parser = subparsers.add_parser('plan')
+    plan_parser.add_argument('action',
+                             choices=['enable', 'move'],
+                             help='What would be done to every user')
+    plan_parser.add_argument('users',
+                             nargs='*',
+                             help='Users to plan for. If none are given they \
+are read from --file, as for bulk')
+    plan_parser.add_argument('-f', '--file',
+                             default='-',
+                             help='File of users to plan for. Default: stdin')
+    plan_parser.add_argument('-P', '--profile',
+                             help='Profile for users the file gives none for')
+    plan_parser.add_argument('-j', '--jira',
+                             help='JIRA for users the file gives none for')
+    plan_parser.add_argument('-p', '--profile_dir',
+                             default=PROFILE_DIR,
+                             help='Directory in which profiles reside')
+    plan_parser.add_argument('--format',
+                             choices=['json', 'ldif'],
+                             default='json',
+                             help='json (for apply) or ldif (for review). \
+Default: json')
+    plan_parser.add_argument('-o', '--output',
+                             help='File to write the plan to. Default: stdout')
+    plan_parser.set_defaults(func=functions.plan_users)
+
+    apply_parser = subparsers.add_parser('apply')
+    apply_parser.add_argument('plan',
+                              help='JSON plan written by the plan command')
+    apply_parser.set_defaults(func=functions.apply_plan)
+
     audit_parser = subparsers.add_parser('audit')
     audit_parser.add_argument('-p', '--profile_dir',
                               default=PROFILE_DIR,
@@ -94,6 +165,30 @@ groups)')
                               action='store_true',
                               help='Use explicit audits per profile (include \
 name and diff even if no match)')
+    audit_parser.add_argument('-s', '--snapshot',
+                              default=False,
+                              action='store_true',
+                              help='Load every group once and audit from an \
+in-memory snapshot instead of searching per user')
+    audit_parser.add_argument('-w', '--workers',
+                              default=1,
+                              type=int,
+                              help='Number of worker processes to audit with, \
+each with its own LDAP connection (or a copy of --snapshot). Default: 1')
+    audit_parser.add_argument('-I', '--incremental',
+                              default=False,
+                              action='store_true',
+                              help='Only audit users affected by changes since \
+the last incremental audit and report the rest from its saved results \
+(ignored with --users)')
+    audit_parser.add_argument('--state',
+                              help='State file for --incremental. Default: \
+one per host under %s' % config.STATE_DIR)
+    audit_parser.add_argument('-o', '--offline',
+                              default=False,
+                              action='store_true',
+                              help='Audit the mirror written by sync instead \
+of LDAP (implies --snapshot, ignores --incremental)')
     audit_parser.set_defaults(func=functions.audit)
 
     explicit_audit_parser = subparsers.add_parser('explicit_audit')
@@ -117,6 +212,16 @@ format')
                                        action='store_true',
                                        help='Ignore inherited permissions (e.g. parent \
 groups)')
+    explicit_audit_parser.add_argument('-s', '--snapshot',
+                                       default=False,
+                                       action='store_true',
+                                       help='Load every group once and audit \
+from an in-memory snapshot instead of searching per user')
+    explicit_audit_parser.add_argument('-o', '--offline',
+                                       default=False,
+                                       action='store_true',
+                                       help='Audit the mirror written by sync \
+instead of LDAP (implies --snapshot)')
     explicit_audit_parser.set_defaults(func=functions.explicit_audit)
 
     profiles_parser = subparsers.add_parser('profiles')
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+''' Module for making Okta api requests without waiting on each one
+
+    Example:
+        import okta.asyncclient
+        with okta.asyncclient.AsyncAppClient.from_config(path) as aclient:
+            futures = [(app, aclient.get_user_from_app(app))
+                       for app in aclient.get_apps_by_label(label)]
+            for app, future in futures:
+                print app.label, len(future.result())
+
+    The clients here have the method surface of okta.client's, but every
+    single-result request is submitted to a bounded okta.executor.Executor
+    and returns an okta.executor.Future straight away, and every listing
+    is a stream (see okta.client.Client.iter_items). Requests all go through
+    one okta.client.Session, so they share its keep-alive pool, rate
+    limiting and stats, and no more of them are in flight than it has
+    connections.
+'''
+from okta import client
+
+class AsyncClient(object):
+    ''' Future-returning counterpart of okta.client.Client
+    '''
+    CLIENT = client.Client
+    def __init__(self, *args, **kwargs):
+        ''' Takes okta.client.Client's arguments, plus an executor to share;
+            by default the client gets its own, sized to its session
+        '''
+        executor = kwargs.pop('executor', None)
+        self._client = self.CLIENT(*args, **kwargs)
+        self._own_executor = executor is None
+        self._executor = (executor
+                          if executor is not None
+                          else self._client.executor())
+    @classmethod
+    def from_config(cls, path_to_yaml, **kwargs):
+        ''' Generate a client from a yaml config, plus kwargs
+        '''
+        conf_dict = client.load_config(path_to_yaml)
+        conf_dict.update(kwargs)
+        return cls(**conf_dict)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        ''' Stop the executor, if it is this client's own
+        '''
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+    @property
+    def client(self):
+        ''' The wrapped okta.client client
+        '''
+        return self._client
+    @property
+    def session(self):
+        ''' The okta.client.Session requests go through
+        '''
+        return self._client.session
+    @property
+    def stats(self):
+        ''' The session's request stats
+        '''
+        return self._client.stats
+    @property
+    def executor(self):
+        ''' The okta.executor.Executor requests run on
+        '''
+        return self._executor
+    def submit(self, method, *args, **kwargs):
+        ''' Run one of the wrapped client's methods on the executor
+        '''
+        return self._executor.submit(getattr(self._client, method),
+                                     *args,
+                                     **kwargs)
+    def get(self, req):
+        ''' Future of okta.client.Client.get
+        '''
+        return self.submit('get', req)
+    def iter_pages(self, req, **kwargs):
+        ''' Stream of pages, as okta.client.Client.iter_pages
+        '''
+        return self._client.iter_pages(req, **kwargs)
+    def iter_items(self, req, **kwargs):
+        ''' Stream of items, as okta.client.Client.iter_items
+        '''
+        return self._client.iter_items(req, **kwargs)
+
+class AsyncUserClient(AsyncClient):
+    ''' Future-returning counterpart of okta.client.UserClient
+    '''
+    CLIENT = client.UserClient
+    def get_users(self, **kwargs):
+        ''' Stream of every user
+        '''
+        return self._client.get_users(**kwargs)
+    def get_user_by_email(self, email):
+        ''' Future of the user with an email address
+        '''
+        return self.submit('get_user_by_email', email)
+    def iter_users_by_email(self, emails):
+        ''' Stream of the users with any of emails, looked up in batches
+        '''
+        return self._client.iter_users_by_email(emails)
+    def get_users_by_email(self, emails):
+        ''' Future of email:user for each of emails with a user
+        '''
+        return self.submit('get_users_by_email', emails)
+
+class AsyncAppClient(AsyncClient):
+    ''' Future-returning counterpart of okta.client.AppClient
+    '''
+    CLIENT = client.AppClient
+    def get_apps_by_label(self, label):
+        ''' Stream of the applications whose labels match label
+        '''
+        return self._client.get_apps_by_label(label)
+    def get_user_from_app(self, app, user=None):
+        ''' Future of application-context user info (see
+            okta.client.AppClient.get_user_from_app)
+        '''
+        return self.submit('get_user_from_app', app, user)
+    def get_apps_by_user(self, uids, expand=False):
+        ''' Stream of (user id, applications), in the order they come in
+        '''
+        return self._client.iter_apps_by_user(uids,
+                                              executor=self._executor,
+                                              expand=expand)
+    def app_user(self, app, user):
+        ''' Future of a user's app-level info, see
+            okta.client.AppClient.app_user
+        '''
+        return self.submit('app_user', app, user)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+''' Module for keeping Okta users, apps and app assignments on disk
+
+    Example:
+        import okta.cache
+        with okta.cache.Cache(uclient, aclient) as cache:
+            users = cache.users_by_email(emails)
+            for uid, apps in cache.apps_for_users([i.id for i in users.values()]):
+                for app in apps:
+                    print app.label, aclient.app_user(app, uid).profile
+
+    Users are cached as they are looked up by email. Once the cache is older
+    than ttl, the cached users are brought up to date with a single
+    lastUpdated gt "..." search, which returns only users changed since.
+    The app list, each app's users, and each user's apps (with the user's
+    app-level info embedded, as AppClient.iter_apps_by_user(expand=True)
+    returns them) are fetched again once older than ttl. Those requests are
+    conditional (If-None-Match) whenever Okta gave an ETag, so an unchanged
+    listing costs one 304. With refresh, everything used is fetched again
+    regardless of age.
+
+    The database is only touched from the thread which created the Cache;
+    fetches handed to an executor return their results to it.
+
+    Attributes:
+        STATE_DIR (str): Directory for cache files
+        TTL (int): Default seconds cached data is used without asking Okta
+        SKEW (int): Seconds to reach back before the last user sweep
+        VERSION (int): Schema version; caches of other versions are rebuilt
+        SCHEMA (str): Tables and indexes
+'''
+import json
+import os
+import sqlite3
+import time
+import urlparse
+import regex
+
+from okta.attdict import Attdict
+from okta.client import PAGE_LIMIT
+from okta.executor import as_completed
+
+STATE_DIR = os.path.expanduser('~/.jokta')
+TTL = 3600
+SKEW = 300
+VERSION = 1
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT);
+CREATE TABLE IF NOT EXISTS fetched (
+    what TEXT PRIMARY KEY,
+    at REAL NOT NULL,
+    etag TEXT);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT,
+    data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS apps (
+    id TEXT PRIMARY KEY,
+    label TEXT,
+    data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS app_users (
+    app_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (app_id, user_id));
+CREATE INDEX IF NOT EXISTS app_users_user ON app_users (user_id);
+CREATE TABLE IF NOT EXISTS user_apps (
+    user_id TEXT NOT NULL,
+    app_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, app_id));
+'''
+
+def state_path(baseurl):
+    ''' Default cache file for an Okta tenant
+    '''
+    return os.path.join(STATE_DIR,
+                        'cache-%s.sqlite' % urlparse.urlsplit(baseurl).netloc)
+
+def okta_time(when):
+    ''' Okta's timestamp format for a unix timestamp
+    '''
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(when))
+
+def _dumps(item):
+    ''' An Okta object as stored
+    '''
+    return json.dumps(item, sort_keys=True)
+
+def _loads(data):
+    ''' A stored Okta object
+    '''
+    return Attdict(json.loads(data))
+
+class Cache(object):
+    ''' SQLite cache of one Okta tenant, filled through a UserClient and an
+        AppClient
+    '''
+    # pylint: disable=too-many-arguments
+    def __init__(self, uclient, aclient, path=None, ttl=TTL, refresh=False,
+                 clock=time.time):
+        self._users = uclient
+        self._apps = aclient
+        self._path = path or state_path(aclient.apps_url())
+        self._ttl = ttl
+        self._refresh = refresh
+        self._clock = clock
+        self._fetched = set() # what this instance fetched itself
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if not os.path.exists(self._path):
+            # users' details; keep them to ourselves
+            os.close(os.open(self._path, os.O_WRONLY | os.O_CREAT, 0600))
+        self._db = sqlite3.connect(self._path)
+        try:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?',
+                                   ('version',)).fetchone()
+        except sqlite3.OperationalError: # no schema yet
+            row = None
+        if row and row[0] != str(VERSION):
+            with self._db:
+                for table in ['meta', 'fetched', 'users', 'apps',
+                              'app_users', 'user_apps']:
+                    self._db.execute('DROP TABLE IF EXISTS %s' % table)
+        self._db.executescript(SCHEMA)
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                             ('version', str(VERSION)))
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        ''' Close the database
+        '''
+        self._db.close()
+    @property
+    def path(self):
+        ''' The cache file
+        '''
+        return self._path
+    def _fetched_row(self, what):
+        ''' (time, etag) what was last fetched, None if it never was
+        '''
+        return self._db.execute('SELECT at, etag FROM fetched WHERE what = ?',
+                                (what,)).fetchone()
+    def fresh(self, what):
+        ''' Whether what can be answered without asking Okta
+        '''
+        if what in self._fetched:
+            return True
+        if self._refresh:
+            return False
+        row = self._fetched_row(what)
+        return row is not None and self._clock() - row[0] < self._ttl
+    def _mark(self, what, etag=None, when=None):
+        ''' Note that what was fetched (at when, by default now)
+        '''
+        self._fetched.add(what)
+        self._db.execute('INSERT OR REPLACE INTO fetched VALUES (?, ?, ?)',
+                         (what, self._clock() if when is None else when, etag))
+    def _store_users(self, users):
+        ''' Insert or replace users
+        '''
+        self._db.executemany('INSERT OR REPLACE INTO users VALUES (?, ?, ?)',
+                             [(i.id,
+                               (i.get('profile', {}).get('email') or '').lower(),
+                               _dumps(i))
+                              for i in users])
+    def _sweep_users(self):
+        ''' Bring cached users up to date with one search for everyone
+            changed since the last sweep
+        '''
+        row = self._fetched_row('users')
+        started = self._clock()
+        with self._db:
+            if row is not None:
+                since = okta_time(row[0] - SKEW)
+                changed = self._users.iter_items(
+                    self._users.users_url('lastUpdated gt "%s"' % since),
+                    limit=PAGE_LIMIT)
+                known = set(i for (i,) in self._db.execute('SELECT id FROM users'))
+                self._store_users(i for i in changed if i.id in known)
+            self._mark('users', when=started)
+    def users_by_email(self, emails):
+        ''' Map each of emails to its user, leaving out emails with none.
+            Emails not cached yet (all of them, with refresh) are looked up
+            together, see UserClient.iter_users_by_email.
+        '''
+        if not self.fresh('users'):
+            self._sweep_users()
+        found = {}
+        for email in emails:
+            row = self._db.execute('SELECT data FROM users WHERE email = ?',
+                                   (email.lower(),)).fetchone()
+            if row and not self._refresh:
+                found[email] = _loads(row[0])
+        missing = [i for i in emails if i not in found]
+        if missing:
+            with self._db:
+                self._store_users(
+                    self._users.get_users_by_email(missing).values())
+            for email in missing:
+                row = self._db.execute('SELECT data FROM users WHERE email = ?',
+                                       (email.lower(),)).fetchone()
+                if row:
+                    found[email] = _loads(row[0])
+        return found
+    def _store_apps(self, apps):
+        ''' Insert or replace apps, less anything embedded
+        '''
+        self._db.executemany('INSERT OR REPLACE INTO apps VALUES (?, ?, ?)',
+                             [(i.id,
+                               i.get('label'),
+                               _dumps(dict((j, k) for j, k in i.items()
+                                           if j != '_embedded')))
+                              for i in apps])
+    def apps(self):
+        ''' Every application, by label
+        '''
+        if not self.fresh('apps'):
+            row = self._fetched_row('apps')
+            status, content, etag = self._apps.get_if_changed(
+                self._apps.apps_url(),
+                etag=row[1] if row and not self._refresh else None)
+            with self._db:
+                if status == 200:
+                    self._db.execute('DELETE FROM apps')
+                    self._store_apps(content)
+                if status in (200, 304):
+                    self._mark('apps', etag)
+        return [_loads(i) for (i,) in self._db.execute(
+            'SELECT data FROM apps ORDER BY label')]
+    def apps_by_label(self, label):
+        ''' Applications whose labels match label, as
+            AppClient.get_apps_by_label
+        '''
+        return [i for i in self.apps()
+                if regex.search(label, i.label, regex.I)]
+    def _fetch(self, executor, what, req, requests):
+        ''' Submit a conditional fetch of req unless what is fresh, adding
+            the future to requests
+        '''
+        if self.fresh(what):
+            return
+        row = self._fetched_row(what)
+        requests[what] = executor.submit(
+            self._apps.get_if_changed,
+            req,
+            etag=row[1] if row and not self._refresh else None)
+    def app_users(self, apps, executor):
+        ''' Generate (app, its users) for each of apps, in order, fetching
+            those not fresh on executor, all at once
+        '''
+        apps = list(apps)
+        requests = {}
+        for app in apps:
+            self._fetch(executor, 'app/%s' % app.id,
+                        self._apps.app_users_url(app), requests)
+        for app in apps:
+            what = 'app/%s' % app.id
+            if what in requests:
+                status, content, etag = requests[what].result()
+                with self._db:
+                    if status == 200:
+                        self._db.execute('DELETE FROM app_users WHERE app_id = ?',
+                                         (app.id,))
+                        self._db.executemany(
+                            'INSERT INTO app_users VALUES (?, ?, ?)',
+                            [(app.id, i.id, _dumps(i)) for i in content])
+                    if status in (200, 304):
+                        self._mark(what, etag)
+            yield app, [_loads(i) for (i,) in self._db.execute(
+                'SELECT data FROM app_users WHERE app_id = ? ORDER BY user_id',
+                (app.id,))]
+    def apps_for_users(self, uids, executor):
+        ''' Generate (user id, applications) for each of uids, each
+            application with the user's app-level info embedded, as
+            AppClient.iter_apps_by_user(expand=True); those not fresh are
+            fetched on executor, all at once, and come as they arrive
+        '''
+        requests = {}
+        for uid in uids:
+            self._fetch(executor, 'user/%s' % uid,
+                        self._apps.user_apps_url(uid, expand=True), requests)
+        for uid in uids:
+            if 'user/%s' % uid not in requests:
+                yield uid, self._user_apps(uid)
+        pending = dict((future, what) for what, future in requests.items())
+        for future in as_completed(pending):
+            uid = pending[future].split('/', 1)[1]
+            status, content, etag = future.result()
+            with self._db:
+                if status == 200:
+                    self._store_apps(content)
+                    self._db.execute('DELETE FROM user_apps WHERE user_id = ?',
+                                     (uid,))
+                    self._db.executemany('INSERT INTO user_apps VALUES (?, ?)',
+                                         [(uid, i.id) for i in content])
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO app_users VALUES (?, ?, ?)',
+                        [(i.id, uid, _dumps(i['_embedded']['user']))
+                         for i in content
+                         if i.get('_embedded', {}).get('user')])
+                if status in (200, 304):
+                    self._mark(pending[future], etag)
+            yield uid, self._user_apps(uid)
+    def _user_apps(self, uid):
+        ''' A user's cached applications, with app-level info embedded
+        '''
+        apps = []
+        for app, appuser in self._db.execute(
+                'SELECT a.data, u.data FROM user_apps ua '
+                'JOIN apps a ON a.id = ua.app_id '
+                'LEFT JOIN app_users u ON u.app_id = ua.app_id '
+                'AND u.user_id = ua.user_id '
+                'WHERE ua.user_id = ? ORDER BY a.label', (uid,)):
+            app = _loads(app)
+            if appuser:
+                app['_embedded'] = {'user': json.loads(appuser)}
+            apps.append(app)
+        return apps
@@ -1,56 +1,292 @@
 #!/usr/bin/env python
 ''' Module for encapsulating requests against the Okta api
     Docs: http://developer.okta.com/docs/sdk/core/python_api_sdk/
+
+    Every client talks through a Session: one keep-alive connection pool
+    (of at most POOL_SIZE connections, callers queue for a free one) which
+    retries 429s and 5xxs with exponential backoff and slows down as Okta's
+    X-Rate-Limit-Remaining runs low. Clients built with the same session
+    share its pool, rate-limit state and stats.
 '''
+import random
 import threading
-import Queue
+import time
+import urllib
+import urlparse
 import requests
+import requests.adapters
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 import regex
 
 from okta.attdict import Attdict
+from okta.executor import Executor, prefetched, PREFETCH
 
 BASEURL = 'https://example.okta.com'
-MAX_REQ_THREADS = 100
+POOL_SIZE = 20
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 60
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+THROTTLE_AT = 0.1
+PAGE_LIMIT = 200
+MAX_URL_LEN = 4000
+
+def load_config(path_to_yaml):
+    ''' The client keyword arguments in a yaml config
+    '''
+    with open(path_to_yaml, 'r') as conf:
+        return yaml.load(conf.read(), Loader=SafeLoader)
+
+def with_limit(req, limit):
+    ''' req asking for pages of limit items, unless it sets a limit itself
+    '''
+    query = urlparse.urlsplit(req).query
+    if not limit or 'limit=' in query:
+        return req
+    return '%s%slimit=%d' % (req, '&' if query else '?', limit)
+
+def or_expressions(attr, values, max_len):
+    ''' Okta expressions matching attr against any of values, OR-combined
+        into as few expressions as stay within max_len once url-quoted
+        (unless a single clause is longer by itself)
+    '''
+    separator = len(urllib.quote(' or '))
+    chunk, length = [], 0
+    for value in values:
+        clause = '%s eq "%s"' % (attr, value.replace('"', '\\"'))
+        size = len(urllib.quote(clause))
+        if chunk and length + separator + size > max_len:
+            yield ' or '.join(chunk)
+            chunk, length = [], 0
+        length += (separator if chunk else 0) + size
+        chunk.append(clause)
+    if chunk:
+        yield ' or '.join(chunk)
+
+class RateLimiter(object):
+    ''' Keeps track of Okta's X-Rate-Limit-* headers per endpoint (Okta
+        limits e.g. /api/v1/users and /api/v1/apps separately) and works out
+        how long to hold off before the next request: nothing while plenty
+        of the limit is left, then the time to the reset spread over what
+        remains, then the whole time to the reset once nothing does
+    '''
+    def __init__(self, throttle_at=THROTTLE_AT, clock=time.time):
+        self._throttle_at = throttle_at
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._limits = {} # endpoint: (limit, remaining, reset)
+    @staticmethod
+    def endpoint(url):
+        ''' The rate-limited endpoint a url belongs to, e.g. /api/v1/apps
+        '''
+        return '/'.join(urlparse.urlparse(url).path.split('/')[:4])
+    def update(self, url, headers):
+        ''' Note the rate-limit headers of a response to url
+        '''
+        try:
+            limit = int(headers['X-Rate-Limit-Limit'])
+            remaining = int(headers['X-Rate-Limit-Remaining'])
+            reset = int(headers['X-Rate-Limit-Reset'])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            self._limits[self.endpoint(url)] = (limit, remaining, reset)
+    def delay(self, url):
+        ''' Seconds to wait before requesting url
+        '''
+        with self._lock:
+            limit, remaining, reset = self._limits.get(self.endpoint(url),
+                                                       (0, 0, 0))
+            left = reset - self._clock()
+            if left <= 0 or remaining > limit * self._throttle_at:
+                return 0
+            if remaining <= 0:
+                return left
+            # count the request against the window already, so concurrent
+            # callers are spread out rather than all let through at once
+            self._limits[self.endpoint(url)] = (limit, remaining - 1, reset)
+            return left / remaining
+    def reset_in(self, url):
+        ''' Seconds until url's limit resets, None if unknown
+        '''
+        with self._lock:
+            if self.endpoint(url) not in self._limits:
+                return None
+            return max(self._limits[self.endpoint(url)][2] - self._clock(), 0)
+
+class Session(requests.Session):
+    ''' requests.Session with a bounded keep-alive pool, retries with
+        backoff, rate-limit throttling and request stats
+    '''
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES, backoff=BACKOFF):
+        super(Session, self).__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size,
+                                                pool_block=True)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.pool_size = pool_size
+        self.limiter = RateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(['requests', 'retries', 'errors',
+                                     'throttled', 'latency', 'max_latency'], 0)
+    @property
+    def stats(self):
+        ''' Requests made, retries, connection errors, seconds spent
+            throttled, and total, mean and worst latency in seconds
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mean_latency'] = stats['latency'] / max(stats['requests'], 1)
+        return Attdict(stats)
+    def _count(self, key, value=1):
+        ''' Add to a stat
+        '''
+        with self._lock:
+            self._stats[key] += value
+            if key == 'latency':
+                self._stats['max_latency'] = max(self._stats['max_latency'],
+                                                 value)
+    def pause(self, attempt, url, resp=None):
+        ''' Seconds to wait before retry number attempt (from 0): until the
+            rate limit resets for a 429, exponential backoff with jitter
+            otherwise
+        '''
+        if resp is not None and resp.status_code == 429:
+            reset_in = self.limiter.reset_in(url)
+            if reset_in is not None:
+                return reset_in + random.uniform(0, 1)
+        return min(self.backoff * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1)
+    def fetch(self, url, **kwargs):
+        ''' GET url, throttled and retried. Returns the last response, or
+            raises the last connection error
+        '''
+        for attempt in range(self.retries + 1):
+            waited = self.limiter.delay(url)
+            if waited:
+                self._count('throttled', waited)
+                time.sleep(waited)
+            started = time.time()
+            try:
+                resp = self.get(url, **kwargs)
+            except requests.ConnectionError:
+                self._count('errors')
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.pause(attempt, url))
+                continue
+            self._count('requests')
+            self._count('latency', time.time() - started)
+            self.limiter.update(url, resp.headers)
+            if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return resp
+            self._count('retries')
+            time.sleep(self.pause(attempt, url, resp))
 
 class Client(object):
     ''' Abstract client for making Okta api requests
     '''
-    def __init__(self, baseurl=BASEURL, api_key=''):
+    def __init__(self, baseurl=BASEURL, api_key='', session=None):
         ''' Initialize the class (and subclasses) with baseurl and api_key, if
-            provided
+            provided, and a Session (a new one unless one is given to share)
         '''
         self._url = baseurl
         self._headers = {'Accept': 'application/json',
                          'Content-Type': 'application/json',
                          'Authorization': 'SSWS %s' % api_key}
+        self._session = session if session is not None else Session()
     @classmethod
-    def from_config(cls, path_to_yaml):
-        ''' Generate a client from a yaml config
+    def from_config(cls, path_to_yaml, **kwargs):
+        ''' Generate a client from a yaml config, plus kwargs
         '''
-        with open(path_to_yaml, 'r') as conf:
-            conf_dict = yaml.load(conf.read())
+        conf_dict = load_config(path_to_yaml)
+        conf_dict.update(kwargs)
         return cls(**conf_dict)
+    @property
+    def session(self):
+        ''' The Session requests go through
+        '''
+        return self._session
+    @property
+    def stats(self):
+        ''' The session's request stats
+        '''
+        return self._session.stats
+    def executor(self, workers=None):
+        ''' An okta.executor.Executor for running requests through this
+            client concurrently, by default as many at once as the session
+            has connections
+        '''
+        return Executor(workers or self._session.pool_size)
 
     def get(self, req):
         ''' Perform an HTTP GET with request 'req' and class headers
             Return object-like items or None if there was a problem
         '''
-        resp = requests.get(req, headers=self._headers)
-        if resp.status_code >= 400:
-            print 'Problem with request "%s":\n%s' % (req, resp.text)
+        resp = next(self._responses(req), None)
+        if resp is None:
             return None
+        return self._content(resp)
+    def get_if_changed(self, req, etag=None):
+        ''' Client.get, conditional on the resource no longer having etag.
+            Returns (status code, content, etag): content is None unless
+            the status is 200; 304 means etag still holds.
+        '''
+        resp = next(self._responses(req, etag=etag), None)
+        if resp is None:
+            return None, None, None
+        if resp.status_code == 304:
+            return 304, None, etag
+        return resp.status_code, self._content(resp), resp.headers.get('ETag')
+    def _content(self, resp):
+        ''' Object-like items of a response and of every page after it
+        '''
         content = resp.json()
-        while 'next' in resp.links:
-            resp = requests.get(resp.links['next']['url'],
-                                headers=self._headers)
-            if isinstance(content, dict):
-                content.update(resp.json())
-            else:
-                content += resp.json()
         if isinstance(content, dict):
             return Attdict(content)
-        return [Attdict(i) for i in content]
+        content = [Attdict(i) for i in content]
+        if 'next' in resp.links:
+            content.extend(self.iter_items(resp.links['next']['url']))
+        return content
+    def _responses(self, req, etag=None):
+        ''' Generate the response to req and to each page after it, stopping
+            at (and reporting) the first one which fails. Given an etag, the
+            first request is conditional, and a 304 is the only response.
+        '''
+        headers = self._headers
+        if etag:
+            headers = dict(headers, **{'If-None-Match': etag})
+        while req:
+            resp = self._session.fetch(req, headers=headers)
+            headers = self._headers
+            if resp.status_code >= 400:
+                print 'Problem with request "%s":\n%s' % (req, resp.text)
+                return
+            yield resp
+            if resp.status_code == 304:
+                return
+            req = resp.links.get('next', {}).get('url')
+    def iter_pages(self, req, limit=None, prefetch=PREFETCH):
+        ''' Generate each page (the decoded json) of req as it arrives, asking
+            for pages of limit items if given. Up to prefetch pages are
+            fetched ahead in the background while the caller works.
+        '''
+        pages = (i.json() for i in self._responses(with_limit(req, limit)))
+        return prefetched(pages, size=prefetch)
+    def iter_items(self, req, limit=None, prefetch=PREFETCH):
+        ''' Generate the object-like items of each page of req, as iter_pages
+        '''
+        for page in self.iter_pages(req, limit=limit, prefetch=prefetch):
+            if isinstance(page, dict):
+                yield Attdict(page)
+                continue
+            for item in page:
+                yield Attdict(item)
 
 class UserClient(Client):
     ''' Subclass for making specifically Users-related requests
@@ -60,17 +296,43 @@ class UserClient(Client):
         '''
         super(UserClient, self).__init__(*args, **kwargs)
         self._uri = '/api/v1/users'
-    def get_users(self):
-        ''' Get all users
+    def get_users(self, limit=PAGE_LIMIT):
+        ''' Generate every user, a page of limit at a time
+        '''
+        return self.iter_items(self.users_url(), limit=limit)
+    def users_url(self, expression=None):
+        ''' Url of every user, or of those matching a filter expression
         '''
         req = self._url + self._uri
-        return self.get(req)
+        if expression:
+            req += '?filter=' + urllib.quote(expression)
+        return req
     def get_user_by_email(self, email):
         ''' Search and return okta users by email address
             Probably the easiest way to search
         '''
         req = self._url+self._uri+'/'+email
         return self.get(req)
+    def iter_users_by_email(self, emails):
+        ''' Generate the users with any of emails, searching for as many at
+            once as fit in a url
+        '''
+        base = '%s%s?limit=%d&search=' % (self._url, self._uri, PAGE_LIMIT)
+        for expression in or_expressions('profile.email',
+                                         emails,
+                                         MAX_URL_LEN - len(base)):
+            for user in self.iter_items(base + urllib.quote(expression)):
+                yield user
+    def get_users_by_email(self, emails):
+        ''' Map each of emails to its user, leaving out emails with none
+        '''
+        wanted = dict((i.lower(), i) for i in emails)
+        found = {}
+        for user in self.iter_users_by_email(wanted.values()):
+            email = (user.profile.get('email') or '').lower()
+            if email in wanted:
+                found[wanted[email]] = user
+        return found
 
 class AppClient(Client):
     ''' Subclass for making specifically App-related requests
@@ -80,10 +342,14 @@ class AppClient(Client):
         '''
         super(AppClient, self).__init__(*args, **kwargs)
         self._uri = '/api/v1/apps'
+    def apps_url(self):
+        ''' Url of every application
+        '''
+        return self._url+self._uri
     def get_apps_by_label(self, label):
         ''' Try to find an application (and its ID) by a human-readable label
         '''
-        apps = self.get(self._url+self._uri)
+        apps = self.iter_items(self.apps_url(), limit=PAGE_LIMIT)
         for app in apps:
             if regex.search(label, app.label, regex.I):
                 yield app
@@ -95,6 +361,10 @@ class AppClient(Client):
                 app: Attdict representing an application or an application ID
                 uid: Attdict representing a user or a user ID
         '''
+        return self.get(self.app_users_url(app, user))
+    def app_users_url(self, app, user=None):
+        ''' Url of an application's users, or of one of them
+        '''
         if isinstance(app, Attdict):
             app = app.id
         uri_suffix = '/%s/users' % app
@@ -102,39 +372,45 @@ class AppClient(Client):
             if isinstance(user, Attdict):
                 user = user.id
             uri_suffix += '/%s' % user
-        return self.get(self._url+self._uri+uri_suffix)
-    def get_apps_by_user(self, uids):
-        ''' Get applications for a list of user ids
-            Return list of id:apps dict
+        return self._url+self._uri+uri_suffix
+    def user_apps_url(self, uid, expand=False):
+        ''' Url of a user's applications, with the user's app-level info
+            embedded in each if expand
+        '''
+        req = self._url+self._uri+'?filter=user.id+eq+\"%s\"' % uid
+        if expand:
+            req += '&expand=user%%2F%s' % uid
+        return req
+    def iter_apps_by_user(self, uids, executor=None, expand=False):
+        ''' Generate (user id, applications) for a list of user ids, in the
+            order the requests finish, running them on executor (by default,
+            one of this client's own).
+            With expand, each application comes with the user's app-level
+            info (as from get_user_from_app) embedded, see app_user.
         '''
         if not isinstance(uids, list):
             uids = [uids]
-        idfilter = '?filter=user.id+eq+\"%s\"'
-        req_template = self._url+self._uri+idfilter
-        def chunks(alist, num):
-            ''' Yield successive num-sized chunks from l.
+        pool = executor if executor is not None else self.executor()
+        def apps(uid):
+            ''' One user's applications
             '''
-            for i in xrange(0, len(alist), num):
-                yield alist[i:i+num]
-
-        def enqueue(aqueue, uid):
-            ''' Function to put requests in a queue and retrieve results later
-            '''
-            content = self.get(req_template%uid)
-            aqueue.put((uid, content))
-
-        queue = Queue.Queue()
-        for chunk in chunks(uids, MAX_REQ_THREADS): # limit 100 for now, not sure what Api
-                                        # rate-limit is
-            threads = []
-            for uid in chunk:
-                thred = threading.Thread(target=enqueue, args=[queue, uid])
-                thred.start()
-                threads.append(thred)
-            for thred in threads:
-                thred.join()
-
-        apps_by_uid = {}
-        while not queue.empty():
-            apps_by_uid.update(dict((x, y) for (x, y) in [queue.get_nowait()]))
-        return apps_by_uid
+            return self.get(self.user_apps_url(uid, expand=expand))
+        try:
+            for uid, content in pool.imap_unordered(apps, uids):
+                yield uid, content
+        finally:
+            if executor is None:
+                pool.shutdown(wait=False)
+    def get_apps_by_user(self, uids, executor=None):
+        ''' Get applications for a list of user ids
+            Return list of id:apps dict
+        '''
+        return dict(self.iter_apps_by_user(uids, executor=executor))
+    def app_user(self, app, user):
+        ''' A user's app-level info for an application, from what an
+            expanded listing embedded if it did, from get_user_from_app if not
+        '''
+        embedded = app.get('_embedded', {}).get('user')
+        if embedded:
+            return Attdict(embedded)
+        return self.get_user_from_app(app, user)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+''' Module for running many Okta requests at once on a bounded set of threads,
+    and for working ahead of a consumer in the background
+
+    Example:
+        import okta.executor
+        with okta.executor.Executor(workers=20) as pool:
+            for uid, apps in pool.imap_unordered(get_apps, uids):
+                print uid, apps # as soon as each one is in
+            future = pool.submit(get_apps, uid)
+            apps = future.result()
+
+    Every call submitted, from any number of imap/imap_unordered calls, goes
+    on one queue which a fixed number of worker threads take from as they
+    come free, so a slow request holds up one thread and nothing else.
+    Functions run by the pool must not submit to the same pool and wait on
+    the results.
+
+        for page in okta.executor.prefetched(pages, size=1):
+            process(page) # while the next page is fetched
+
+    Attributes:
+        WORKERS (int): Default number of calls in flight
+        PREFETCH (int): Default number of items prefetched ahead
+        POLL (float): Seconds between checks whether a prefetching thread
+            has been told to stop
+        MAX_WAIT (int): Seconds a single wait for a result blocks; only a
+            wait with a timeout can be interrupted (Ctrl-C) in python 2
+'''
+import sys
+import threading
+import time
+import Queue
+
+WORKERS = 20
+MAX_WAIT = 3600
+PREFETCH = 1
+POLL = 0.1
+
+class Cancelled(Exception):
+    ''' The call behind a Future was cancelled before it ran
+    '''
+    pass
+
+class Timeout(Exception):
+    ''' A Future wasn't done in time
+    '''
+    pass
+
+class Future(object):
+    ''' The eventual outcome of a call submitted to an Executor
+    '''
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = 'pending' # running, finished or cancelled
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+    def cancel(self):
+        ''' Cancel the call unless it has already started. Returns whether
+            it is cancelled.
+        '''
+        with self._condition:
+            if self._state != 'pending':
+                return self._state == 'cancelled'
+            self._state = 'cancelled'
+            self._condition.notify_all()
+        self._call_back()
+        return True
+    def cancelled(self):
+        ''' Whether the call was cancelled
+        '''
+        return self._state == 'cancelled'
+    def done(self):
+        ''' Whether the call finished or was cancelled
+        '''
+        return self._state in ('finished', 'cancelled')
+    def run(self, func, *args, **kwargs):
+        ''' Run the call here and now, unless it was cancelled
+        '''
+        with self._condition:
+            if self._state != 'pending':
+                return
+            self._state = 'running'
+        try:
+            result, exc_info = func(*args, **kwargs), None
+        # pylint: disable=broad-except
+        # handed back to whoever asks for the result
+        except Exception:
+            result, exc_info = None, sys.exc_info()
+        with self._condition:
+            self._result, self._exc_info = result, exc_info
+            self._state = 'finished'
+            self._condition.notify_all()
+        self._call_back()
+    def _wait(self, timeout):
+        ''' Block until done, or raise Timeout after timeout seconds
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while not self.done():
+                left = MAX_WAIT if deadline is None else deadline - time.time()
+                if left <= 0:
+                    raise Timeout('Not done after %ss' % timeout)
+                self._condition.wait(min(left, MAX_WAIT))
+    def result(self, timeout=None):
+        ''' The call's return value, once there is one. Raises what the
+            call raised, Cancelled or Timeout.
+        '''
+        self._wait(timeout)
+        if self.cancelled():
+            raise Cancelled()
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+    def exception(self, timeout=None):
+        ''' What the call raised, None if it returned
+        '''
+        self._wait(timeout)
+        if self.cancelled():
+            raise Cancelled()
+        return self._exc_info[1] if self._exc_info else None
+    def add_done_callback(self, func):
+        ''' Call func(future) once done, right away if it already is
+        '''
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(func)
+                return
+        func(self)
+    def _call_back(self):
+        ''' Run the done callbacks
+        '''
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            func(self)
+
+def as_completed(futures):
+    ''' Generate futures as they are done
+    '''
+    futures = list(futures)
+    finished = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(finished.put)
+    for _ in xrange(len(futures)):
+        yield finished.get(True, MAX_WAIT)
+
+class Executor(object):
+    ''' Fixed pool of worker threads sharing one queue of calls
+    '''
+    def __init__(self, workers=WORKERS):
+        self._workers = workers
+        self._tasks = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pending = set() # futures submitted and not yet done
+        self._generation = 0 # cancels so far
+        self._shutdown = False
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.shutdown(wait=exc[0] is None)
+    @property
+    def workers(self):
+        ''' Most calls in flight at once
+        '''
+        return self._workers
+    @property
+    def cancelled(self):
+        ''' Whether cancel has ever been called
+        '''
+        return self._generation > 0
+    def cancel(self):
+        ''' Skip every call not yet started. Calls already running finish,
+            but the imap and imap_unordered calls under way drop their
+            results. Calls submitted afterwards run as usual.
+        '''
+        with self._lock:
+            self._generation += 1
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+    def shutdown(self, wait=True):
+        ''' Stop the worker threads once the queue is drained, waiting for
+            them if asked to (even if they were already told to stop)
+        '''
+        with self._lock:
+            stopping = not self._shutdown
+            self._shutdown = True
+            threads = list(self._threads)
+        if stopping:
+            for _ in threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+    def _start(self):
+        ''' Start the worker threads, if they aren't running yet
+        '''
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Executor has been shut down')
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+    def _work(self):
+        ''' Worker thread: run calls until told to stop
+        '''
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            future, func, args, kwargs = task
+            future.run(func, *args, **kwargs)
+    def submit(self, func, *args, **kwargs):
+        ''' Queue func(*args, **kwargs), returning its Future
+        '''
+        self._start()
+        future = Future()
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        self._tasks.put((future, func, args, kwargs))
+        return future
+    def _forget(self, future):
+        ''' Done callback: future can no longer be cancelled
+        '''
+        with self._lock:
+            self._pending.discard(future)
+    def imap_unordered(self, func, items):
+        ''' Generate (item, func(item)) for every item, in the order the calls
+            finish. An exception from func is raised here, and the calls not
+            yet started are cancelled; so are they if the generator is closed
+            early.
+        '''
+        generation = self._generation
+        finished = Queue.Queue()
+        futures = []
+        for item in items:
+            if self._generation != generation: # cancelled while submitting
+                break
+            future = self.submit(func, item)
+            future.add_done_callback(lambda future, item=item:
+                                     finished.put((item, future)))
+            futures.append(future)
+        try:
+            for _ in xrange(len(futures)):
+                item, future = finished.get(True, MAX_WAIT)
+                if self._generation != generation:
+                    return # the rest are cancelled below
+                if future.cancelled():
+                    continue
+                yield item, future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+    def imap(self, func, items):
+        ''' Generate func(item) for every item in the order given, each as
+            soon as it and every result before it are in
+        '''
+        pending = {}
+        index = 0
+        for (key, _), value in self.imap_unordered(lambda pair: func(pair[1]),
+                                                   enumerate(items)):
+            pending[key] = value
+            while index in pending:
+                yield pending.pop(index)
+                index += 1
+        # only left over if calls were cancelled
+        for key in sorted(pending):
+            yield pending[key]
+
+def prefetched(iterable, size=PREFETCH):
+    ''' Generate the items of iterable, which is run in a background thread
+        up to size items ahead of the consumer. An exception from iterable is
+        raised here; closing the generator early stops the thread.
+    '''
+    queue = Queue.Queue(size)
+    stop = threading.Event()
+    def put(entry):
+        ''' Queue entry, unless told to stop first
+        '''
+        while not stop.is_set():
+            try:
+                queue.put(entry, True, POLL)
+                return True
+            except Queue.Full:
+                continue
+        return False
+    def produce():
+        ''' Thread target
+        '''
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+        # pylint: disable=broad-except
+        # handed back to the consumer
+        except Exception:
+            put((False, sys.exc_info()))
+            return
+        put((None, None))
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            done, item = queue.get(True, MAX_WAIT)
+            if done is None:
+                return
+            if not done:
+                raise item[0], item[1], item[2]
+            yield item
+    finally:
+        stop.set()
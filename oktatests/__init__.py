@@ -0,0 +1,6 @@
+''' define the value of __all__ for import *
+'''
+__all__ = ['test_asyncclient',
+           'test_cache',
+           'test_client',
+           'test_executor']
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Tests Okta api requests returning futures
+
+Example:
+    import unittest
+    suite = test_asyncclient.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import threading
+import unittest
+from okta import asyncclient
+from okta import executor
+from okta.attdict import Attdict
+from oktatests.test_client import OktaTestCase, BASEURL, USERS, APPS, response
+
+class AsyncClientTestCase(OktaTestCase):
+    ''' Test cases for okta.asyncclient.AsyncUserClient and AsyncAppClient
+    '''
+    def setUp(self):
+        ''' A user and an app client sharing one session
+        '''
+        super(AsyncClientTestCase, self).setUp()
+        self.uclient = asyncclient.AsyncUserClient(baseurl=BASEURL)
+        self.addCleanup(self.uclient.executor.shutdown)
+        self.aclient = asyncclient.AsyncAppClient(baseurl=BASEURL,
+                                                  session=self.uclient.session)
+        self.addCleanup(self.aclient.executor.shutdown)
+        self.okta, _ = self.fake(
+            {USERS + '/1': [response(200, {'id': '1'})],
+             APPS + '/a1/users/1': [response(200, {'id': '1', 'scope': 'USER'})]},
+            self.uclient.session)
+    def test_get(self):
+        ''' Test that get returns a future of what Client.get would
+        '''
+        future = self.uclient.get(USERS + '/1')
+        self.assertIsInstance(future, executor.Future)
+        self.assertEqual(future.result().id, '1')
+    def test_on_executor(self):
+        ''' Test that requests run on the client's executor, which is sized
+            to the session and shut down with the client
+        '''
+        thread = self.uclient.executor.submit(threading.current_thread)
+        self.assertIsNot(thread.result(), threading.current_thread())
+        self.assertEqual(self.uclient.executor.workers,
+                         self.uclient.session.pool_size)
+        self.uclient.close()
+        with self.assertRaises(RuntimeError):
+            self.uclient.get(USERS + '/1')
+    def test_shared_executor(self):
+        ''' Test that a given executor is used, and left running on close
+        '''
+        with executor.Executor(workers=2) as pool:
+            aclient = asyncclient.AsyncAppClient(baseurl=BASEURL,
+                                                 session=self.uclient.session,
+                                                 executor=pool)
+            self.assertIs(aclient.executor, pool)
+            aclient.close()
+            future = aclient.get_user_from_app('a1', '1')
+            self.assertEqual(future.result().scope, 'USER')
+    def test_app_user(self):
+        ''' Test that embedded app-level info is used without a request,
+            and fetched otherwise
+        '''
+        app = Attdict(
+            {'id': 'a1', '_embedded': {'user': {'id': '1', 'scope': 'GROUP'}}})
+        self.assertEqual(self.aclient.app_user(app, '1').result().scope, 'GROUP')
+        self.assertEqual(self.okta.requests, [])
+        app = Attdict({'id': 'a1'})
+        self.assertEqual(self.aclient.app_user(app, '1').result().scope, 'USER')
+        self.assertEqual(self.okta.urls(), [APPS + '/a1/users/1'])
+    def test_shared_stats(self):
+        ''' Test that both clients count against the one session
+        '''
+        self.uclient.get(USERS + '/1').result()
+        self.aclient.get_user_from_app('a1', '1').result()
+        self.assertIs(self.uclient.session, self.aclient.session)
+        self.assertEqual(self.aclient.stats.requests, 2)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [AsyncClientTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
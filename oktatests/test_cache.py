@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Tests the on-disk cache of Okta users and apps
+
+Example:
+    import unittest
+    suite = test_cache.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import urllib
+from okta import cache
+from okta import client
+from okta import executor
+from oktatests.test_client import OktaTestCase, BASEURL, USERS, APPS, response
+
+APP1 = {'id': 'a1', 'label': 'Wiki'}
+APP2 = {'id': 'a2', 'label': 'Mail'}
+ALICE = {'id': 'u1', 'profile': {'email': 'alice@example.com'}}
+BOB = {'id': 'u2', 'profile': {'email': 'bob@example.com'}}
+
+def search_url(*emails):
+    ''' The url UserClient.iter_users_by_email asks for emails at
+    '''
+    return '%s?limit=%d&search=%s' % (
+        USERS,
+        client.PAGE_LIMIT,
+        urllib.quote(next(client.or_expressions('profile.email', emails,
+                                                client.MAX_URL_LEN))))
+
+class CacheTestCase(OktaTestCase):
+    ''' Test cases for okta.cache.Cache
+    '''
+    def setUp(self):
+        ''' Clients sharing a session, a cache file in a temporary
+            directory and a clock standing at 100000
+        '''
+        super(CacheTestCase, self).setUp()
+        self.uclient = client.UserClient(baseurl=BASEURL)
+        self.aclient = client.AppClient(baseurl=BASEURL,
+                                        session=self.uclient.session)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'cache.sqlite')
+        self.now = [100000.0]
+    def cache(self, **kwargs):
+        ''' A Cache (a new instance each time) on the test's file and clock
+        '''
+        the_cache = cache.Cache(self.uclient, self.aclient, path=self.path,
+                                clock=lambda: self.now[0], **kwargs)
+        self.addCleanup(the_cache.close)
+        return the_cache
+    def test_private(self):
+        ''' Test that the cache file is only readable by its owner
+        '''
+        self.cache()
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0600)
+    def test_apps_etag(self):
+        ''' Test that apps are kept for ttl, then asked for again only if
+            their ETag has changed
+        '''
+        okta, _ = self.fake({APPS: [response(200, [APP1, APP2],
+                                             headers={'ETag': '"e1"'}),
+                                    response(304)]},
+                            self.uclient.session)
+        self.assertEqual([i.label for i in self.cache().apps()],
+                         ['Mail', 'Wiki'])
+        self.assertNotIn('If-None-Match', okta.requests[0][1])
+        self.now[0] += cache.TTL - 1
+        self.assertEqual(len(self.cache().apps()), 2)
+        self.assertEqual(len(okta.requests), 1)
+        self.now[0] += 2
+        self.assertEqual([i.label for i in self.cache().apps_by_label('wik')],
+                         ['Wiki'])
+        self.assertEqual(len(okta.requests), 2)
+        self.assertEqual(okta.requests[1][1]['If-None-Match'], '"e1"')
+    def test_refresh(self):
+        ''' Test that refresh asks again, unconditionally, however fresh
+        '''
+        okta, _ = self.fake({APPS: [response(200, [APP1],
+                                             headers={'ETag': '"e1"'}),
+                                    response(200, [APP2],
+                                             headers={'ETag': '"e2"'})]},
+                            self.uclient.session)
+        self.cache().apps()
+        self.assertEqual([i.id for i in self.cache(refresh=True).apps()],
+                         ['a2'])
+        self.assertNotIn('If-None-Match', okta.requests[1][1])
+    def test_users_by_email(self):
+        ''' Test that users are looked up once, whatever the emails' case,
+            and that emails without users are left out
+        '''
+        # emails are searched for in no particular order
+        okta, _ = self.fake(
+            dict((search_url(*emails), [response(200, [ALICE])])
+                 for emails in [('Alice@Example.com', 'carol@example.com'),
+                                ('carol@example.com', 'Alice@Example.com')]),
+            self.uclient.session)
+        found = self.cache().users_by_email(['Alice@Example.com',
+                                             'carol@example.com'])
+        self.assertEqual(found.keys(), ['Alice@Example.com'])
+        self.assertEqual(found['Alice@Example.com'].id, 'u1')
+        found = self.cache().users_by_email(['alice@example.com'])
+        self.assertEqual(found['alice@example.com'].id, 'u1')
+        self.assertEqual(len(okta.requests), 1)
+    def test_sweep(self):
+        ''' Test that once older than ttl, cached users are brought up to
+            date with one search for changes since (less SKEW), which
+            only updates users already cached
+        '''
+        the_cache = self.cache()
+        # pylint: disable=protected-access
+        with the_cache._db:
+            the_cache._store_users([client.Attdict(ALICE)])
+            the_cache._mark('users')
+        started = self.now[0]
+        self.now[0] += cache.TTL + 1
+        changed = dict(ALICE, status='SUSPENDED')
+        sweep = client.with_limit(
+            self.uclient.users_url('lastUpdated gt "%s"'
+                                   % cache.okta_time(started - cache.SKEW)),
+            client.PAGE_LIMIT)
+        okta, _ = self.fake({sweep: [response(200, [changed, BOB])]},
+                            self.uclient.session)
+        found = self.cache().users_by_email(['alice@example.com'])
+        self.assertEqual(found['alice@example.com'].status, 'SUSPENDED')
+        self.assertEqual(okta.urls(), [sweep])
+        ids = sqlite3.connect(self.path).execute('SELECT id FROM users')
+        self.assertEqual([i for (i,) in ids], ['u1'])
+    def test_sweep_marked_at_start(self):
+        ''' Test that the next sweep reaches back to when this one started
+        '''
+        the_cache = self.cache()
+        the_cache.users_by_email([])
+        # pylint: disable=protected-access
+        self.assertEqual(the_cache._fetched_row('users')[0], self.now[0])
+    def test_app_users(self):
+        ''' Test that each app's users are fetched once, in the order given
+        '''
+        okta, _ = self.fake(
+            {APPS + '/a1/users': [response(200, [{'id': 'u2'}, {'id': 'u1'}])],
+             APPS + '/a2/users': [response(200, [])]},
+            self.uclient.session)
+        apps = [client.Attdict(APP1), client.Attdict(APP2)]
+        with executor.Executor(workers=2) as pool:
+            found = list(self.cache().app_users(apps, pool))
+            self.assertEqual([(app.id, [i.id for i in users])
+                              for app, users in found],
+                             [('a1', ['u1', 'u2']), ('a2', [])])
+            self.assertEqual(len(list(self.cache().app_users(apps, pool))), 2)
+        self.assertEqual(len(okta.requests), 2)
+    def test_apps_for_users(self):
+        ''' Test that users' apps come with their app-level info embedded,
+            from Okta and then from the cache
+        '''
+        embedded = dict(APP1, _embedded={'user': {'id': 'u1',
+                                                  'scope': 'USER'}})
+        okta, _ = self.fake(
+            {self.aclient.user_apps_url('u1', expand=True):
+                 [response(200, [embedded, APP2])]},
+            self.uclient.session)
+        with executor.Executor(workers=2) as pool:
+            for _ in range(2):
+                found = dict(self.cache().apps_for_users(['u1'], pool))
+                self.assertEqual([i.label for i in found['u1']],
+                                 ['Mail', 'Wiki'])
+                wiki = found['u1'][1]
+                self.assertEqual(self.aclient.app_user(wiki, 'u1').scope,
+                                 'USER')
+        self.assertEqual(len(okta.requests), 1)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [CacheTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+"""Tests Okta api requests
+
+Example:
+    import unittest
+    suite = test_client.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import json
+import re
+import threading
+import unittest
+import urllib
+import urlparse
+from StringIO import StringIO
+import mock
+import requests
+from okta import client
+from okta.attdict import Attdict
+
+BASEURL = 'https://test.okta.com'
+USERS = BASEURL + '/api/v1/users'
+APPS = BASEURL + '/api/v1/apps'
+
+def response(status=200, content=None, headers=None, next_url=None):
+    ''' A requests.Response as Okta would send it
+    '''
+    resp = requests.Response()
+    resp.status_code = status
+    # pylint: disable=protected-access
+    resp._content = json.dumps(content) if content is not None else ''
+    resp.headers.update(headers or {})
+    if next_url:
+        resp.headers['Link'] = '<%s>; rel="next"' % next_url
+    return resp
+
+def limits(limit, remaining, reset):
+    ''' Okta's rate-limit headers
+    '''
+    return {'X-Rate-Limit-Limit': str(limit),
+            'X-Rate-Limit-Remaining': str(remaining),
+            'X-Rate-Limit-Reset': str(reset)}
+
+class FakeOkta(object):
+    ''' Stands in for requests.Session.get: answers each url with its
+        responses in turn (repeating the last), remembering every request
+    '''
+    def __init__(self, responses):
+        self.responses = dict((url, list(resps))
+                              for url, resps in responses.items())
+        self.requests = [] # (url, headers)
+    def get(self, url, **kwargs):
+        ''' The next response to url; a list of responses can hold
+            exceptions to raise
+        '''
+        self.requests.append((url, kwargs.get('headers', {})))
+        resps = self.responses[url]
+        resp = resps.pop(0) if len(resps) > 1 else resps[0]
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+    def urls(self):
+        ''' The urls requested, in order
+        '''
+        return [i[0] for i in self.requests]
+
+class OktaTestCase(unittest.TestCase):
+    ''' Base for test cases against a FakeOkta, without sleeping
+    '''
+    def setUp(self):
+        ''' Patch out sleeping between retries
+        '''
+        patcher = mock.patch('okta.client.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+    def fake(self, responses, session=None):
+        ''' Answer requests through session (by default, a new one) from
+            url:responses
+        '''
+        okta = FakeOkta(responses)
+        session = session if session is not None else client.Session()
+        patcher = mock.patch.object(session, 'get', side_effect=okta.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return okta, session
+
+class RateLimiterTestCase(unittest.TestCase):
+    ''' Test cases for okta.client.RateLimiter
+    '''
+    def setUp(self):
+        ''' A limiter whose clock stands at 1000
+        '''
+        self.limiter = client.RateLimiter(throttle_at=0.1, clock=lambda: 1000.0)
+    def test_endpoint(self):
+        ''' Test that limits are tracked per api endpoint
+        '''
+        self.assertEqual(self.limiter.endpoint(USERS + '/abc?limit=2'),
+                         '/api/v1/users')
+        self.limiter.update(USERS, limits(100, 0, 1010))
+        self.assertEqual(self.limiter.delay(USERS + '/abc'), 10)
+        self.assertEqual(self.limiter.delay(APPS), 0)
+    def test_plenty_left(self):
+        ''' Test that nothing is held back while plenty of the limit is left
+        '''
+        self.limiter.update(USERS, limits(100, 50, 1010))
+        self.assertEqual(self.limiter.delay(USERS), 0)
+    def test_spread(self):
+        ''' Test that once little is left, the time to the reset is spread
+            over it, counting each request against it
+        '''
+        self.limiter.update(USERS, limits(100, 5, 1010))
+        self.assertEqual(self.limiter.delay(USERS), 2)
+        self.assertEqual(self.limiter.delay(USERS), 2.5)
+    def test_reset_passed(self):
+        ''' Test that a window which has reset holds nothing back
+        '''
+        self.limiter.update(USERS, limits(100, 0, 990))
+        self.assertEqual(self.limiter.delay(USERS), 0)
+        self.assertEqual(self.limiter.reset_in(USERS), 0)
+    def test_no_headers(self):
+        ''' Test that responses without (or with bad) headers are ignored
+        '''
+        self.limiter.update(USERS, {})
+        self.limiter.update(USERS, dict(limits(100, 0, 1010),
+                                        **{'X-Rate-Limit-Reset': 'soon'}))
+        self.assertEqual(self.limiter.delay(USERS), 0)
+        self.assertIsNone(self.limiter.reset_in(USERS))
+
+class SessionTestCase(OktaTestCase):
+    ''' Test cases for okta.client.Session
+    '''
+    def test_retry(self):
+        ''' Test that 5xxs are retried with growing backoff
+        '''
+        okta, session = self.fake({USERS: [response(503),
+                                           response(502),
+                                           response(200, [])]})
+        resp = session.fetch(USERS)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(okta.requests), 3)
+        first, second = [i[0][0] for i in self.sleep.call_args_list]
+        self.assertTrue(0.25 <= first <= 0.5)
+        self.assertTrue(0.5 <= second <= 1)
+        self.assertEqual(session.stats.requests, 3)
+        self.assertEqual(session.stats.retries, 2)
+    def test_429(self):
+        ''' Test that a 429 is retried once the rate limit resets, and only
+            waited out once
+        '''
+        now = [1000.0]
+        self.sleep.side_effect = lambda seconds: now.append(now.pop() + seconds)
+        okta, session = self.fake({USERS: [response(429,
+                                                    headers=limits(100, 0, 1030)),
+                                           response(200, [])]})
+        session.limiter = client.RateLimiter(clock=lambda: now[0])
+        resp = session.fetch(USERS)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(okta.requests), 2)
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertTrue(30 <= self.sleep.call_args[0][0] <= 31)
+    def test_give_up(self):
+        ''' Test that the last response is returned once retries run out
+        '''
+        okta, session = self.fake({USERS: [response(500)]})
+        session.retries = 2
+        self.assertEqual(session.fetch(USERS).status_code, 500)
+        self.assertEqual(len(okta.requests), 3)
+    def test_not_retried(self):
+        ''' Test that client errors are returned straight away
+        '''
+        okta, session = self.fake({USERS: [response(404), response(200)]})
+        self.assertEqual(session.fetch(USERS).status_code, 404)
+        self.assertEqual(len(okta.requests), 1)
+    def test_connection_error(self):
+        ''' Test that connection errors are retried, then raised
+        '''
+        okta, session = self.fake({USERS: [requests.ConnectionError(),
+                                           response(200, [])]})
+        self.assertEqual(session.fetch(USERS).status_code, 200)
+        self.assertEqual(session.stats.errors, 1)
+        okta.responses[USERS] = [requests.ConnectionError()]
+        session.retries = 1
+        with self.assertRaises(requests.ConnectionError):
+            session.fetch(USERS)
+        self.assertEqual(session.stats.errors, 3)
+    def test_throttled(self):
+        ''' Test that time held back for the rate limit is counted
+        '''
+        _, session = self.fake({USERS: [response(200, [])]})
+        session.limiter = mock.Mock(delay=mock.Mock(return_value=1.5))
+        session.fetch(USERS)
+        self.sleep.assert_called_once_with(1.5)
+        self.assertEqual(session.stats.throttled, 1.5)
+    def test_pool(self):
+        ''' Test that the keep-alive pool is bounded and blocks when full
+        '''
+        session = client.Session(pool_size=3)
+        adapter = session.get_adapter(USERS)
+        # pylint: disable=protected-access
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertTrue(adapter._pool_block)
+
+class PagingTestCase(OktaTestCase):
+    ''' Test cases for streaming paged listings
+    '''
+    def setUp(self):
+        ''' Four pages of two users each
+        '''
+        super(PagingTestCase, self).setUp()
+        self.uclient = client.UserClient(baseurl=BASEURL)
+        first = USERS + '?limit=2'
+        self.okta, _ = self.fake(
+            {first: [response(200, [{'id': 1}, {'id': 2}],
+                              next_url=USERS + '?after=2&limit=2')],
+             USERS + '?after=2&limit=2': [response(200, [{'id': 3}, {'id': 4}],
+                                                   next_url=USERS + '?after=4')],
+             USERS + '?after=4': [response(200, [{'id': 5}, {'id': 6}],
+                                           next_url=USERS + '?after=6')],
+             USERS + '?after=6': [response(200, [{'id': 7}, {'id': 8}])]},
+            self.uclient.session)
+    def test_with_limit(self):
+        ''' Test that a page size is asked for unless one already is
+        '''
+        self.assertEqual(client.with_limit(USERS, 200), USERS + '?limit=200')
+        self.assertEqual(client.with_limit(USERS + '?q=a', 200),
+                         USERS + '?q=a&limit=200')
+        self.assertEqual(client.with_limit(USERS + '?limit=5', 200),
+                         USERS + '?limit=5')
+        self.assertEqual(client.with_limit(USERS, None), USERS)
+    def test_iter_pages(self):
+        ''' Test that pages come one by one, following the next links
+        '''
+        pages = list(self.uclient.iter_pages(USERS, limit=2))
+        self.assertEqual([[i['id'] for i in page] for page in pages],
+                         [[1, 2], [3, 4], [5, 6], [7, 8]])
+        self.assertEqual(self.okta.urls(),
+                         [USERS + '?limit=2', USERS + '?after=2&limit=2',
+                          USERS + '?after=4', USERS + '?after=6'])
+    def test_get_users(self):
+        ''' Test that get_users streams: pages are only fetched a little
+            ahead of what has been used
+        '''
+        users = self.uclient.get_users(limit=2)
+        self.assertEqual(next(users).id, 1)
+        # time.sleep is patched out
+        threading.Event().wait(0.1)
+        # the page in hand, one queued, one waiting to be
+        self.assertEqual(len(self.okta.requests), 3)
+        self.assertEqual([i.id for i in users], range(2, 9))
+        self.assertEqual(len(self.okta.requests), 4)
+    def test_single_object(self):
+        ''' Test that a single object counts as one item
+        '''
+        self.fake({USERS + '/1': [response(200, {'id': 1})]},
+                  self.uclient.session)
+        self.assertEqual([i.id for i in self.uclient.iter_items(USERS + '/1')],
+                         [1])
+
+class SearchTestCase(OktaTestCase):
+    ''' Test cases for looking up many users at once
+    '''
+    EMAILS = ['user%02d@example.com' % i for i in range(30)]
+    def setUp(self):
+        ''' A user client whose searches find whichever of EMAILS they ask
+            for, in lower case
+        '''
+        super(SearchTestCase, self).setUp()
+        self.uclient = client.UserClient(baseurl=BASEURL)
+        self.searches = []
+        def search(url, **_):
+            ''' Answer a search url
+            '''
+            query = urlparse.parse_qs(urlparse.urlsplit(url).query)
+            expression = query['search'][0]
+            self.searches.append(expression)
+            return response(200, [{'id': i, 'profile': {'email': i.lower()}}
+                                  for i in re.findall(r'eq "([^"]+)"', expression)
+                                  if i.lower() in self.EMAILS])
+        patcher = mock.patch.object(self.uclient.session, 'get',
+                                    side_effect=search)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    def test_or_expressions(self):
+        ''' Test that clauses are OR-combined, split to stay within max_len
+            once quoted
+        '''
+        self.assertEqual(list(client.or_expressions('a', ['x', 'y'], 100)),
+                         ['a eq "x" or a eq "y"'])
+        chunks = list(client.or_expressions('profile.email', self.EMAILS, 200))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(urllib.quote(i)) <= 200 for i in chunks))
+        self.assertEqual(sum([re.findall(r'"([^"]+)"', i) for i in chunks], []),
+                         self.EMAILS)
+    def test_or_expressions_long(self):
+        ''' Test that a clause too long by itself still comes, alone
+        '''
+        self.assertEqual(list(client.or_expressions('a', ['x' * 20, 'y'], 10)),
+                         ['a eq "%s"' % ('x' * 20), 'a eq "y"'])
+    def test_or_expressions_quote(self):
+        ''' Test that quotes in values are escaped
+        '''
+        self.assertEqual(list(client.or_expressions('a', ['x"y'], 100)),
+                         ['a eq "x\\"y"'])
+    def test_batches(self):
+        ''' Test that emails are looked up as many at once as fit in a url
+        '''
+        users = list(self.uclient.iter_users_by_email(self.EMAILS))
+        self.assertEqual(sorted(i.id for i in users), self.EMAILS)
+        self.assertEqual(len(self.searches), 1)
+        with mock.patch('okta.client.MAX_URL_LEN', 400):
+            users = list(self.uclient.iter_users_by_email(self.EMAILS))
+        self.assertEqual(len(users), 30)
+        self.assertTrue(len(self.searches) > 2)
+    def test_by_email(self):
+        ''' Test that users are mapped from the emails as given, whatever
+            their case, and emails without users are left out
+        '''
+        found = self.uclient.get_users_by_email(['User01@Example.com',
+                                                 'nobody@example.com'])
+        self.assertEqual(found.keys(), ['User01@Example.com'])
+        self.assertEqual(found['User01@Example.com'].profile['email'],
+                         'user01@example.com')
+
+class ClientTestCase(OktaTestCase):
+    ''' Test cases for okta.client.Client
+    '''
+    def test_get(self):
+        ''' Test that get follows every page, with the client's headers
+        '''
+        uclient = client.UserClient(baseurl=BASEURL, api_key='key')
+        okta, _ = self.fake({USERS: [response(200, [{'id': 1}],
+                                              next_url=USERS + '?after=1')],
+                             USERS + '?after=1': [response(200, [{'id': 2}])]},
+                            uclient.session)
+        self.assertEqual([i.id for i in uclient.get(USERS)], [1, 2])
+        self.assertEqual(okta.urls(), [USERS, USERS + '?after=1'])
+        self.assertEqual(okta.requests[0][1]['Authorization'], 'SSWS key')
+    def test_get_failed(self):
+        ''' Test that a failed request is reported and gives None
+        '''
+        uclient = client.UserClient(baseurl=BASEURL)
+        self.fake({USERS: [response(403, {'errorCode': 'E0000006'})]},
+                  uclient.session)
+        with mock.patch('sys.stdout', new_callable=StringIO) as out:
+            self.assertIsNone(uclient.get(USERS))
+        self.assertIn('E0000006', out.getvalue())
+    def test_user_apps_url(self):
+        ''' Test that a user's apps can be asked for with the user's
+            app-level info embedded
+        '''
+        aclient = client.AppClient(baseurl=BASEURL)
+        self.assertEqual(aclient.user_apps_url('u1'),
+                         APPS + '?filter=user.id+eq+"u1"')
+        self.assertEqual(aclient.user_apps_url('u1', expand=True),
+                         APPS + '?filter=user.id+eq+"u1"&expand=user%2Fu1')
+    def test_app_user(self):
+        ''' Test that app-level info embedded in an app is used as is,
+            and asked for otherwise
+        '''
+        aclient = client.AppClient(baseurl=BASEURL)
+        okta, _ = self.fake({APPS + '/a1/users/u1': [response(200, {'id': 'u1'})]},
+                            aclient.session)
+        app = Attdict({'id': 'a1', '_embedded': {'user': {'id': 'u1'}}})
+        self.assertEqual(aclient.app_user(app, 'u1').id, 'u1')
+        self.assertEqual(okta.requests, [])
+        self.assertEqual(aclient.app_user(Attdict({'id': 'a1'}), 'u1').id, 'u1')
+        self.assertEqual(okta.urls(), [APPS + '/a1/users/u1'])
+    def test_shared_session(self):
+        ''' Test that clients given one session share its stats
+        '''
+        session = client.Session()
+        uclient = client.UserClient(baseurl=BASEURL, session=session)
+        aclient = client.AppClient(baseurl=BASEURL, session=session)
+        self.fake({USERS: [response(200, {'id': 1})],
+                   APPS: [response(200, [])]},
+                  session)
+        uclient.get(USERS)
+        aclient.get(APPS)
+        self.assertIs(uclient.session, aclient.session)
+        self.assertEqual(aclient.stats.requests, 2)
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [RateLimiterTestCase,
+                 SessionTestCase,
+                 PagingTestCase,
+                 SearchTestCase,
+                 ClientTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""Tests the bounded worker pool for Okta requests
+
+Example:
+    import unittest
+    suite = test_executor.suite()
+    unittest.TextTestRunner().run(suite)
+
+"""
+import threading
+import time
+import unittest
+from okta import client
+from okta import executor
+from oktatests.test_client import OktaTestCase, BASEURL, response
+
+class Gauge(object):
+    ''' Counts how many calls are running at once
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+    def call(self, item):
+        ''' Take item/100 seconds, then return item
+        '''
+        with self._lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(item / 100.0)
+        with self._lock:
+            self.running -= 1
+        return item
+
+class FutureTestCase(unittest.TestCase):
+    ''' Test cases for okta.executor.Future and as_completed
+    '''
+    def test_result(self):
+        ''' Test that the call's result is handed back, and callbacks run
+            once it is in (or straight away after)
+        '''
+        future = executor.Future()
+        done = []
+        future.add_done_callback(done.append)
+        self.assertFalse(future.done())
+        future.run(lambda a, b=0: a + b, 1, b=2)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), 3)
+        self.assertIsNone(future.exception())
+        future.add_done_callback(done.append)
+        self.assertEqual(done, [future, future])
+    def test_exception(self):
+        ''' Test that what the call raised is raised by result
+        '''
+        future = executor.Future()
+        future.run(int, 'x')
+        self.assertIsInstance(future.exception(), ValueError)
+        with self.assertRaises(ValueError):
+            future.result()
+    def test_cancel(self):
+        ''' Test that a cancelled call never runs
+        '''
+        future = executor.Future()
+        ran = []
+        self.assertTrue(future.cancel())
+        future.run(ran.append, 1)
+        self.assertEqual(ran, [])
+        self.assertTrue(future.cancelled())
+        with self.assertRaises(executor.Cancelled):
+            future.result()
+        finished = executor.Future()
+        finished.run(lambda: None)
+        self.assertFalse(finished.cancel())
+    def test_timeout(self):
+        ''' Test that waiting gives up after the timeout
+        '''
+        with self.assertRaises(executor.Timeout):
+            executor.Future().result(timeout=0.05)
+    def test_as_completed(self):
+        ''' Test that futures come as they finish, not as given
+        '''
+        with executor.Executor(workers=3) as pool:
+            gauge = Gauge()
+            futures = [pool.submit(gauge.call, i) for i in [20, 1, 10]]
+            self.assertEqual([i.result() for i in executor.as_completed(futures)],
+                             [1, 10, 20])
+
+class ExecutorTestCase(unittest.TestCase):
+    ''' Test cases for okta.executor.Executor
+    '''
+    def setUp(self):
+        ''' An executor of three workers
+        '''
+        self.pool = executor.Executor(workers=3)
+        self.addCleanup(self.pool.shutdown)
+    def test_imap_unordered(self):
+        ''' Test that results come as calls finish, no more than workers at
+            once
+        '''
+        gauge = Gauge()
+        results = list(self.pool.imap_unordered(gauge.call, [9, 1, 5, 1, 1, 1]))
+        self.assertEqual(sorted(results), [(i, i) for i in [1, 1, 1, 1, 5, 9]])
+        self.assertEqual(results[-1], (9, 9))
+        self.assertEqual(gauge.most, 3)
+    def test_imap(self):
+        ''' Test that imap keeps the order given
+        '''
+        gauge = Gauge()
+        self.assertEqual(list(self.pool.imap(gauge.call, [9, 1, 5, 3])),
+                         [9, 1, 5, 3])
+    def test_error(self):
+        ''' Test that an exception is raised to the consumer, and calls not
+            yet started are cancelled
+        '''
+        started = []
+        def call(item):
+            ''' Fail on 0, take a while otherwise
+            '''
+            started.append(item)
+            if item == 0:
+                raise ValueError('zero')
+            time.sleep(0.05)
+        with self.assertRaises(ValueError):
+            list(self.pool.imap_unordered(call, [0] + range(1, 20)))
+        time.sleep(0.1)
+        self.assertTrue(len(started) < 20)
+    def test_cancel(self):
+        ''' Test that cancel skips calls not yet started
+        '''
+        ran = []
+        def call(item):
+            ''' Cancel the pool from the first call
+            '''
+            ran.append(item)
+            if item == 0:
+                self.pool.cancel()
+            time.sleep(0.01)
+            return item
+        results = list(self.pool.imap_unordered(call, range(20)))
+        self.assertTrue(self.pool.cancelled)
+        self.assertTrue(len(ran) < 20)
+        self.assertEqual(results, [])
+    def test_after_cancel(self):
+        ''' Test that calls submitted after a cancel run as usual
+        '''
+        self.pool.cancel()
+        self.assertEqual(self.pool.submit(lambda: 1).result(), 1)
+        self.assertEqual(list(self.pool.imap(lambda i: i, [1, 2])), [1, 2])
+    def test_shutdown(self):
+        ''' Test that nothing can be submitted once shut down
+        '''
+        self.assertEqual(list(self.pool.imap(lambda i: i, [1])), [1])
+        self.pool.shutdown(wait=False)
+        with self.assertRaises(RuntimeError):
+            self.pool.submit(lambda: None)
+        self.pool.shutdown()
+        # pylint: disable=protected-access
+        self.assertFalse(any(i.is_alive() for i in self.pool._threads))
+
+class PrefetchedTestCase(unittest.TestCase):
+    ''' Test cases for okta.executor.prefetched
+    '''
+    def setUp(self):
+        ''' Count the items produced
+        '''
+        self.produced = []
+    def produce(self, count, fail=False):
+        ''' Generate count items, noting each, then fail if asked to
+        '''
+        for item in range(count):
+            self.produced.append(item)
+            yield item
+        if fail:
+            raise ValueError('no more')
+    def test_order(self):
+        ''' Test that every item comes through, in order
+        '''
+        self.assertEqual(list(executor.prefetched(self.produce(10), size=2)),
+                         range(10))
+    def test_ahead(self):
+        ''' Test that the producer works ahead, but only so far
+        '''
+        items = executor.prefetched(self.produce(10), size=2)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.1)
+        # two queued, one waiting to be
+        self.assertEqual(len(self.produced), 4)
+        items.close()
+    def test_error(self):
+        ''' Test that the producer's exception is raised to the consumer
+            after the items before it
+        '''
+        items = executor.prefetched(self.produce(2, fail=True))
+        self.assertEqual([next(items), next(items)], [0, 1])
+        with self.assertRaises(ValueError):
+            next(items)
+    def test_close(self):
+        ''' Test that closing early stops the producer
+        '''
+        items = executor.prefetched(self.produce(1000), size=1)
+        next(items)
+        items.close()
+        time.sleep(executor.POLL * 3)
+        produced = len(self.produced)
+        time.sleep(executor.POLL * 3)
+        self.assertEqual(len(self.produced), produced)
+        self.assertTrue(produced < 10)
+
+class AppsByUserTestCase(OktaTestCase):
+    ''' Test cases for okta.client.AppClient.iter_apps_by_user
+    '''
+    def setUp(self):
+        ''' An app client answering for users u1 to u3
+        '''
+        super(AppsByUserTestCase, self).setUp()
+        self.aclient = client.AppClient(baseurl=BASEURL)
+        self.okta, _ = self.fake(
+            dict((self.aclient.user_apps_url(uid),
+                  [response(200, [{'id': 'app-%s' % uid, 'label': uid}])])
+                 for uid in ['u1', 'u2', 'u3']),
+            self.aclient.session)
+    def test_apps_by_user(self):
+        ''' Test that every user's apps come back once, on a shared executor
+        '''
+        with executor.Executor(workers=2) as pool:
+            found = dict(self.aclient.iter_apps_by_user(['u1', 'u2', 'u3'],
+                                                        executor=pool))
+            self.assertFalse(pool.cancelled)
+        self.assertEqual(sorted(found), ['u1', 'u2', 'u3'])
+        self.assertEqual(found['u2'][0].id, 'app-u2')
+        self.assertEqual(len(self.okta.requests), 3)
+    def test_single_user(self):
+        ''' Test that a lone user id is taken as a list of one
+        '''
+        with self.aclient.executor(workers=1) as pool:
+            self.assertEqual(self.aclient.get_apps_by_user('u1',
+                                                           executor=pool).keys(),
+                             ['u1'])
+
+def suite():
+    ''' Create a suite of tests
+    '''
+    the_suite = unittest.TestSuite()
+    for case in [FutureTestCase,
+                 ExecutorTestCase,
+                 PrefetchedTestCase,
+                 AppsByUserTestCase]:
+        the_suite.addTests(unittest.TestLoader().loadTestsFromTestCase(case))
+    return the_suite
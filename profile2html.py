@@ -13,11 +13,12 @@
 #
 # ========================================
 import os
-import yaml
+import sys
 import argparse
 import re
+from StringIO import StringIO
 
-from bs4 import BeautifulSoup
+from jldap import report, yamlio
 
 IGNORE_FIELDS = ['owner',
                  'primary-gid-number',
@@ -26,24 +27,11 @@ IGNORE_FIELDS = ['owner',
 PATTERN = r'\.yaml'
 
 class ProfileDumper(object):
-    def __init__(self, pattern=PATTERN):
+    def __init__(self, pattern=PATTERN, stream=None):
         self._profile_pattern = pattern
-        self._html = BeautifulSoup('','html5lib')
-        table = self._html.new_tag('table')
-        table.attrs = {'style': 'border: 1px solid; border-width: 1px; border-color: #000000;'}
-        self._html.append(table)
-        thead = self._html.new_tag('thead')
-        table.append(thead)
-        tr = self._html.new_tag('tr')
-        thead.append(tr)
-        thead.attrs = {'style': 'background-color: #dbdbdb;'}
-
-        for i in ['Name', 'Owner', 'Permissions']:
-            th = self._html.new_tag('th')
-            th.string = i
-            tr.append(th)
-        self._tbody = self._html.new_tag('tbody')
-        table.append(self._tbody)
+        self._stream = stream if stream else StringIO()
+        self._table = report.HTMLTable(self._stream,
+                                       headings=['Name', 'Owner', 'Permissions'])
 
     @property
     def pattern(self):
@@ -59,34 +47,24 @@ class ProfileDumper(object):
                 yml.pop(i)
             except KeyError:
                 continue
-        tr = self._html.new_tag('tr')
-        self._tbody.append(tr)
-        yaml_string = yaml.dump(yml, default_flow_style=False)
-        td = self._html.new_tag('td')
-        tr.append(td)
-        td.string = re.sub(self.pattern + '$', '', name)
-        td = self._html.new_tag('td')
-        tr.append(td)
-        td.string = owner
-        td = self._html.new_tag('td')
-        tr.append(td)
-        pre = self._html.new_tag('pre')
-        td.append(pre)
-        for line in yaml_string.split('\n'):
-            p = self._html.new_tag('p')
-            p.string = line
-            pre.append(p)
+        self._table.row([report.text(re.sub(self.pattern + '$', '', name)),
+                         report.text(owner),
+                         report.pre(yml)])
 
     def add_dir(self, directory):
         for _,_,files in os.walk(directory):
             for f in files:
                 if re.search(self.pattern, f):
                     with open(os.path.join(directory, f), 'r') as yml:
-                        profile = yaml.load(yml)
+                        profile = yamlio.load(yml)
                     self.add(f, profile)
 
+    def close(self):
+        self._table.close()
+
     def dump(self):
-        return str(self._html)
+        self.close()
+        return self._stream.getvalue()
 
 def main():
     parser = argparse.ArgumentParser()
@@ -99,9 +77,10 @@ def main():
                         against')
     args = parser.parse_args()
     profiles = {}
-    dumper = ProfileDumper(pattern=args.profile_pattern)
+    dumper = ProfileDumper(pattern=args.profile_pattern, stream=sys.stdout)
     dumper.add_dir(args.profile_directory)
-    print dumper.dump()
+    dumper.close()
+    print
 
 if __name__ == '__main__':
     main()
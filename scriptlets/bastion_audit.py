@@ -3,7 +3,7 @@ import collections
 import sys
 import os
 import re
-import yaml
+from jldap import yamlio
 
 LDAPCONF = os.path.expanduser('~/.ldap.yml')
 
@@ -40,14 +40,13 @@ def main():
     phx.basedn = 'ou=roles,ou=groups,dc=example,dc=com'
     kwargs = {'filterstr': '(cn=*)',
               'attrlist': ['uniqueMember']}
-    results = [i for i in phx.search(**kwargs)]
     tree = collections.defaultdict(list)
-    for item in results:
+    for item in phx.paged_search(**kwargs):
         toks = item.dn.split(',')
         cn = toks[0]
         newbdn = ','.join(toks[1:])
         tree[item.dn] = members(phx, newbdn, '(%s)' % cn, kwargs['attrlist'])
-    print(yaml.dump(tree, default_flow_style=False))
+    print(yamlio.dump(tree))
 if __name__ == '__main__':
     if __package__ is None:
         (sys
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""yaml_benchmark
+Compare PyYAML's pure-python loader/dumper with jldap.yamlio (libyaml, if
+PyYAML was built with it) on a profile directory and a full-size audit dump
+
+Example:
+    $ python tools/yaml_benchmark.py -p ./profiles -u 10000
+
+Attributes:
+	GROUPS (list): Group dns used for generated profiles and audits
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict, OrderedDict
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# pylint: disable=wrong-import-position
+from jldap import yamlio
+
+GROUPS = ['cn=group%s,ou=roles,ou=groups,dc=example,dc=com' % i
+          for i in range(200)]
+
+def timed(func, repeat):
+    ''' Best wall time of repeat calls to func
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def profile_texts(path, count):
+    ''' The yaml text of every profile in path, or count generated ones
+    '''
+    if path:
+        return [open(os.path.join(path, i)).read()
+                for i in sorted(os.listdir(path))
+                if i.endswith('.yaml')]
+    return [yaml.safe_dump({'owner': 'first.last',
+                            'samba-group-sid': 2000,
+                            'primary-gid-number': 10000,
+                            'posix-group': GROUPS[i % 50:i % 50 + 10],
+                            'group-of-unique-names': GROUPS[i % 90:i % 90 + 30],
+                            'samba-group-mapping': GROUPS[:2]},
+                           default_flow_style=False)
+            for i in range(count)]
+
+def audits(users, profiles):
+    ''' A juser audit result the size of a directory with users users
+    '''
+    retval = defaultdict(list)
+    for i in range(users):
+        retval['profile%s.yaml' % (i % profiles)].append(
+            OrderedDict([('user', 'user%s' % i),
+                         ('text', 'Extra permissions'),
+                         ('diff', GROUPS[i % 20:i % 20 + 5]),
+                         ('value', 2),
+                         ('owner', 'first.last')]))
+    return retval
+
+def main():
+    ''' Run the benchmark and print a table of results
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-p', '--profile_dir',
+                        help='Profiles to load. Default: generate --profiles')
+    parser.add_argument('-n', '--profiles', type=int, default=300,
+                        help='Number of profiles to generate. Default: 300')
+    parser.add_argument('-u', '--users', type=int, default=10000,
+                        help='Number of users in the audit dump. Default: 10000')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs per measurement (best is kept). Default: 3')
+    args = parser.parse_args()
+
+    texts = profile_texts(args.profile_dir, args.profiles)
+    # the old dumper can only write these as python objects, so it gets the
+    # plain-dict equivalent
+    data = audits(args.users, args.profiles)
+    plain = dict((i, [dict(j) for j in k]) for i, k in data.items())
+    results = [
+        ('load %s profiles' % len(texts),
+         timed(lambda: [yaml.load(i) for i in texts], args.repeat),
+         timed(lambda: [yamlio.load(i) for i in texts], args.repeat)),
+        ('dump audit of %s users' % args.users,
+         timed(lambda: yaml.dump(plain, default_flow_style=False), args.repeat),
+         timed(lambda: yamlio.dump(data), args.repeat))]
+    print 'libyaml: %s' % yamlio.LIBYAML
+    print '%-28s %10s %10s %8s' % ('', 'pyyaml', 'yamlio', 'speedup')
+    for name, before, after in results:
+        print '%-28s %9.3fs %9.3fs %7.1fx' % (name, before, after,
+                                              before / max(after, 1e-9))
+
+if __name__ == '__main__':
+    main()